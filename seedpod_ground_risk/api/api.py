@@ -16,67 +16,93 @@ def make_fatality_grid(aircraft, strike_grid, v_is):
     return res
 
 
-def make_strike_grid(aircraft, airspeed, altitude, failure_prob, pop_grid, resolution, wind_direction, wind_speed):
-    from seedpod_ground_risk.path_analysis.descent_models.ballistic_model import BallisticModel
-    from seedpod_ground_risk.path_analysis.descent_models.glide_model import GlideDescentModel
-    from seedpod_ground_risk.path_analysis.harm_models.strike_model import StrikeModel
-    from seedpod_ground_risk.layers.strike_risk_layer import wrap_all_pipeline, wrap_pipeline_cuda
-    from seedpod_ground_risk.path_analysis.utils import bearing_to_angle
-    import scipy.stats as ss
-    import os
-
-    bm = BallisticModel(aircraft)
-    gm = GlideDescentModel(aircraft)
-    raster_shape = pop_grid.shape
-    x, y = np.mgrid[0:raster_shape[0], 0:raster_shape[1]]
-    eval_grid = np.vstack((x.ravel(), y.ravel())).T
-    samples = 5000
-    # Conjure up our distributions for various things
-    alt = ss.norm(altitude, 5).rvs(samples)
-    vel = ss.norm(airspeed, 2.5).rvs(samples)
-    wind_vels = ss.norm(wind_speed, 1).rvs(samples)
-    wind_dirs = bearing_to_angle(ss.norm(wind_direction, np.deg2rad(5)).rvs(samples))
-    wind_vel_y = wind_vels * np.sin(wind_dirs)
-    wind_vel_x = wind_vels * np.cos(wind_dirs)
-    (bm_mean, bm_cov), v_ib, a_ib = bm.transform(alt, vel,
-                                                 ss.uniform(0, 360).rvs(samples),
-                                                 wind_vel_y, wind_vel_x,
-                                                 0, 0)
-    (gm_mean, gm_cov), v_ig, a_ig = gm.transform(alt, vel,
-                                                 ss.uniform(0, 360).rvs(samples),
-                                                 wind_vel_y, wind_vel_x,
-                                                 0, 0)
-    sm_b = StrikeModel(pop_grid, resolution ** 2, aircraft.width, a_ib)
-    sm_g = StrikeModel(pop_grid, resolution ** 2, aircraft.width, a_ig)
-    premult = sm_b.premult_mat + sm_g.premult_mat
-    offset_y, offset_x = raster_shape[0] // 2, raster_shape[1] // 2
-    bm_pdf = ss.multivariate_normal(bm_mean + np.array([offset_y, offset_x]), bm_cov).pdf(eval_grid)
-    gm_pdf = ss.multivariate_normal(gm_mean + np.array([offset_y, offset_x]), gm_cov).pdf(eval_grid)
-    pdf = bm_pdf + gm_pdf
-    pdf = pdf.reshape(raster_shape)
-    padded_pdf = np.zeros(((raster_shape[0] * 3) + 1, (raster_shape[1] * 3) + 1))
-    padded_pdf[raster_shape[0]:raster_shape[0] * 2, raster_shape[1]:raster_shape[1] * 2] = pdf
-    padded_pdf = padded_pdf * failure_prob
-    padded_centre_y, padded_centre_x = raster_shape[0] + offset_y, raster_shape[1] + offset_x
-
-    # Check if CUDA toolkit available through env var otherwise fallback to CPU bound numba version
-    if not os.getenv('CUDA_HOME'):
-        print('CUDA NOT found, falling back to Numba JITed CPU code')
-        # Leaving parallelisation to Numba seems to be faster
-        res = wrap_all_pipeline(raster_shape, padded_pdf, padded_centre_y, padded_centre_x, premult)
+def make_strike_grid(aircraft, airspeed, altitude, failure_prob, pop_grid, resolution, wind_direction, wind_speed,
+                     backend='fft', sigma_cutoff=5):
+    from seedpod_ground_risk.path_analysis.descent_models.descent_cache import make_impact_dists
+    from seedpod_ground_risk.path_analysis.utils import make_impact_kernel
+
+    dists, v_is, a_is = make_impact_dists(aircraft, altitude, airspeed, wind_speed, wind_direction)
+    pdf, pdf_centre = make_impact_kernel(dists, sigma_cutoff=sigma_cutoff)
+    res = _convolve_strike_grid(aircraft, pdf * failure_prob, pdf_centre, a_is, pop_grid, resolution, backend)
+    return res, v_is
+
+
+def make_tiled_risk_map(out_path, bounds, hour, resolution, aircraft, airspeed, altitude, failure_prob,
+                        wind_direction, wind_speed, fatality=False, tile_size=1024, sigma_cutoff=5):
+    """
+    Generate a strike or fatality risk map tile by tile and write it straight to a GeoTIFF.
+
+    The descent distributions are computed once and shared by all tiles. Each tile is generated with a halo of
+    population data as wide as the impact kernel radius, so the stitched map matches one generated in a single pass,
+    while memory use only depends on the tile size.
+
+    :param out_path: path of the GeoTIFF file to write
+    :param bounds: EPSG:4326 bounding polygon from `make_bounds_polygon`
+    :param tile_size: side length of a tile in raster cells, excluding the halo
+    :param fatality: flag to write the fatality risk map rather than the strike risk map
+    """
+    from seedpod_ground_risk.layers.temporal_population_estimate_layer import TemporalPopulationEstimateLayer
+    from seedpod_ground_risk.core.utils import make_bounds_polygon
+    from seedpod_ground_risk.path_analysis.descent_models.descent_cache import make_impact_dists
+    from seedpod_ground_risk.path_analysis.utils import make_impact_kernel
+    from rasterio.windows import Window
+    import rasterio
+    import pyproj
 
-    else:
+    proj = pyproj.Transformer.from_crs(pyproj.CRS.from_epsg('4326'),
+                                       pyproj.CRS.from_epsg('3857'),
+                                       always_xy=True)
+    width, height = reproj_bounds(bounds, proj, resolution)
+    min_lat, min_lon, max_lat, max_lon = bounds.bounds
+    lon_step = (max_lon - min_lon) / width
+    lat_step = (max_lat - min_lat) / height
+
+    dists, v_is, a_is = make_impact_dists(aircraft, altitude, airspeed, wind_speed, wind_direction)
+    pdf, pdf_centre = make_impact_kernel(dists, sigma_cutoff=sigma_cutoff)
+    pdf = pdf * failure_prob
+    halo_y = max(pdf_centre[0], pdf.shape[0] - 1 - pdf_centre[0])
+    halo_x = max(pdf_centre[1], pdf.shape[1] - 1 - pdf_centre[1])
+
+    layer = TemporalPopulationEstimateLayer('tpe')
+    layer.preload_data()
+
+    trans = rasterio.transform.from_bounds(min_lon, min_lat, max_lon, max_lat, width, height)
+    with rasterio.open(out_path, 'w', driver='GTiff', count=1, dtype=rasterio.float64,
+                       crs='EPSG:4326', transform=trans, compress='lzw',
+                       width=width, height=height, tiled=True, blockxsize=256, blockysize=256) as rds:
+        for row in range(0, height, tile_size):
+            for col in range(0, width, tile_size):
+                tile_height = min(tile_size, height - row)
+                tile_width = min(tile_size, width - col)
+                # Clip halo to the map bounds, as nothing outside of them is included in a single pass map either
+                halo_row = max(row - halo_y, 0)
+                halo_col = max(col - halo_x, 0)
+                halo_height = min(row + tile_height + halo_y, height) - halo_row
+                halo_width = min(col + tile_width + halo_x, width) - halo_col
+
+                # Rows are counted from the top (north) edge
+                tile_bounds = make_bounds_polygon((min_lon + halo_col * lon_step,
+                                                   min_lon + (halo_col + halo_width) * lon_step),
+                                                  (max_lat - (halo_row + halo_height) * lat_step,
+                                                   max_lat - halo_row * lat_step))
+                _, pop_grid, _ = layer.generate(tile_bounds, (halo_width, halo_height), hour=hour,
+                                                resolution=resolution)
+                pop_grid = np.flipud(remove_raster_nans(pop_grid))
+
+                res = _convolve_strike_grid(aircraft, pdf, pdf_centre, a_is, pop_grid, resolution, 'fft')
+                res = res[row - halo_row:row - halo_row + tile_height, col - halo_col:col - halo_col + tile_width]
+                if fatality:
+                    res = make_fatality_grid(aircraft, res, v_is)
+                rds.write(res, 1, window=Window(col, row, tile_width, tile_height))
+
+
+def _convolve_strike_grid(aircraft, pdf, pdf_centre, a_is, pop_grid, resolution, backend):
+    from seedpod_ground_risk.path_analysis.harm_models.strike_model import StrikeModel
+    from seedpod_ground_risk.layers.strike_risk_layer import convolve_strike_pdf
 
-        res = np.zeros(raster_shape, dtype=float)
-        threads_per_block = (32, 32)  # 1024 max per block
-        blocks_per_grid = (
-            int(np.ceil(raster_shape[1] / threads_per_block[1])),
-            int(np.ceil(raster_shape[0] / threads_per_block[0]))
-        )
-        print('CUDA found, using config <<<' + str(blocks_per_grid) + ',' + str(threads_per_block) + '>>>')
-        wrap_pipeline_cuda[blocks_per_grid, threads_per_block](raster_shape, padded_pdf, padded_centre_y,
-                                                               padded_centre_x, premult, res)
-    return res, (v_ib, v_ig)
+    premult = np.sum([StrikeModel(pop_grid, resolution ** 2, aircraft.width, a_i).premult_mat for a_i in a_is],
+                     axis=0)
+    return convolve_strike_pdf(pdf, pdf_centre, premult, backend=backend)
 
 
 def make_pop_grid(bounds, hour, resolution):
@@ -137,6 +163,9 @@ def make_path(cost_grid, bounds_poly, start_latlon, end_latlon, algo='rt*', path
     if algo == 'ra*2':
         from seedpod_ground_risk.pathfinding.a_star import RiskGridAStar
         algo = RiskGridAStar()
+    elif algo == 'ara*':
+        from seedpod_ground_risk.pathfinding.array_a_star import ArrayRiskGridAStar
+        algo = ArrayRiskGridAStar()
     elif algo == 'ra*':
         from seedpod_ground_risk.pathfinding.a_star import RiskAStar
         algo = RiskAStar()
@@ -5,8 +5,12 @@ from seedpod_ground_risk.core.utils import make_bounds_polygon
 
 
 @click.group()
-def main():
-    pass
+@click.option('--osm-extract', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Local OSM extract (PBF, GeoPackage or GeoJSON) to read polygons from instead of the Overpass API')
+def main(osm_extract):
+    if osm_extract:
+        from seedpod_ground_risk.layers.osm_providers import OSMExtractPolygonProvider, set_polygon_provider
+        set_polygon_provider(OSMExtractPolygonProvider(osm_extract))
 
 
 ###############################
@@ -71,8 +75,10 @@ map.add_command(pop_density)
 @click.option('--wind-direction', default=90, type=click.INT,
               help='The wind bearing. This is the direction the wind is coming from.')
 @click.option('--wind_speed', default=5, type=click.FLOAT, help='Wind speed at the flight altitude in m/s')
+@click.option('--tile-size', default=None, type=click.INT,
+              help='Generate the map in square tiles of this many pixels to limit memory use over large areas')
 def strike(min_lat, max_lat, min_lon, max_lon, aircraft, failure_prob, output_path, resolution, hour, altitude,
-           airspeed, wind_direction, wind_speed):
+           airspeed, wind_direction, wind_speed, tile_size):
     """
     Strike Risk map
 
@@ -85,17 +91,23 @@ def strike(min_lat, max_lat, min_lon, max_lon, aircraft, failure_prob, output_pa
 
     """
     bounds = make_bounds_polygon((min_lon, max_lon), (min_lat, max_lat))
-    pop_grid = make_pop_grid(bounds, hour, resolution)
 
     if not aircraft:
         aircraft = _setup_default_aircraft()
     else:
         aircraft = _import_aircraft(aircraft)
 
+    out_name = f'strike_{hour}h.tif'
+    if tile_size:
+        import os
+        make_tiled_risk_map(os.path.join(output_path, out_name), bounds, hour, resolution, aircraft, airspeed,
+                            altitude, failure_prob, wind_direction, wind_speed, tile_size=tile_size)
+        return
+
+    pop_grid = make_pop_grid(bounds, hour, resolution)
     res, _ = make_strike_grid(aircraft, airspeed, altitude, failure_prob, pop_grid, resolution,
                               wind_direction, wind_speed)
 
-    out_name = f'strike_{hour}h.tif'
     _write_geotiff(max_lat, max_lon, min_lat, min_lon, out_name, output_path, res)
 
 
@@ -121,8 +133,10 @@ map.add_command(strike)
 @click.option('--wind-direction', default=90, type=click.INT,
               help='The wind bearing. This is the direction the wind is coming from.')
 @click.option('--wind_speed', default=5, type=click.FLOAT, help='Wind speed at the flight altitude in m/s')
+@click.option('--tile-size', default=None, type=click.INT,
+              help='Generate the map in square tiles of this many pixels to limit memory use over large areas')
 def fatality(min_lat, max_lat, min_lon, max_lon, aircraft, failure_prob, output_path, resolution, hour, altitude,
-             airspeed, wind_direction, wind_speed):
+             airspeed, wind_direction, wind_speed, tile_size):
     """
     Fatality Risk map
 
@@ -135,20 +149,25 @@ def fatality(min_lat, max_lat, min_lon, max_lon, aircraft, failure_prob, output_
 
     """
     bounds = make_bounds_polygon((min_lon, max_lon), (min_lat, max_lat))
-    pop_grid = make_pop_grid(bounds, hour, resolution)
 
     if not aircraft:
         aircraft = _setup_default_aircraft()
     else:
         aircraft = _import_aircraft(aircraft)
 
+    out_name = f'fatality_{hour}h.tif'
+    if tile_size:
+        import os
+        make_tiled_risk_map(os.path.join(output_path, out_name), bounds, hour, resolution, aircraft, airspeed,
+                            altitude, failure_prob, wind_direction, wind_speed, fatality=True, tile_size=tile_size)
+        return
+
+    pop_grid = make_pop_grid(bounds, hour, resolution)
     strike_grid, v_is = make_strike_grid(aircraft, airspeed, altitude, failure_prob, pop_grid, resolution,
                                          wind_direction, wind_speed)
 
     res = make_fatality_grid(aircraft, strike_grid, v_is)
 
-    out_name = f'fatality_{hour}h.tif'
-
     _write_geotiff(max_lat, max_lon, min_lat, min_lon, out_name, output_path, res)
 
 
@@ -0,0 +1,88 @@
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.thread import ThreadPoolExecutor
+from typing import Callable
+
+
+class JobCancelled(Exception):
+    """
+    Raised within a job that has been superseded by a newer one
+    """
+    pass
+
+
+class LatestJobExecutor:
+    """
+    Runs jobs one at a time in a background thread, only ever computing the most recently submitted job.
+
+    Each job is identified by a generation token. Submitting a job supersedes all jobs submitted before it: jobs yet to
+    start are dropped, and running jobs are aborted the next time they `check` their token, so long running jobs
+    should check between each stage of their work. Jobs only start once no newer job has been submitted for `debounce`
+    seconds, so only the last of a burst of submissions, such as while panning the map, is run.
+    """
+
+    def __init__(self, debounce: float = 0.3) -> None:
+        """
+        :param debounce: time in seconds to wait for newer submissions before starting a job
+        """
+        self.debounce = debounce
+        self._generation = 0
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, fn: Callable[..., None], *args, **kwargs) -> Future:
+        """
+        Submit a job, superseding any submitted before it.
+        :param fn: callable run with the job's token as its first argument followed by `args` and `kwargs`. Raising
+         `JobCancelled` ends the job silently
+        :return: future of the job, resolving to None if the job was superseded
+        """
+        with self._cond:
+            self._generation += 1
+            token = self._generation
+            # Wake jobs waiting out the debounce, so superseded jobs are dropped straight away
+            self._cond.notify_all()
+        return self._executor.submit(self._run, token, time.monotonic(), fn, args, kwargs)
+
+    def is_current(self, token: int) -> bool:
+        """
+        Return whether a job is the most recently submitted
+        """
+        with self._cond:
+            return token == self._generation
+
+    def check(self, token: int) -> None:
+        """
+        Raise `JobCancelled` if a job has been superseded
+        """
+        if not self.is_current(token):
+            raise JobCancelled(f'Job {token} superseded')
+
+    def cancel(self) -> None:
+        """
+        Supersede all submitted jobs without submitting a new one
+        """
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def shutdown(self) -> None:
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _run(self, token: int, submitted: float, fn: Callable[..., None], args, kwargs):
+        with self._cond:
+            deadline = submitted + self.debounce
+            # Wait out the remainder of the debounce, unless superseded in the meantime
+            while token == self._generation:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if token != self._generation:
+                return None
+        try:
+            return fn(token, *args, **kwargs)
+        except JobCancelled:
+            return None
@@ -0,0 +1,165 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, FrozenSet, Hashable, Iterable, Optional, Set, Tuple, Union
+
+import geopandas as gpd
+import numpy as np
+import shapely.geometry as sg
+
+from seedpod_ground_risk.layers.data_layer import DataLayer
+
+# Layers preloaded in a worker process by cache key, so dynamic caches such as interpolated roads are kept between
+# tasks. Only populated in worker processes
+_worker_layers: Dict[Hashable, DataLayer] = {}
+
+
+def _init_worker(layers: Iterable[DataLayer], polygon_provider) -> None:
+    from seedpod_ground_risk.layers.osm_providers import set_polygon_provider
+
+    set_polygon_provider(polygon_provider)
+    for layer in layers:
+        _get_worker_layer(layer)
+
+
+def _get_worker_layer(layer: DataLayer) -> DataLayer:
+    key = layer.cache_key
+    worker_layer = _worker_layers.get(key)
+    if worker_layer is None:
+        # Static data is loaded from this process's registry, so is shared by all layers in the worker
+        layer.preload_data()
+        worker_layer = _worker_layers[key] = layer
+    return worker_layer
+
+
+def _generate_layer(layer: DataLayer, bounds_poly: sg.Polygon, raster_shape: Tuple[int, int], hour: int,
+                    resolution: float, shm_name: str, evicted_keys: FrozenSet[Hashable] = frozenset()) \
+        -> Tuple[Union[bool, np.ndarray, None], gpd.GeoDataFrame]:
+    from multiprocessing import shared_memory
+
+    for key in evicted_keys:
+        _worker_layers.pop(key, None)
+    _, raster, raw_data = _get_worker_layer(layer).generate(bounds_poly, raster_shape, from_cache=False, hour=hour,
+                                                            resolution=resolution)
+    if raster is None or raster.shape != (raster_shape[1], raster_shape[0]):
+        # Rasters not of the expected shape are returned by pickling instead
+        return raster, raw_data
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        np.ndarray(raster.shape, dtype=np.float64, buffer=shm.buf)[...] = raster
+    finally:
+        shm.close()
+    return True, raw_data
+
+
+class LayerProcessPool:
+    """
+    Pool of worker processes generating data layers, so independent layers are generated in parallel without
+    contending for the GIL.
+
+    Each worker preloads the layers it is given from its own static data registry, and keeps them between tasks.
+    Layers are sent to workers without their static data. Raster grids are returned through shared memory allocated by
+    the calling process, rather than pickled.
+
+    Layers no longer used can be evicted from the workers by their cache key. As tasks cannot be sent to a particular
+    worker, each worker drops evicted layers the next time it generates a layer.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        """
+        :param max_workers: number of worker processes. Defaults to the number of CPUs
+        """
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._loaded_keys: Set[Hashable] = set()  # Cache keys of layers sent to the workers
+        self._evicted_keys: Set[Hashable] = set()  # Cache keys of layers to drop from the workers
+
+    def start(self, layers: Iterable[DataLayer]) -> ProcessPoolExecutor:
+        """
+        Start the worker processes if not already running, preloading layers in each
+        :param layers: layers to preload
+        :return: the executor of the running workers
+        """
+        from seedpod_ground_risk.layers.osm_providers import get_polygon_provider
+
+        layers = list(layers)
+        with self._lock:
+            for layer in layers:
+                self._loaded_keys.add(layer.cache_key)
+                self._evicted_keys.discard(layer.cache_key)
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                                     initargs=(layers, get_polygon_provider()))
+            return self._executor
+
+    def generate_layer(self, layer: DataLayer, bounds_poly: sg.Polygon, raster_shape: Tuple[int, int], hour: int,
+                       resolution: float) -> Tuple[None, Optional[np.ndarray], gpd.GeoDataFrame]:
+        """
+        Generate a layer in a worker process. Takes the same arguments as `DataLayer.generate`.
+
+        If a worker process dies, such as by running out of memory, the workers are restarted and the layer is
+        generated once more before raising `BrokenProcessPool`. Later generations start new workers either way.
+        :return: tuple of None in place of the plot of the layer, which is not sent between processes, the raster grid
+         and the GeoDataFrame of the layer
+        """
+        try:
+            return self._generate_layer(layer, bounds_poly, raster_shape, hour, resolution)
+        except BrokenProcessPool:
+            return self._generate_layer(layer, bounds_poly, raster_shape, hour, resolution)
+
+    def _generate_layer(self, layer: DataLayer, bounds_poly: sg.Polygon, raster_shape: Tuple[int, int], hour: int,
+                        resolution: float) -> Tuple[None, Optional[np.ndarray], gpd.GeoDataFrame]:
+        from multiprocessing import shared_memory
+
+        executor = self.start([layer])
+        with self._lock:
+            evicted_keys = frozenset(self._evicted_keys)
+        # Allocated here, so it outlives the worker's handle to it on platforms freeing it once no handles are open
+        shape = (raster_shape[1], raster_shape[0])
+        shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+        try:
+            raster, raw_data = executor.submit(_generate_layer, layer, bounds_poly, raster_shape, hour,
+                                                resolution, shm.name, evicted_keys).result()
+            if raster is True:
+                raster = np.ndarray(shape, dtype=np.float64, buffer=shm.buf).copy()
+        except BrokenProcessPool:
+            # Broken pools fail every task, so replace it unless another generation already has
+            self._discard(executor)
+            raise
+        finally:
+            shm.close()
+            shm.unlink()
+        return None, raster, raw_data
+
+    def evict(self, cache_key: Hashable) -> bool:
+        """
+        Drop a layer from the workers, freeing its static data and caches once they next generate a layer
+        :param cache_key: cache key of the layer to drop
+        :return: whether the layer had been sent to the workers
+        """
+        with self._lock:
+            if cache_key not in self._loaded_keys:
+                return False
+            self._loaded_keys.discard(cache_key)
+            self._evicted_keys.add(cache_key)
+            return True
+
+    def reset(self) -> None:
+        """
+        Stop the worker processes, freeing the layers preloaded in them. Workers are started again on the next
+        generation.
+        """
+        with self._lock:
+            executor = self._executor
+        if executor is not None:
+            self._discard(executor)
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self._loaded_keys.clear()
+            self._evicted_keys.clear()
+        executor.shutdown(wait=False)
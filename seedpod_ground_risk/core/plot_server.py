@@ -1,3 +1,4 @@
+import threading
 from typing import Dict, Union, Tuple, Iterable, Callable, NoReturn, Optional, List, Sequence
 
 import geopandas as gpd
@@ -7,6 +8,9 @@ import shapely.geometry as sg
 from holoviews import Overlay, Element
 from holoviews.element import Geometry
 
+from seedpod_ground_risk.core.jobs import LatestJobExecutor, JobCancelled
+from seedpod_ground_risk.core.layer_pool import LayerProcessPool
+from seedpod_ground_risk.core.tile_cache import RasterTileCache
 from seedpod_ground_risk.core.utils import make_bounds_polygon, remove_raster_nans, reproj_bounds
 from seedpod_ground_risk.layers.annotation_layer import AnnotationLayer
 from seedpod_ground_risk.layers.data_layer import DataLayer
@@ -26,6 +30,16 @@ class PlotServer:
                  active_tools: Optional[Iterable[str]] = None,
                  cmap: str = 'CET_L18',
                  raster_resolution: float = 40,
+                 tile_size: int = 128,
+                 tile_halo: int = 32,
+                 max_tiles: int = 1024,
+                 max_raster_pixels: int = 700000,
+                 max_lod_level: int = 3,
+                 progressive: bool = False,
+                 preview_levels: int = 2,
+                 debounce: float = 0.3,
+                 use_process_pool: bool = False,
+                 max_layer_processes: Optional[int] = None,
                  plot_size: Tuple[int, int] = (760, 735),
                  progress_callback: Optional[Callable[[str], None]] = None,
                  update_callback: Optional[Callable[[str], None]] = None,
@@ -38,6 +52,23 @@ class PlotServer:
         :param List[str] active_tools: the subset of `tools` that should be enabled by default
         :param cmap: a colorcet attribute string for the colourmap to use from https://colorcet.holoviz.org/user_guide/Continuous.html
         :param raster_resolution: resolution of a single square of the raster pixel grid in metres
+        :param tile_size: side length in pixels of the tiles generated layers are cached in
+        :param tile_halo: width in pixels of the margin generated around tiles, so effects crossing tile edges such as
+         the spread of impact locations are included
+        :param max_tiles: maximum number of tiles to cache
+        :param max_raster_pixels: maximum number of raster pixels to generate for the visible area. When zoomed out past
+         this the resolution is halved until the area fits, up to `max_lod_level` times. Areas too large even then are
+         not generated, showing the last generated layers instead
+        :param max_lod_level: number of times the raster resolution can be halved when zoomed out, so the coarsest
+         resolution is `raster_resolution * 2 ** max_lod_level` metres
+        :param progressive: whether to first show a coarse preview of the map, then update the plot in place with the
+         refined layers and annotations as they complete
+        :param preview_levels: number of levels of detail coarser than the refined map the preview is generated at
+        :param debounce: time in seconds to wait for further plot requests before generating, so only the last of a
+         burst of requests is generated
+        :param use_process_pool: whether to generate data layers in worker processes rather than threads, so independent
+         layers are generated in parallel
+        :param max_layer_processes: number of worker processes if `use_process_pool`. Defaults to the number of CPUs
         :param Tuple[int, int] plot_size: the plot size in (width, height) order
         :param progress_callback: an optional callable that takes a string updating progress
         :param update_callback: an optional callable that is called before an plot is rendered
@@ -73,6 +104,19 @@ class PlotServer:
         self._x_range, self._y_range = [-1.45, -1.35], [50.85, 50.95]
 
         self.raster_resolution_m = raster_resolution
+        # Generated rasters are cached in tiles on a fixed grid, so areas already generated are never generated again
+        self._tile_cache = RasterTileCache(base_resolution=raster_resolution, tile_size=tile_size, max_tiles=max_tiles)
+        self.tile_halo = tile_halo
+        self.max_raster_pixels = max_raster_pixels
+        self.max_lod_level = max_lod_level
+        self.progressive = progressive
+        self.preview_levels = preview_levels
+        self._generated_bounds = None
+        # Held while swapping generated layers, so they are always read together with their bounds
+        self._generated_lock = threading.Lock()
+        # Plots are generated in the background, abandoning plots of viewports that are no longer current
+        self._jobs = LatestJobExecutor(debounce=debounce)
+        self._layer_pool = LayerProcessPool(max_layer_processes) if use_process_pool else None
 
         self._epsg4326_to_epsg3857_proj = None
         self._epsg3857_to_epsg4326_proj = None
@@ -97,6 +141,10 @@ class PlotServer:
         with ThreadPoolExecutor() as pool:
             await multi([pool.submit(layer.preload_data) for layer in chain(self.data_layers, self.annotation_layers)])
             self._preload_complete = True
+            if self._layer_pool is not None:
+                # Workers preload the layers too, from the caches built while preloading here
+                self._progress_callback('Starting layer worker processes')
+                self._layer_pool.start(self.data_layers)
             self._progress_callback('Preload complete. First generation will take a minute longer')
             self._progress_bar_callback(0)
 
@@ -118,6 +166,9 @@ class PlotServer:
         Stop the plot server if running
         """
         assert self.server is not None
+        self._jobs.shutdown()
+        if self._layer_pool is not None:
+            self._layer_pool.reset()
         if self._server_thread is not None:
             if self._server_thread.is_alive():
                 self._server_thread.join()
@@ -136,16 +187,24 @@ class PlotServer:
                                                                                        self._y_range[1])
 
     def plot(self, doc):
-        import holoviews as hv
-
         if doc.roots:
-            doc.clear()
             self._reproject_ranges()
             self._progress_callback(10)
-        hvPlot = self.compose_overlay_plot(self._x_range, self._y_range)
-        if self._preload_complete:
-            self._progress_bar_callback(100)
-            self._progress_callback("Plotting complete")
+        if not self._preload_complete:
+            self._jobs.cancel()
+            self._show_plot(doc, self._render_plot(self.compose_overlay_plot(self._x_range, self._y_range)))
+            return
+        if not doc.roots:
+            # Show the map tiles until the first plot is generated
+            self._show_plot(doc, self._render_plot(self._apply_plot_opts(self._base_tiles)))
+        self._jobs.submit(self._generate_plot, doc, list(self._x_range), list(self._y_range))
+
+    def _render_plot(self, hvPlot: Union[Overlay, Element]):
+        """
+        Render a HoloViews plot to a Bokeh figure tracking the plotted ranges
+        """
+        import holoviews as hv
+
         fig = hv.render(hvPlot, backend='bokeh')
         fig.output_backend = 'webgl'
 
@@ -163,15 +222,141 @@ class PlotServer:
         fig.x_range.on_change('end', lambda attr, old, new: update_range("x1", new))
         fig.y_range.on_change('start', lambda attr, old, new: update_range("y0", new))
         fig.y_range.on_change('end', lambda attr, old, new: update_range("y1", new))
+        return fig
 
+    def _show_plot(self, doc, fig) -> NoReturn:
+        doc.clear()
         doc.add_root(fig)
         self._current_plot = doc
 
+    def _schedule_update(self, doc, token: int, fn: Callable, *args) -> NoReturn:
+        """
+        Schedule an update of a document on the Bokeh event loop, which is skipped if the job is no longer current by the
+        time it runs
+        """
+
+        def update():
+            if self._jobs.is_current(token):
+                fn(*args)
+
+        doc.add_next_tick_callback(update)
+
+    def _generate_plot(self, token: int, doc, x_range: Sequence[float], y_range: Sequence[float]) -> NoReturn:
+        """
+        Generate and show the plot of a viewport. Runs as a background job, so is abandoned between stages when the
+        viewport changes.
+
+        :param token: generation token of the job
+        :param doc: the Bokeh document to plot in
+        :param tuple x_range: (min, max) longitude range in EPSG:4326 coordinates
+        :param tuple y_range: (min, max) latitude range in EPSG:4326 coordinates
+        """
+        hvPlot = self.compose_overlay_plot(x_range, y_range, preview=self.progressive, token=token)
+        self._jobs.check(token)
+        try:
+            fig = self._render_plot(hvPlot)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self._progress_callback(f'Rendering failed with the following error: {e}')
+            return
+        self._schedule_update(doc, token, self._show_plot, doc, fig)
+        if self.progressive:
+            self._refine_plot(token, doc, fig, x_range, y_range)
+        else:
+            self._progress_bar_callback(100)
+            if self._select_lod_level(make_bounds_polygon(x_range, y_range)) is not None:
+                self._progress_callback("Plotting complete")
+
+    def _refine_plot(self, token: int, doc, fig, x_range: Sequence[float], y_range: Sequence[float]) -> NoReturn:
+        """
+        Generate the refined layers and annotations of a previewed plot, updating the plot in place as each completes.
+        Runs outside of the Bokeh event loop, so the preview stays interactive.
+
+        :param token: generation token of the job
+        :param doc: the Bokeh document of the plot
+        :param fig: the Bokeh figure rendered from the preview
+        :param tuple x_range: (min, max) longitude range in EPSG:4326 coordinates
+        :param tuple y_range: (min, max) latitude range in EPSG:4326 coordinates
+        """
+        try:
+            bounds_poly = make_bounds_polygon(x_range, y_range)
+            level = self._select_lod_level(bounds_poly)
+            if level is None:
+                # Too large an area to generate, so the preview shows the last generated layers instead
+                return
+            if level < self._preview_level(level):
+                self._progress_callback('Refining map')
+                self.generate_layers(bounds_poly, level, token=token)
+                generated, generated_bounds = self._get_generated_layers()
+                self._schedule_update(doc, token, self._update_figure_raster, fig, generated,
+                                      self._to_epsg3857_bounds(generated_bounds))
+            self._progress_bar_callback(50)
+            if self.annotation_layers:
+                generated, generated_bounds = self._get_generated_layers()
+                annotations = self._annotate(generated, generated_bounds, token=token)
+                if annotations:
+                    self._schedule_update(doc, token, self._add_figure_overlays, fig, Overlay(annotations))
+            self._progress_bar_callback(100)
+            self._progress_callback("Plotting complete")
+        except JobCancelled:
+            raise
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            self._progress_callback(f'Refining failed with the following error: {e}. The preview is still shown')
+
+    @staticmethod
+    def _update_figure_raster(fig, generated: Dict[str, Tuple[Geometry, np.ndarray, gpd.GeoDataFrame]],
+                              generated_bounds: Tuple[float, float, float, float]) -> NoReturn:
+        """
+        Replace the raster of the top data layer in a rendered figure, without re-rendering the rest of it.
+        :param fig: the Bokeh figure to update
+        :param generated: the generated data layers
+        :param generated_bounds: (min_x, min_y, max_x, max_y) bounds of the generated rasters in EPSG:3857 coordinates
+        """
+        from bokeh.models import GlyphRenderer, Image
+
+        renderers = [r for r in fig.renderers if isinstance(r, GlyphRenderer) and isinstance(r.glyph, Image)]
+        if not renderers or not generated:
+            return
+        raster = generated[list(generated)[0]][1]
+        # Bokeh draws the first row of images at the bottom
+        image = np.flipud(raster)
+        min_x, min_y, max_x, max_y = generated_bounds
+        renderer = renderers[0]
+        renderer.data_source.data = dict(image=[image], x=[min_x], y=[min_y], dw=[max_x - min_x], dh=[max_y - min_y])
+        color_mapper = getattr(renderer.glyph, 'color_mapper', None)
+        low, high = float(np.nanmin(image)), float(np.nanmax(image))
+        if color_mapper is not None and high > low:
+            color_mapper.update(low=low, high=high)
+
+    @staticmethod
+    def _add_figure_overlays(fig, overlay: Overlay) -> NoReturn:
+        """
+        Add the glyphs and hover tools of an overlay to a rendered figure, without re-rendering the rest of it
+        :param fig: the Bokeh figure to update
+        :param overlay: the overlay to add
+        """
+        import holoviews as hv
+        from bokeh.models import GlyphRenderer, HoverTool
+
+        overlay_fig = hv.render(overlay, backend='bokeh')
+        renderers = [r for r in overlay_fig.renderers if isinstance(r, GlyphRenderer)]
+        hover_tools = [t for t in overlay_fig.tools if isinstance(t, HoverTool)]
+        # Detach the models from the throwaway figure before adding them to the plotted one
+        overlay_fig.renderers = []
+        overlay_fig.tools = []
+        fig.renderers = fig.renderers + renderers
+        if hover_tools:
+            fig.add_tools(*hover_tools)
+
     def generate_map(self):
         self._current_plot.add_next_tick_callback(lambda *args: self.plot(self._current_plot))
 
     def compose_overlay_plot(self, x_range: Optional[Sequence[float]] = (-1.6, -1.2),
-                             y_range: Optional[Sequence[float]] = (50.8, 51.05)) \
+                             y_range: Optional[Sequence[float]] = (50.8, 51.05), preview: bool = False,
+                             token: Optional[int] = None) \
             -> Union[Overlay, Element]:
         """
         Compose all generated HoloViews layers in self.data_layers into a single overlay plot.
@@ -181,6 +366,10 @@ class PlotServer:
 
         :param tuple x_range: (min, max) longitude range in EPSG:4326 coordinates
         :param tuple y_range: (min, max) latitude range in EPSG:4326 coordinates
+        :param preview: whether to generate a coarse preview, `preview_levels` levels of detail coarser than the full
+         plot, without annotations
+        :param token: generation token of the job composing the plot, if any. Raises `JobCancelled` between stages once
+         the job is superseded
         :returns: overlay plot of stored layers
         """
         try:
@@ -191,66 +380,43 @@ class PlotServer:
             else:
                 # Construct box around requested bounds
                 bounds_poly = make_bounds_polygon(x_range, y_range)
-                raster_shape = self._get_raster_dimensions(bounds_poly, self.raster_resolution_m)
-                # Ensure bounds are small enough to render without OOM or heat death of universe
-                if (raster_shape[0] * raster_shape[1]) < 7e5:
-                    from time import time
-
-                    t0 = time()
-                    self._progress_bar_callback(10)
-                    # TODO: This will give multiple data layers, these need to be able to fed into their relevent pathfinding layers
-                    for annlayer in self.annotation_layers:
-                        new_layer = FatalityRiskLayer('Fatality Risk', ac=annlayer.aircraft['name'])
-                        self.add_layer(new_layer)
-                    self.remove_duplicate_layers()
-                    self._progress_bar_callback(20)
-                    self.generate_layers(bounds_poly, raster_shape)
-                    self._progress_bar_callback(50)
-                    plt_lyr = list(self._generated_data_layers)[0]
-                    plot = Overlay([self._generated_data_layers[plt_lyr][0]])
-                    print("Generated all layers in ", time() - t0)
-                    if self.annotation_layers:
-                        plot = Overlay([self._generated_data_layers[plt_lyr][0]])
-                        res = []
-                        prog_bar = 50
-                        for dlayer in self.data_layers:
-                            raster_indices = dict(Longitude=np.linspace(x_range[0], x_range[1], num=raster_shape[0]),
-                                                  Latitude=np.linspace(y_range[0], y_range[1], num=raster_shape[1]))
-                            raw_data = [self._generated_data_layers[dlayer.key][2]]
-                            raster_grid = np.sum(
-                                [remove_raster_nans(self._generated_data_layers[dlayer.key][1])],
-                                axis=0)
-                            raster_grid = np.flipud(raster_grid)
-                            raster_indices['Latitude'] = np.flip(raster_indices['Latitude'])
-
-                            for alayer in self.annotation_layers:
-                                if alayer.aircraft == dlayer.ac_dict:
-                                    self._progress_bar_callback(prog_bar)
-                                    prog_bar += 40 / len(self.annotation_layers)
-                                    self._progress_callback(f'Finding a path for {alayer.aircraft["name"]}')
-                                    res.append(alayer.annotate(raw_data, (raster_indices, raster_grid)))
-
-                        self._progress_callback('Plotting paths')
-                        self._progress_bar_callback(90)
-                        # res = jl.Parallel(n_jobs=1, verbose=1, backend='threading')(
-                        #     jl.delayed(layer.annotate)(raw_datas, (raster_indices, raster_grid)) for layer in
-                        #     self.annotation_layers )
-                        plot = Overlay(
-                            [self._base_tiles, plot, *[annot for annot in res if annot is not None]]).collate()
-                    else:
-                        plot = Overlay([self._base_tiles, plot]).collate()
+                # Coarsen the resolution when zoomed out, so large areas render without OOM or heat death of universe
+                level = self._select_lod_level(bounds_poly)
+                if level is None:
+                    return self._apply_plot_opts(self._last_generated_plot())
+                if preview:
+                    level = self._preview_level(level)
+                from time import time
+
+                t0 = time()
+                self._progress_bar_callback(10)
+                # TODO: This will give multiple data layers, these need to be able to fed into their relevent pathfinding layers
+                for annlayer in self.annotation_layers:
+                    new_layer = FatalityRiskLayer('Fatality Risk', ac=annlayer.aircraft['name'])
+                    self.add_layer(new_layer)
+                self.remove_duplicate_layers()
+                self._progress_bar_callback(20)
+                self.generate_layers(bounds_poly, level, token=token)
+                self._check_job(token)
+                self._progress_bar_callback(50)
+                generated, generated_bounds = self._get_generated_layers()
+                plt_lyr = list(generated)[0]
+                plot = Overlay([generated[plt_lyr][0]])
+                print("Generated all layers in ", time() - t0)
+                if self.annotation_layers and not preview:
+                    res = self._annotate(generated, generated_bounds, token=token)
+                    self._progress_callback('Plotting paths')
                     self._progress_bar_callback(90)
-
+                    plot = Overlay([self._base_tiles, plot, *res]).collate()
                 else:
-                    self._progress_callback('Area too large to render!')
-                    if not self._generated_data_layers:
-                        plot = self._base_tiles
-                    else:
-                        plot = Overlay([self._base_tiles, *list(self._generated_data_layers.values())])
+                    plot = Overlay([self._base_tiles, plot]).collate()
+                self._progress_bar_callback(90)
 
             self._update_layer_list()
             self._progress_callback("Rendering new map...")
 
+        except JobCancelled:
+            raise
         except Exception as e:
             # Catch-all to prevent plot blanking out and/or crashing app
             # Just display map tiles in case this was transient
@@ -261,9 +427,72 @@ class PlotServer:
             print(e)
             plot = self._base_tiles
 
+        return self._apply_plot_opts(plot)
+
+    def _apply_plot_opts(self, plot: Union[Overlay, Element]) -> Union[Overlay, Element]:
         return plot.opts(width=self.plot_size[0], height=self.plot_size[1],
                          tools=self.tools, active_tools=self.active_tools)
 
+    def _annotate(self, generated: Dict[str, Tuple[Geometry, np.ndarray, gpd.GeoDataFrame]],
+                  generated_bounds: sg.Polygon, token: Optional[int] = None) -> List[Overlay]:
+        """
+        Annotate generated data layers with the annotation layers of the same aircraft
+        :param generated: the generated data layers
+        :param generated_bounds: the bounding polygon of the generated rasters in EPSG:4326 coordinates
+        :param token: generation token of the job annotating, if any
+        :return: list of the annotations
+        """
+        res = []
+        prog_bar = 50
+        bounds = generated_bounds.bounds
+        for dlayer in self.data_layers:
+            if dlayer.key not in generated:
+                continue
+            generated_shape = generated[dlayer.key][1].shape
+            raster_indices = dict(Longitude=np.linspace(bounds[1], bounds[3], num=generated_shape[1]),
+                                  Latitude=np.linspace(bounds[0], bounds[2], num=generated_shape[0]))
+            raw_data = [generated[dlayer.key][2]]
+            raster_grid = np.sum([remove_raster_nans(generated[dlayer.key][1])], axis=0)
+            raster_grid = np.flipud(raster_grid)
+            raster_indices['Latitude'] = np.flip(raster_indices['Latitude'])
+
+            for alayer in self.annotation_layers:
+                if alayer.aircraft == dlayer.ac_dict:
+                    self._check_job(token)
+                    self._progress_bar_callback(prog_bar)
+                    prog_bar += 40 / len(self.annotation_layers)
+                    self._progress_callback(f'Finding a path for {alayer.aircraft["name"]}')
+                    res.append(alayer.annotate(raw_data, (raster_indices, raster_grid)))
+        # res = jl.Parallel(n_jobs=1, verbose=1, backend='threading')(
+        #     jl.delayed(layer.annotate)(raw_datas, (raster_indices, raster_grid)) for layer in
+        #     self.annotation_layers )
+        return [annot for annot in res if annot is not None]
+
+    def _check_job(self, token: Optional[int]) -> NoReturn:
+        if token is not None:
+            self._jobs.check(token)
+
+    def _last_generated_plot(self) -> Union[Overlay, Element]:
+        """
+        Return the map tiles overlaid with the last generated data layer, shown when the requested area is too large to
+        generate
+        """
+        self._progress_callback('Area too large to render! Zoom in to generate the map')
+        generated, _ = self._get_generated_layers()
+        if not generated:
+            return self._base_tiles
+        return Overlay([self._base_tiles, generated[list(generated)[0]][0]]).collate()
+
+    def _preview_level(self, level: int) -> int:
+        return min(level + self.preview_levels, self.max_lod_level)
+
+    def _get_generated_layers(self) -> Tuple[Dict[str, Tuple[Geometry, np.ndarray, gpd.GeoDataFrame]], sg.Polygon]:
+        """
+        Return the last generated data layers and the bounding polygon of their rasters in EPSG:4326 coordinates
+        """
+        with self._generated_lock:
+            return self._generated_data_layers, self._generated_bounds
+
     def _update_layer_list(self):
         from itertools import chain
         layers = []
@@ -276,43 +505,111 @@ class PlotServer:
             layers.append(d)
         self._update_callback(list(chain(self.data_layers, self.annotation_layers)))
 
-    def generate_layers(self, bounds_poly: sg.Polygon, raster_shape: Tuple[int, int]) -> NoReturn:
+    def generate_layers(self, bounds_poly: sg.Polygon, level: int = 0, token: Optional[int] = None) -> NoReturn:
         """
-        Generate static layers of map
+        Generate static layers of map. Layers are assembled from cached tiles, only generating the tiles not cached.
 
-        :param raster_shape: shape of raster grid
         :param shapely.geometry.Polygon bounds_poly: the bounding polygon for which to generate the map
+        :param level: level of the tile pyramid to generate, each level doubles the raster resolution from
+         `raster_resolution_m`
+        :param token: generation token of the job generating the layers, if any. Raises `JobCancelled` before generating
+         each layer once the job is superseded
         """
 
         layers = {}
-        self._progress_callback('Generating layer data')
+        self._progress_callback(f'Generating layer data at {self._tile_cache.resolution(level):g}m resolution')
+        bounds = self._to_epsg3857_bounds(bounds_poly)
         res = jl.Parallel(n_jobs=-1, verbose=1, prefer='threads')(
-            jl.delayed(self.generate_layer)(layer, bounds_poly, raster_shape, self._time_idx,
-                                            self.raster_resolution_m) for layer in self.data_layers)
+            jl.delayed(self.generate_layer_tiles)(layer, bounds, self._time_idx, level, token=token)
+            for layer in self.data_layers)
+        self._check_job(token)
         for key, result in res:
             if result:
                 layers[key] = result
 
         # Remove layers with explicit ordering
         # so they are can be reinserted in the correct order instead of updated in place
-        self._generated_data_layers.clear()
+        generated = {}
         if not self.data_layer_order:
-            self._generated_data_layers.update(dict(list(layers.items())[::-1]))
+            generated.update(dict(list(layers.items())[::-1]))
         else:
             # Add layers in order
-            self._generated_data_layers.update({k: layers[k] for k in self.data_layer_order if k in layers})
+            generated.update({k: layers[k] for k in self.data_layer_order if k in layers})
             # # Add any new layers last
-            self._generated_data_layers.update(
-                {k: layers[k] for k in layers.keys() if k not in self._generated_data_layers})
+            generated.update({k: layers[k] for k in layers.keys() if k not in generated})
+        generated_bounds = self._from_epsg3857_bounds(self._tile_cache.snap_bounds(level, bounds))
+        # Swap rather than update in place, so layers already read from a previous generation are left unchanged
+        with self._generated_lock:
+            self._generated_data_layers = generated
+            self._generated_bounds = generated_bounds
+
+    def generate_layer_tiles(self, layer: DataLayer, bounds: Tuple[float, float, float, float], hour: int,
+                             level: int, token: Optional[int] = None) -> Union[
+        Tuple[str, Tuple[Geometry, np.ndarray, gpd.GeoDataFrame]], Tuple[str, None]]:
+        """
+        Generate the raster of a layer over an area from the tile cache, generating any missing tiles in a single pass.
+
+        :param layer: the layer to generate
+        :param bounds: (min_x, min_y, max_x, max_y) bounds in EPSG:3857 coordinates
+        :param hour: the hour to generate the layer at
+        :param level: level of the tile pyramid to generate
+        :param token: generation token of the job generating the layer, if any
+        :return: tuple of the layer key and the generated layer, as returned by `generate_layer`. The GeoDataFrame is
+         None if all tiles were cached
+        """
+        self._rename_layer(layer)
+        tile_key = (layer.cache_key, hour)
+        cache = self._tile_cache
+        missing = cache.missing_tiles(tile_key, level, cache.covering_tiles(level, bounds))
+        # Downsample coarse tiles from fine tiles already generated where possible
+        missing = [tile for tile in missing if not cache.fill_from_finer(tile_key, tile)]
+        raw_data = None
+        if missing:
+            self._check_job(token)
+            # Generate the smallest range of tiles covering all the missing ones, with a margin around it
+            xs, ys = [t[1] for t in missing], [t[2] for t in missing]
+            gen_range = (min(xs), min(ys), max(xs), max(ys))
+            resolution = cache.resolution(level)
+            halo = self.tile_halo * resolution
+            min_x, min_y, max_x, max_y = cache.range_bounds(level, gen_range)
+            gen_bounds = self._from_epsg3857_bounds((min_x - halo, min_y - halo, max_x + halo, max_y + halo))
+            raster_shape = ((gen_range[2] - gen_range[0] + 1) * cache.tile_size + 2 * self.tile_halo,
+                            (gen_range[3] - gen_range[1] + 1) * cache.tile_size + 2 * self.tile_halo)
+            key, result = self.generate_layer(layer, gen_bounds, raster_shape, hour, resolution,
+                                              layer_pool=self._layer_pool)
+            if result is None or result[1] is None:
+                return key, None
+            raster = remove_raster_nans(result[1])
+            if not layer.raster_north_up:
+                raster = np.flipud(raster)
+            if self.tile_halo:
+                raster = raster[self.tile_halo:-self.tile_halo, self.tile_halo:-self.tile_halo]
+            cache.put_range(tile_key, level, gen_range, raster, tiles=missing)
+            raw_data = result[2]
+
+        raster, raster_bounds = cache.mosaic(tile_key, level, bounds)
+        if raster is None:
+            return layer.key + ' FAILED', None
+        return layer.key, (layer.make_raster_element(raster, self._from_epsg3857_bounds(raster_bounds)), raster,
+                           raw_data)
+
+    @staticmethod
+    def _rename_layer(layer: DataLayer) -> None:
+        if isinstance(layer, FatalityRiskLayer):
+            suffix = f' {layer.ac} {layer.wind_dir:03d}@{layer.wind_vel}kts'
+            if not layer.key.endswith(suffix):
+                layer.key = layer.key + suffix
 
     @staticmethod
     def generate_layer(layer: DataLayer, bounds_poly: sg.Polygon, raster_shape: Tuple[int, int], hour: int,
-                       resolution: float) -> Union[
+                       resolution: float, layer_pool: Optional[LayerProcessPool] = None) -> Union[
         Tuple[str, Tuple[Geometry, np.ndarray, gpd.GeoDataFrame]], Tuple[str, None]]:
 
         try:
-            if isinstance(layer, FatalityRiskLayer):
-                layer.key = f'{layer.key} {layer.ac} {layer.wind_dir:03d}@{layer.wind_vel}kts'
+            PlotServer._rename_layer(layer)
+            if layer_pool is not None:
+                # The plot of the layer is not returned from worker processes
+                return layer.key, layer_pool.generate_layer(layer, bounds_poly, raster_shape, hour, resolution)
             result = layer.key, layer.generate(bounds_poly, raster_shape, from_cache=False, hour=hour,
                                                resolution=resolution)
             return result
@@ -342,6 +639,14 @@ class PlotServer:
             self.data_layers.remove(layer)
         elif layer in self.annotation_layers:
             self.annotation_layers.remove(layer)
+        else:
+            return
+        # Static data shared with other layers is only freed once no layer holds it
+        layer.release_data()
+        if self._layer_pool is not None and isinstance(layer, DataLayer) and \
+                all(other.cache_key != layer.cache_key for other in self.data_layers):
+            # Workers keep every layer they have generated, so drop the removed layer unless another layer shares it
+            self._layer_pool.evict(layer.cache_key)
 
     def set_layer_order(self, layer_order):
         self.data_layer_order = layer_order
@@ -372,6 +677,47 @@ class PlotServer:
                 if layer1.ac_dict == layer2.ac_dict and i != j:
                     self.remove_layer(layer2)
 
+    def _select_lod_level(self, bounds_poly: sg.Polygon) -> Optional[int]:
+        """
+        Return the finest level of detail at which the raster of an area has at most `max_raster_pixels` pixels, or
+        None if the area is too large even at the coarsest level
+        :param bounds_poly: the bounding polygon of the area in EPSG:4326 coordinates
+        """
+        for level in range(self.max_lod_level + 1):
+            raster_shape = self._get_raster_dimensions(bounds_poly, self._tile_cache.resolution(level))
+            if raster_shape[0] * raster_shape[1] <= self.max_raster_pixels:
+                return level
+        return None
+
+    def _to_epsg3857_bounds(self, bounds_poly: sg.Polygon) -> Tuple[float, float, float, float]:
+        """
+        Return the (min_x, min_y, max_x, max_y) EPSG:3857 bounds of an EPSG:4326 bounding polygon
+        """
+        import pyproj
+
+        if self._epsg4326_to_epsg3857_proj is None:
+            self._epsg4326_to_epsg3857_proj = pyproj.Transformer.from_crs(pyproj.CRS.from_epsg('4326'),
+                                                                          pyproj.CRS.from_epsg('3857'),
+                                                                          always_xy=True)
+        bounds = bounds_poly.bounds
+        min_x, min_y = self._epsg4326_to_epsg3857_proj.transform(bounds[1], bounds[0])
+        max_x, max_y = self._epsg4326_to_epsg3857_proj.transform(bounds[3], bounds[2])
+        return min_x, min_y, max_x, max_y
+
+    def _from_epsg3857_bounds(self, bounds: Tuple[float, float, float, float]) -> sg.Polygon:
+        """
+        Return the EPSG:4326 bounding polygon of (min_x, min_y, max_x, max_y) EPSG:3857 bounds
+        """
+        import pyproj
+
+        if self._epsg3857_to_epsg4326_proj is None:
+            self._epsg3857_to_epsg4326_proj = pyproj.Transformer.from_crs(pyproj.CRS.from_epsg('3857'),
+                                                                          pyproj.CRS.from_epsg('4326'),
+                                                                          always_xy=True)
+        min_lon, min_lat = self._epsg3857_to_epsg4326_proj.transform(bounds[0], bounds[1])
+        max_lon, max_lat = self._epsg3857_to_epsg4326_proj.transform(bounds[2], bounds[3])
+        return make_bounds_polygon((min_lon, max_lon), (min_lat, max_lat))
+
     def _get_raster_dimensions(self, bounds_poly: sg.Polygon, raster_resolution_m: float) -> Tuple[int, int]:
         """
         Return a the (x,y) shape of a raster grid given its EPSG4326 envelope and desired raster resolution
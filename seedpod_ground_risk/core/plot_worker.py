@@ -46,6 +46,7 @@ class PlotWorker(QRunnable):
         from seedpod_ground_risk.core.plot_server import PlotServer
 
         self.plot_server = PlotServer(tiles=tiles,
+                                      progressive=True,
                                       progress_callback=self.status_update,
                                       update_callback=self.layers_update,
                                       progress_bar_callback=self.progress_update)
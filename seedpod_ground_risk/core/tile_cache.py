@@ -0,0 +1,200 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TileIndex = Tuple[int, int, int]
+TileRange = Tuple[int, int, int, int]
+
+
+class RasterTileCache:
+    """
+    Pyramid of square raster tiles of generated data layers.
+
+    Tiles are aligned to a fixed grid in EPSG:3857 coordinates. Level `z` has a pixel size of
+    `base_resolution * 2 ** z` metres, and tile (z, x, y) covers the square of side `tile_size` pixels from
+    (x, y) to (x + 1, y + 1) tile widths from the origin. Rasters are stored north up, with the first row at the top.
+
+    Tiles are stored under a key identifying everything the raster depends on other than the area, such as the layer
+    configuration and hour. The least recently used tiles are evicted past `max_tiles`. Coarser tiles can be
+    downsampled from finer tiles already cached, as the tiles of each level cover exactly four tiles of the level below.
+    """
+
+    def __init__(self, base_resolution: float = 40, tile_size: int = 256, max_tiles: int = 1024) -> None:
+        """
+        :param base_resolution: pixel size of level 0 in metres
+        :param tile_size: side length of each tile in pixels, must be even
+        :param max_tiles: maximum number of tiles to keep in memory
+        """
+        self.base_resolution = base_resolution
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolution(self, z: int) -> float:
+        """
+        Return the pixel size of a level in metres
+        """
+        return self.base_resolution * 2 ** z
+
+    def tile_extent(self, z: int) -> float:
+        """
+        Return the side length of the tiles of a level in metres
+        """
+        return self.tile_size * self.resolution(z)
+
+    def covering_tiles(self, z: int, bounds: Tuple[float, float, float, float]) -> TileRange:
+        """
+        Return the range of tiles of a level covering an area
+        :param z: level
+        :param bounds: (min_x, min_y, max_x, max_y) bounds in EPSG:3857 coordinates
+        :return: inclusive (min_x, min_y, max_x, max_y) range of tile indices
+        """
+        extent = self.tile_extent(z)
+        min_x, min_y, max_x, max_y = bounds
+        # Upper bounds exactly on a tile edge do not need the next tile
+        return (int(np.floor(min_x / extent)), int(np.floor(min_y / extent)),
+                int(np.ceil(max_x / extent)) - 1, int(np.ceil(max_y / extent)) - 1)
+
+    def range_bounds(self, z: int, tile_range: TileRange) -> Tuple[float, float, float, float]:
+        """
+        Return the bounds of a range of tiles in EPSG:3857 coordinates
+        """
+        extent = self.tile_extent(z)
+        min_tx, min_ty, max_tx, max_ty = tile_range
+        return min_tx * extent, min_ty * extent, (max_tx + 1) * extent, (max_ty + 1) * extent
+
+    def get(self, key: Hashable, tile: TileIndex) -> Optional[np.ndarray]:
+        with self._lock:
+            raster = self._tiles.get((key, tile))
+            if raster is not None:
+                self._tiles.move_to_end((key, tile))
+            return raster
+
+    def put(self, key: Hashable, tile: TileIndex, raster: np.ndarray) -> None:
+        with self._lock:
+            self._tiles[(key, tile)] = raster
+            self._tiles.move_to_end((key, tile))
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+
+    def missing_tiles(self, key: Hashable, z: int, tile_range: TileRange) -> List[TileIndex]:
+        """
+        Return the tiles in a range not in the cache
+        """
+        with self._lock:
+            return [tile for tile in self._iter_range(z, tile_range) if (key, tile) not in self._tiles]
+
+    def put_range(self, key: Hashable, z: int, tile_range: TileRange, raster: np.ndarray,
+                  tiles: Optional[Iterable[TileIndex]] = None) -> None:
+        """
+        Split a north up raster covering a range of tiles exactly into tiles and store them
+        :param key: key of the tiles
+        :param z: level of the tiles
+        :param tile_range: inclusive (min_x, min_y, max_x, max_y) range of tile indices covered by the raster
+        :param raster: raster with a row per pixel from north to south
+        :param tiles: subset of the tiles in the range to store. Defaults to all
+        """
+        min_tx, min_ty, max_tx, max_ty = tile_range
+        size = self.tile_size
+        expected_shape = ((max_ty - min_ty + 1) * size, (max_tx - min_tx + 1) * size)
+        if raster.shape != expected_shape:
+            raise ValueError(f'Raster of shape {raster.shape} does not cover tiles of shape {expected_shape}')
+        for _, tx, ty in (tiles if tiles is not None else self._iter_range(z, tile_range)):
+            # Rows count down from the northern edge of the range
+            row = (max_ty - ty) * size
+            col = (tx - min_tx) * size
+            self.put(key, (z, tx, ty), raster[row:row + size, col:col + size].copy())
+
+    def fill_from_finer(self, key: Hashable, tile: TileIndex) -> bool:
+        """
+        Store a tile downsampled from the four tiles it covers on the next finer level, if they are all cached or can
+        themselves be filled from finer levels. Pixels are averaged, so values must be densities rather than totals.
+        :param key: key of the tiles
+        :param tile: the tile to fill
+        :return: whether the tile was filled
+        """
+        return self._downsample(key, tile) is not None
+
+    def _downsample(self, key: Hashable, tile: TileIndex) -> Optional[np.ndarray]:
+        z, tx, ty = tile
+        if z <= 0:
+            return None
+        half = self.tile_size // 2
+        out = np.empty((self.tile_size, self.tile_size))
+        for i in range(2):
+            for j in range(2):
+                child = (z - 1, 2 * tx + i, 2 * ty + j)
+                child_raster = self.get(key, child)
+                if child_raster is None:
+                    child_raster = self._downsample(key, child)
+                    if child_raster is None:
+                        return None
+                # The northern children are the top half of the north up parent
+                row = (1 - j) * half
+                col = i * half
+                out[row:row + half, col:col + half] = child_raster.reshape(half, 2, half, 2).mean(axis=(1, 3))
+        self.put(key, tile, out)
+        return out
+
+    def mosaic(self, key: Hashable, z: int, bounds: Tuple[float, float, float, float]) \
+            -> Tuple[Optional[np.ndarray], Optional[Tuple[float, float, float, float]]]:
+        """
+        Assemble the tiles covering an area into a single north up raster, cropped to the pixels covering the area
+        :param key: key of the tiles
+        :param z: level of the tiles
+        :param bounds: (min_x, min_y, max_x, max_y) bounds in EPSG:3857 coordinates
+        :return: tuple of the raster and its bounds snapped to the pixel grid, or (None, None) if any of the tiles are
+         not in the cache
+        """
+        tile_range = self.covering_tiles(z, bounds)
+        min_tx, min_ty, max_tx, max_ty = tile_range
+        size = self.tile_size
+        out = np.empty(((max_ty - min_ty + 1) * size, (max_tx - min_tx + 1) * size))
+        for _, tx, ty in self._iter_range(z, tile_range):
+            tile = self.get(key, (z, tx, ty))
+            if tile is None:
+                return None, None
+            row = (max_ty - ty) * size
+            col = (tx - min_tx) * size
+            out[row:row + size, col:col + size] = tile
+
+        row0, row1, col0, col1 = self._crop_window(z, tile_range, bounds)
+        return out[row0:row1, col0:col1], self.snap_bounds(z, bounds)
+
+    def snap_bounds(self, z: int, bounds: Tuple[float, float, float, float]) -> Tuple[float, float, float, float]:
+        """
+        Return bounds in EPSG:3857 coordinates expanded to the pixel grid of a level, as covered by `mosaic`
+        """
+        tile_range = self.covering_tiles(z, bounds)
+        row0, row1, col0, col1 = self._crop_window(z, tile_range, bounds)
+        res = self.resolution(z)
+        range_min_x, _, _, range_max_y = self.range_bounds(z, tile_range)
+        return (range_min_x + col0 * res, range_max_y - row1 * res,
+                range_min_x + col1 * res, range_max_y - row0 * res)
+
+    def _crop_window(self, z: int, tile_range: TileRange, bounds: Tuple[float, float, float, float]) \
+            -> Tuple[int, int, int, int]:
+        res = self.resolution(z)
+        range_min_x, _, _, range_max_y = self.range_bounds(z, tile_range)
+        min_x, min_y, max_x, max_y = bounds
+        col0 = int(np.floor((min_x - range_min_x) / res))
+        col1 = max(int(np.ceil((max_x - range_min_x) / res)), col0 + 1)
+        row0 = int(np.floor((range_max_y - max_y) / res))
+        row1 = max(int(np.ceil((range_max_y - min_y) / res)), row0 + 1)
+        return row0, row1, col0, col1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tiles.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._tiles)
+
+    @staticmethod
+    def _iter_range(z: int, tile_range: TileRange) -> Iterable[TileIndex]:
+        min_tx, min_ty, max_tx, max_ty = tile_range
+        return [(z, tx, ty) for ty in range(min_ty, max_ty + 1) for tx in range(min_tx, max_tx + 1)]
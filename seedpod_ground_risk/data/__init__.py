@@ -34,3 +34,18 @@ def road_geometry_filepath():
 def relative_variation_filepath():
     relative_variation_fp = os.path.join('static_data', 'tra0307.ods')
     return relative_variation_fp
+
+
+def osm_cache_dirpath():
+    osm_cache_dp = os.path.join('static_data', 'osm_cache')
+    return osm_cache_dp
+
+
+def census_wards_cache_filepath():
+    census_wards_cache_fp = os.path.join('static_data', 'england_wa_2011_density.feather')
+    return census_wards_cache_fp
+
+
+def traffic_counts_cache_filepath():
+    traffic_counts_cache_fp = os.path.join('static_data', 'dft_traffic_counts_aadf.feather')
+    return traffic_counts_cache_fp
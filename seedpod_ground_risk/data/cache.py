@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Iterable
+
+
+def atomic_write(path: str, writer: Callable[[str], None]) -> None:
+    """
+    Write a file through a temporary file replacing it once complete, so concurrent readers never see a partial file
+    and a crash never leaves one behind
+    :param path: path of the file to write
+    :param writer: callable writing the file to the path it is given
+    """
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        writer(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def source_checksum(source_paths: Iterable[str], version: int) -> str:
+    """
+    Return a checksum identifying a cache version and the state of the source files it is built from
+    :param source_paths: paths of the source files
+    :param version: version of the processing producing the cache from the sources
+    """
+    digest = hashlib.sha1(str(version).encode())
+    for path in source_paths:
+        stat = os.stat(path)
+        # Hash the file metadata, hashing the contents of large sources would take as long as reading them
+        digest.update(f'{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()
+
+
+def write_cache(cache_path: str, writer: Callable[[str], None], version: int, checksum: str) -> None:
+    """
+    Write a cache and the version and source checksum it was built with. The old checksum is removed before the cache
+    is replaced, so a cache is never taken as valid by a checksum it was not built with, even after a crash.
+    :param cache_path: path of the cache to write
+    :param writer: callable writing the cache to the path it is given
+    :param version: version of the processing producing the cache
+    :param checksum: checksum of the sources the cache was built from, see `source_checksum`
+    """
+    try:
+        os.remove(cache_path + '.json')
+    except FileNotFoundError:
+        pass
+    atomic_write(cache_path, writer)
+    write_cache_checksum(cache_path, version, checksum)
+
+
+def write_cache_checksum(cache_path: str, version: int, checksum: str) -> None:
+    """
+    Write the version and source checksum of a cache to a sidecar JSON file next to it
+    """
+
+    def write(path):
+        with open(path, 'w') as f:
+            json.dump({'version': version, 'checksum': checksum}, f)
+
+    atomic_write(cache_path + '.json', write)
+
+
+def is_cache_valid(cache_path: str, version: int, checksum: str) -> bool:
+    """
+    Return whether a cache exists and was built by the same version from sources with the same checksum
+    """
+    try:
+        with open(cache_path + '.json') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return os.path.exists(cache_path) and meta.get('version') == version and meta.get('checksum') == checksum
@@ -0,0 +1,80 @@
+import os
+from typing import Optional
+
+import geopandas as gpd
+
+from seedpod_ground_risk.data import england_wa_2011_clipped_filepath, density_filepath, \
+    census_wards_cache_filepath
+from seedpod_ground_risk.data.cache import source_checksum, write_cache, is_cache_valid
+
+# Increment when the processing in `_ingest_census_data` changes, so existing caches are rebuilt
+CENSUS_WARDS_CACHE_VERSION = 1
+# Key of the census wards in the static data registry
+CENSUS_WARDS_KEY = 'census_wards'
+
+
+def _source_filepaths():
+    shp_path = england_wa_2011_clipped_filepath()
+    stem = os.path.splitext(shp_path)[0]
+    # The shapefile is split over several files
+    sidecars = [stem + ext for ext in ['.dbf', '.shx', '.prj', '.cpg'] if os.path.exists(stem + ext)]
+    return [shp_path] + sidecars + [density_filepath()]
+
+
+def _source_checksum() -> str:
+    return source_checksum(_source_filepaths(), CENSUS_WARDS_CACHE_VERSION)
+
+
+def _ingest_census_data() -> gpd.GeoDataFrame:
+    """
+    Ingest Census boundaries and density values and overlay/merge
+    """
+    import pandas as pd
+
+    # Import Census boundaries in Ordnance Survey grid and reproject
+    census_wards_df = gpd.read_file(england_wa_2011_clipped_filepath()).drop(['altname', 'oldcode'], axis=1)
+    if not census_wards_df.crs:
+        census_wards_df = census_wards_df.set_crs('EPSG:27700')
+    census_wards_df = census_wards_df.to_crs('EPSG:4326')
+    # Import census ward densities
+    density_df = pd.read_csv(density_filepath(), header=0)
+    # Scale from hectares to km^2
+    density_df['area'] = density_df['area'] * 0.01
+    density_df['density'] = density_df['density'] / 0.01
+
+    # These share a common UID, so merge together on it and store
+    return census_wards_df.merge(density_df, on='code')
+
+
+def build_census_wards_cache(cache_path: Optional[str] = None) -> str:
+    """
+    Write the merged and reprojected census wards to an uncompressed Feather file with WKB geometries, alongside a
+    checksum of the sources it was built from.
+    :param cache_path: path of the Feather file to write. Defaults to `census_wards_cache_filepath`
+    :return: the path of the Feather file
+    """
+    if cache_path is None:
+        cache_path = census_wards_cache_filepath()
+    census_wards = _ingest_census_data()
+    # Uncompressed so it can be memory mapped when read
+    write_cache(cache_path, lambda path: census_wards.to_feather(path, compression='uncompressed'),
+                CENSUS_WARDS_CACHE_VERSION, _source_checksum())
+    return cache_path
+
+
+def _is_cache_valid(cache_path: str) -> bool:
+    return is_cache_valid(cache_path, CENSUS_WARDS_CACHE_VERSION, _source_checksum())
+
+
+def load_census_wards() -> gpd.GeoDataFrame:
+    """
+    Return the census wards merged with their population densities in EPSG:4326.
+
+    The wards are read from the Feather cache, which is built first if it is missing or out of date. Layers share a
+    single copy through the static data registry under `CENSUS_WARDS_KEY`, rather than calling this directly.
+    """
+    cache_path = census_wards_cache_filepath()
+    if not _is_cache_valid(cache_path):
+        print('Building census wards cache')
+        build_census_wards_cache(cache_path)
+    return gpd.read_feather(cache_path, memory_map=True)
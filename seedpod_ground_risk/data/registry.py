@@ -0,0 +1,83 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _RegistryEntry:
+    __slots__ = ['data', 'loaded', 'refcount', 'lock']
+
+    def __init__(self):
+        self.data = None
+        self.loaded = False
+        self.refcount = 0
+        # Held while loading, so concurrent acquires of the same key wait for the one load
+        self.lock = threading.Lock()
+
+
+class StaticDataRegistry:
+    """
+    Reference counted registry of static datasets shared between layers.
+
+    Layers acquire datasets by key when preloading, so all instances of a layer, such as the population layers of
+    several aircraft, share a single in-memory copy loaded once. A dataset is dropped from the registry when the last
+    layer holding it releases it.
+
+    Shared datasets must be treated as read only.
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[Hashable, _RegistryEntry] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Return the dataset registered under a key, loading it first if it is not held by anything else.
+        Every call must be paired with a call to `release`.
+
+        :param key: unique key of the dataset
+        :param loader: callable taking no arguments returning the dataset
+        :return: the shared dataset
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _RegistryEntry()
+            entry.refcount += 1
+
+        with entry.lock:
+            if not entry.loaded:
+                try:
+                    entry.data = loader()
+                    entry.loaded = True
+                except BaseException:
+                    self.release(key)
+                    raise
+        return entry.data
+
+    def release(self, key: Hashable) -> None:
+        """
+        Release a reference to a dataset, dropping it from the registry if it is no longer held.
+        :param key: unique key of the dataset
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                raise KeyError(f'Static dataset {key} is not held')
+            entry.refcount -= 1
+            if entry.refcount <= 0:
+                del self._entries[key]
+
+    def refcount(self, key: Hashable) -> int:
+        """
+        Return the number of references held to a dataset
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.refcount if entry is not None else 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._entries
+
+
+# Process wide registry shared by all layers
+static_data_registry = StaticDataRegistry()
@@ -0,0 +1,88 @@
+from typing import Optional
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from seedpod_ground_risk.data import traffic_count_filepath, traffic_counts_cache_filepath
+from seedpod_ground_risk.data.cache import source_checksum, write_cache, is_cache_valid
+
+# Increment when the processing in `_ingest_traffic_counts` changes, so existing caches are rebuilt
+TRAFFIC_COUNTS_CACHE_VERSION = 1
+
+TRAFFIC_COUNT_COLUMNS = ['count_point_id', 'year', 'latitude', 'longitude', 'road_name', 'pedal_cycles',
+                         'two_wheeled_motor_vehicles', 'cars_and_taxis', 'buses_and_coaches',
+                         'lgvs', 'all_hgvs', 'all_motor_vehicles']
+
+# https://www.gov.uk/government/statistical-data-sets/nts09-vehicle-mileage-and-occupancy#carvan-occupancy
+# other types plausibly estimated.
+TYPE_OCCUPANCY = {
+    'pedal_cycles': 1,
+    'two_wheeled_motor_vehicles': 1.4,
+    'cars_and_taxis': 1.6,
+    'buses_and_coaches': 40,
+    'lgvs': 1.5,
+    'all_hgvs': 1.6
+}
+
+
+def _source_checksum() -> str:
+    return source_checksum([traffic_count_filepath()], TRAFFIC_COUNTS_CACHE_VERSION)
+
+
+def estimate_road_populations(counts_df: pd.DataFrame) -> np.ndarray:
+    """
+    Use estimates of vehicle occupancy based on vehicle type to estimate the population passing each count point.
+    :param counts_df: traffic counts with a column of annual average daily flow for each type in `TYPE_OCCUPANCY`
+    :return: array of the mean population per hour passing each count point
+    """
+    counts = counts_df[list(TYPE_OCCUPANCY.keys())].to_numpy(dtype=float)
+    return counts @ np.array(list(TYPE_OCCUPANCY.values()), dtype=float) / 24
+
+
+def _ingest_traffic_counts() -> pd.DataFrame:
+    """
+    Ingest annualised average daily flow traffic counts and estimate the population passing each count point.
+    Only the latest year of data is used.
+    """
+    # Ingest raw data, only reading the desired columns
+    counts_df = pd.read_csv(traffic_count_filepath(), usecols=TRAFFIC_COUNT_COLUMNS)[TRAFFIC_COUNT_COLUMNS]
+    # Select out only the latest year
+    latest_counts_df = counts_df[counts_df['year'] == counts_df['year'].max()].reset_index(drop=True)
+    latest_counts_df['population_per_hour'] = estimate_road_populations(latest_counts_df)
+    return latest_counts_df
+
+
+def build_traffic_counts_cache(cache_path: Optional[str] = None) -> str:
+    """
+    Write the latest year of traffic counts with their estimated populations to an uncompressed Feather file,
+    alongside a checksum of the source they were built from.
+    :param cache_path: path of the Feather file to write. Defaults to `traffic_counts_cache_filepath`
+    :return: the path of the Feather file
+    """
+    if cache_path is None:
+        cache_path = traffic_counts_cache_filepath()
+    counts_df = _ingest_traffic_counts()
+    write_cache(cache_path, lambda path: counts_df.to_feather(path, compression='uncompressed'),
+                TRAFFIC_COUNTS_CACHE_VERSION, _source_checksum())
+    return cache_path
+
+
+def _is_cache_valid(cache_path: str) -> bool:
+    return is_cache_valid(cache_path, TRAFFIC_COUNTS_CACHE_VERSION, _source_checksum())
+
+
+def load_traffic_counts() -> gpd.GeoDataFrame:
+    """
+    Return the latest year of traffic counts with the population passing each count point, as points in EPSG:4326.
+
+    The counts are read from the Feather cache, which is built first if it is missing or out of date.
+    """
+    cache_path = traffic_counts_cache_filepath()
+    if not _is_cache_valid(cache_path):
+        print('Building traffic counts cache')
+        build_traffic_counts_cache(cache_path)
+    from pyarrow import feather
+    counts_df = feather.read_table(cache_path, memory_map=True).to_pandas()
+    return gpd.GeoDataFrame(counts_df,
+                            geometry=gpd.points_from_xy(counts_df.longitude, counts_df.latitude)).set_crs('EPSG:4326')
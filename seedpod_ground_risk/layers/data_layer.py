@@ -1,5 +1,5 @@
 import abc
-from typing import Tuple
+from typing import Hashable, Tuple
 
 import geopandas as gpd
 import numpy as np
@@ -17,6 +17,8 @@ class DataLayer(Layer, abc.ABC):
     key: str
     is_dynamic: bool
     cached_area: Polygon
+    # Whether the first row of generated raster grids is the northern edge, otherwise it is the southern edge
+    raster_north_up: bool = False
 
     def __init__(self, key):
         super().__init__(key)
@@ -33,3 +35,30 @@ class DataLayer(Layer, abc.ABC):
         :return: an Overlay-able holoviews layer with specific options
         """
         pass
+
+    @property
+    def cache_key(self) -> Hashable:
+        """
+        Key identifying the configuration of this layer, so layers with equal keys generate equal rasters for the same
+        bounds and hour. Used to cache generated rasters across layer instances.
+        """
+        return type(self).__name__, self.key
+
+    def make_raster_element(self, raster_grid: np.ndarray, bounds_polygon: sg.Polygon) -> Geometry:
+        """
+        Make a plot of a raster grid of this layer, such as one assembled from previously generated rasters.
+        :param raster_grid: north up raster grid
+        :param bounds_polygon: the bounding polygon of the raster grid
+        :return: an Overlay-able holoviews layer with specific options
+        """
+        import geoviews as gv
+
+        bounds = bounds_polygon.bounds
+        flipped_bounds = (bounds[1], bounds[0], bounds[3], bounds[2])
+        return gv.Image(raster_grid, vdims=['value'], bounds=flipped_bounds).options(
+            alpha=0.7,
+            colorbar=True,
+            cmap='viridis',
+            tools=['hover'],
+            clipping_colors={
+                'min': (0, 0, 0, 0)})
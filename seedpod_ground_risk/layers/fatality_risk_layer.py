@@ -8,6 +8,7 @@ from seedpod_ground_risk.ui_resources.aircraft_options import AIRCRAFT_LIST
 
 
 class FatalityRiskLayer(BlockableDataLayer):
+    raster_north_up = True
 
     def __init__(self, key, ac: str = 'Default',
                  wind_vel: float = 0, wind_dir: float = 0, colour: str = None, blocking=False, buffer_dist=0,
@@ -25,21 +26,17 @@ class FatalityRiskLayer(BlockableDataLayer):
     def preload_data(self):
         self._strike_layer.preload_data()
 
+    def release_data(self):
+        super().release_data()
+        self._strike_layer.release_data()
+
     def generate(self, bounds_polygon, raster_shape, hour=8, resolution=30, **kwargs):
         strike_risk, impact_kes = self._strike_layer.make_strike_map(bounds_polygon, hour, raster_shape, resolution)
 
         fm = FatalityModel(0.3, 1e6, 34)
         risk_map = np.sum([fm.transform(strike_risk, impact_ke=ke) for ke in impact_kes], axis=0)
 
-        bounds = bounds_polygon.bounds
-        flipped_bounds = (bounds[1], bounds[0], bounds[3], bounds[2])
-        risk_raster = gv.Image(risk_map, vdims=['strike_risk'], bounds=flipped_bounds).options(
-            alpha=0.7,
-            colorbar=True, colorbar_opts={'title': 'Person Fatality Risk [h^-1]'},
-            cmap='viridis',
-            tools=['hover'],
-            clipping_colors={
-                'min': (0, 0, 0, 0)})
+        risk_raster = self.make_raster_element(risk_map, bounds_polygon)
         # import rasterio
         # from rasterio import transform
         # trans = transform.from_bounds(*flipped_bounds, *raster_shape)
@@ -57,3 +54,19 @@ class FatalityRiskLayer(BlockableDataLayer):
 
     def clear_cache(self):
         pass
+
+    @property
+    def cache_key(self):
+        # The key is renamed when generated, so is not part of the configuration
+        return type(self).__name__, self.ac, self.wind_vel, self.wind_dir, self.buffer_dist
+
+    def make_raster_element(self, raster_grid, bounds_polygon):
+        bounds = bounds_polygon.bounds
+        flipped_bounds = (bounds[1], bounds[0], bounds[3], bounds[2])
+        return gv.Image(raster_grid, vdims=['strike_risk'], bounds=flipped_bounds).options(
+            alpha=0.7,
+            colorbar=True, colorbar_opts={'title': 'Person Fatality Risk [h^-1]'},
+            cmap='viridis',
+            tools=['hover'],
+            clipping_colors={
+                'min': (0, 0, 0, 0)})
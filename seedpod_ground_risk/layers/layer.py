@@ -1,5 +1,7 @@
 import abc
-from typing import NoReturn
+from typing import Any, Callable, NoReturn
+
+from seedpod_ground_risk.data.registry import static_data_registry
 
 
 class Layer(abc.ABC):
@@ -10,6 +12,7 @@ class Layer(abc.ABC):
 
     def __init__(self, key):
         self.key = key
+        self._static_data = {}
 
     @abc.abstractmethod
     def preload_data(self) -> NoReturn:
@@ -27,3 +30,31 @@ class Layer(abc.ABC):
         All statically preloaded data should remain intact after calls to this method
         """
         pass
+
+    def release_data(self) -> NoReturn:
+        """
+        Release all static data acquired from the shared registry in `preload_data`.
+        This is called when the layer is removed, after which it must be preloaded again before use.
+        """
+        for key in self._static_data:
+            static_data_registry.release(key)
+        self._static_data = {}
+
+    def __getstate__(self):
+        # Layers are pickled without their static data, such as when sent to worker processes, where they must be
+        # preloaded again from that process's registry
+        shared = {id(data) for data in self._static_data.values()}
+        state = {name: None if id(value) in shared else value for name, value in self.__dict__.items()}
+        state['_static_data'] = {}
+        return state
+
+    def _acquire_static_data(self, key: str, loader: Callable[[], Any]) -> Any:
+        """
+        Return a static dataset shared between all layers, loading it if no other layer holds it
+        :param key: unique key of the dataset
+        :param loader: callable taking no arguments returning the dataset
+        """
+        # Only hold one reference per layer, so preloading is idempotent
+        if key not in self._static_data:
+            self._static_data[key] = static_data_registry.acquire(key, loader)
+        return self._static_data[key]
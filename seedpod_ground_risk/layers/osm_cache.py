@@ -0,0 +1,199 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple, List, Dict
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely.geometry as sg
+
+from seedpod_ground_risk.data import osm_cache_dirpath
+from seedpod_ground_risk.data.cache import atomic_write
+
+TileIndex = Tuple[int, int]
+
+
+class OSMPolygonCache:
+    """
+    Spatially keyed cache of OSM polygons by tag.
+
+    The world is split into square tiles of `tile_size` degrees. Each tile is fetched from OSM at most once per TTL
+    and stored both in an in-memory LRU and as a pickled GeoDataFrame on disk, so repeated queries over the same area
+    do not touch the network, even between application runs. Polygons are stored in every tile their bounds overlap.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, tile_size: float = 0.05, ttl: float = 7 * 24 * 3600,
+                 max_disk_bytes: int = 512 * 1024 ** 2, max_memory_tiles: int = 256) -> None:
+        """
+        :param cache_dir: directory to persist tiles in. Tiles are only kept in memory if None
+        :param tile_size: side length of each tile in degrees
+        :param ttl: time in seconds after which a tile is refetched
+        :param max_disk_bytes: maximum total size of the tiles on disk, the least recently used are evicted past this
+        :param max_memory_tiles: maximum number of tiles to keep in memory
+        """
+        self.cache_dir = cache_dir
+        self.tile_size = tile_size
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_tiles = max_memory_tiles
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def query(self, osm_tag: str, bound_poly: sg.Polygon,
+              fetch: Callable[[str, Tuple[float, float, float, float]], gpd.GeoDataFrame]) -> gpd.GeoDataFrame:
+        """
+        Return the polygons with an OSM tag intersecting a bounding box, fetching any tiles not in the cache.
+
+        :param osm_tag: OSM tag to query
+        :param bound_poly: bounding box around requested area in EPSG:4326 coordinates, in (lat, lon) order
+        :param fetch: callable taking an OSM tag and (south, west, north, east) bounds returning a GeoDataFrame of
+         polygons in EPSG:4326
+        """
+        return self.query_batch([osm_tag], bound_poly,
+                                lambda tags, bounds: {tags[0]: fetch(tags[0], bounds)})[osm_tag]
+
+    def query_batch(self, osm_tags: List[str], bound_poly: sg.Polygon,
+                    fetch: Callable[[List[str], Tuple[float, float, float, float]], Dict[str, gpd.GeoDataFrame]]) \
+            -> Dict[str, gpd.GeoDataFrame]:
+        """
+        Return the polygons with each of several OSM tags intersecting a bounding box. Tiles missing from the cache
+        for any of the tags are fetched in a single call.
+
+        :param osm_tags: OSM tags to query
+        :param bound_poly: bounding box around requested area in EPSG:4326 coordinates, in (lat, lon) order
+        :param fetch: callable taking a list of OSM tags and (south, west, north, east) bounds returning a dict of
+         tag to GeoDataFrame of polygons in EPSG:4326
+        :return: dict of tag to GeoDataFrame of polygons with that tag
+        """
+        min_lat, min_lon, max_lat, max_lon = bound_poly.bounds
+        tiles = self._covering_tiles(min_lat, min_lon, max_lat, max_lon)
+
+        tile_dfs = {}
+        missing = {}
+        for tag in osm_tags:
+            for tile in tiles:
+                df = self._get_tile(tag, tile)
+                if df is None:
+                    missing.setdefault(tag, []).append(tile)
+                else:
+                    tile_dfs[(tag, tile)] = df
+
+        if missing:
+            # Fetch the tile aligned box covering all missing tiles of all tags in a single request
+            ys = [t[0] for tag_tiles in missing.values() for t in tag_tiles]
+            xs = [t[1] for tag_tiles in missing.values() for t in tag_tiles]
+            fetch_bounds = (min(ys) * self.tile_size, min(xs) * self.tile_size,
+                            (max(ys) + 1) * self.tile_size, (max(xs) + 1) * self.tile_size)
+            fetched_dfs = fetch(list(missing.keys()), fetch_bounds)
+            for tag, tag_tiles in missing.items():
+                for tile, df in self._split_tiles(fetched_dfs[tag], tag_tiles).items():
+                    tile_dfs[(tag, tile)] = df
+                    self._put_tile(tag, tile, df)
+            self._evict_disk()
+
+        out = {}
+        for tag in osm_tags:
+            df = gpd.GeoDataFrame(pd.concat([tile_dfs[(tag, t)] for t in tiles], ignore_index=True), crs='EPSG:4326')
+            # Polygons spanning several tiles are stored in each of them. Compare their WKB as comparing shapely
+            # geometries directly is slow
+            df = df[~df.geometry.to_wkb().duplicated().values].reset_index(drop=True)
+            out[tag] = df[df.intersects(sg.box(min_lon, min_lat, max_lon, max_lat))].reset_index(drop=True)
+        return out
+
+    def clear(self) -> None:
+        """
+        Clear the in-memory cache. Any tiles persisted to disk are kept.
+        """
+        with self._lock:
+            self._memory.clear()
+
+    def _covering_tiles(self, min_lat, min_lon, max_lat, max_lon) -> Iterable[TileIndex]:
+        y0, y1 = int(np.floor(min_lat / self.tile_size)), int(np.floor(max_lat / self.tile_size))
+        x0, x1 = int(np.floor(min_lon / self.tile_size)), int(np.floor(max_lon / self.tile_size))
+        return [(y, x) for y in range(y0, y1 + 1) for x in range(x0, x1 + 1)]
+
+    def _split_tiles(self, df: gpd.GeoDataFrame, tiles: Iterable[TileIndex]) -> dict:
+        df = df.reset_index(drop=True)
+        if df.empty:
+            return {tile: df for tile in tiles}
+        poly_bounds = df.geometry.bounds
+        out = {}
+        for y, x in tiles:
+            min_lat, min_lon = y * self.tile_size, x * self.tile_size
+            max_lat, max_lon = min_lat + self.tile_size, min_lon + self.tile_size
+            overlaps = (poly_bounds['minx'] <= max_lon) & (poly_bounds['maxx'] >= min_lon) & \
+                       (poly_bounds['miny'] <= max_lat) & (poly_bounds['maxy'] >= min_lat)
+            out[(y, x)] = df[overlaps.values].reset_index(drop=True)
+        return out
+
+    def _tile_key(self, osm_tag: str, tile: TileIndex) -> str:
+        tag_digest = hashlib.sha1(osm_tag.encode()).hexdigest()[:16]
+        return f'{tag_digest}_{self.tile_size:g}_{tile[0]}_{tile[1]}'
+
+    def _get_tile(self, osm_tag: str, tile: TileIndex) -> Optional[gpd.GeoDataFrame]:
+        key = self._tile_key(osm_tag, tile)
+        now = time.time()
+        with self._lock:
+            if key in self._memory:
+                timestamp, df = self._memory[key]
+                if now - timestamp < self.ttl:
+                    self._memory.move_to_end(key)
+                    return df
+                del self._memory[key]
+
+        if self.cache_dir is None:
+            return None
+        path = os.path.join(self.cache_dir, key + '.pkl')
+        try:
+            timestamp = os.path.getmtime(path)
+            if now - timestamp >= self.ttl:
+                return None
+            df = pd.read_pickle(path)
+            # Touch the file so disk eviction is least recently used
+            os.utime(path, (now, timestamp))
+        except (OSError, ValueError, EOFError, ImportError):
+            # Missing or unreadable tiles are a miss, they are overwritten once refetched
+            return None
+        self._remember(key, timestamp, df)
+        return df
+
+    def _put_tile(self, osm_tag: str, tile: TileIndex, df: gpd.GeoDataFrame) -> None:
+        key = self._tile_key(osm_tag, tile)
+        self._remember(key, time.time(), df)
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        atomic_write(os.path.join(self.cache_dir, key + '.pkl'), df.to_pickle)
+
+    def _remember(self, key: str, timestamp: float, df: gpd.GeoDataFrame) -> None:
+        with self._lock:
+            self._memory[key] = (timestamp, df)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_tiles:
+                self._memory.popitem(last=False)
+
+    def _evict_disk(self) -> None:
+        if self.cache_dir is None or not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+        total = sum(e[1] for e in entries)
+        # Remove least recently used tiles first
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+# Process wide cache shared by all layers querying OSM
+osm_polygon_cache = OSMPolygonCache(cache_dir=osm_cache_dirpath())
@@ -0,0 +1,126 @@
+import abc
+import os
+import threading
+from typing import Optional
+
+import geopandas as gpd
+import pandas as pd
+import shapely.geometry as sg
+
+
+class PolygonProvider(abc.ABC):
+    """
+    Source of OSM polygons by tag, used by `query_osm_polygons` in place of the Overpass API when set
+    """
+
+    @abc.abstractmethod
+    def query(self, osm_tag: str, bound_poly: sg.Polygon) -> gpd.GeoDataFrame:
+        """
+        Return the polygons with an OSM tag intersecting a bounding box
+        :param osm_tag: OSM tag to query, in 'key=value' form, or just 'key' to match any value
+        :param shapely.Polygon bound_poly: bounding box around requested area in EPSG:4326 coordinates, in (lat, lon)
+         order
+        :return: GeoDataFrame of polygons in EPSG:4326
+        """
+        pass
+
+
+class OSMExtractPolygonProvider(PolygonProvider):
+    """
+    Polygon provider reading from a local OSM extract, for use without network access.
+
+    Accepts either an OSM PBF file, read through the GDAL OSM driver, or a GeoPackage/GeoJSON pre-exported from one
+    with ogr2ogr. In both cases, commonly used keys such as `landuse` and `building` are columns, and all other tags
+    are in an `other_tags` column of the form '"key"=>"value",...'.
+
+    The extract is read once on the first query. A spatial index is then built per tag the first time it is queried.
+    """
+
+    def __init__(self, path: str, layer: Optional[str] = None) -> None:
+        """
+        :param path: path to the OSM extract
+        :param layer: layer of the extract containing polygons. Defaults to 'multipolygons' for PBF files, otherwise
+         the first layer
+        """
+        self.path = path
+        if layer is None and os.path.splitext(path)[1].lower() == '.pbf':
+            layer = 'multipolygons'
+        self.layer = layer
+        self._df = None
+        self._tag_dfs = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The extract is read again where unpickled, rather than copied between processes
+        return {'path': self.path, 'layer': self.layer}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['layer'])
+
+    def query(self, osm_tag: str, bound_poly: sg.Polygon) -> gpd.GeoDataFrame:
+        tag_df = self._get_tag_df(osm_tag)
+        min_lat, min_lon, max_lat, max_lon = bound_poly.bounds
+        idxs = tag_df.sindex.query(sg.box(min_lon, min_lat, max_lon, max_lat), predicate='intersects')
+        return tag_df.iloc[sorted(idxs)].reset_index(drop=True)
+
+    def _get_tag_df(self, osm_tag: str) -> gpd.GeoDataFrame:
+        with self._lock:
+            if self._df is None:
+                self._df = self._read_extract()
+            if osm_tag not in self._tag_dfs:
+                tag_df = self._df.loc[self._match_tag(self._df, osm_tag).values, ['geometry']].reset_index(drop=True)
+                # Build the index now, while holding the lock
+                tag_df.sindex
+                self._tag_dfs[osm_tag] = tag_df
+            return self._tag_dfs[osm_tag]
+
+    def _read_extract(self) -> gpd.GeoDataFrame:
+        if self.layer is None:
+            df = gpd.read_file(self.path)
+        else:
+            df = gpd.read_file(self.path, layer=self.layer)
+        if df.crs is None:
+            df = df.set_crs('EPSG:4326')
+        elif df.crs.to_epsg() != 4326:
+            df = df.to_crs('EPSG:4326')
+        # Only keep polygons, split into parts to match the polygons returned from Overpass
+        df = df[df.geometry.geom_type.isin(['Polygon', 'MultiPolygon'])]
+        return df.explode(index_parts=False).reset_index(drop=True)
+
+    @staticmethod
+    def _match_tag(df: gpd.GeoDataFrame, osm_tag: str):
+        key, _, value = osm_tag.partition('=')
+        if key in df.columns:
+            if value:
+                return df[key] == value
+            return df[key].notnull()
+        if 'other_tags' in df.columns:
+            pattern = f'"{key}"=>"{value}"' if value else f'"{key}"=>'
+            return df['other_tags'].fillna('').str.contains(pattern, regex=False)
+        return pd.Series(False, index=df.index)
+
+
+def _default_polygon_provider() -> Optional[PolygonProvider]:
+    # Allow offline use of the whole application, including the GUI, by pointing to an extract in the environment
+    extract_path = os.getenv('SPGR_OSM_EXTRACT')
+    if extract_path:
+        return OSMExtractPolygonProvider(extract_path)
+    return None
+
+
+_polygon_provider = _default_polygon_provider()
+
+
+def set_polygon_provider(provider: Optional[PolygonProvider]) -> None:
+    """
+    Set the provider used for all OSM polygon queries. Pass None to use the Overpass API
+    """
+    global _polygon_provider
+    _polygon_provider = provider
+
+
+def get_polygon_provider() -> Optional[PolygonProvider]:
+    """
+    Return the provider used for all OSM polygon queries, or None if the Overpass API is used
+    """
+    return _polygon_provider
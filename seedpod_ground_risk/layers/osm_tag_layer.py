@@ -1,5 +1,6 @@
-from itertools import combinations
-from typing import Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Tuple, Optional, List, Dict
 
 import geopandas as gpd
 import numpy as np
@@ -12,161 +13,182 @@ from requests.packages.urllib3.exceptions import InsecureRequestWarning
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
 from seedpod_ground_risk.layers.blockable_data_layer import BlockableDataLayer
+from seedpod_ground_risk.layers.osm_cache import OSMPolygonCache, osm_polygon_cache
+from seedpod_ground_risk.layers.osm_providers import get_polygon_provider
 
 
-def query_osm_polygons(osm_tag, bound_poly: sg.Polygon) -> gpd.GeoDataFrame:
+def query_osm_polygons(osm_tag, bound_poly: sg.Polygon,
+                       cache: Optional[OSMPolygonCache] = osm_polygon_cache) -> gpd.GeoDataFrame:
     """
-    Perform blocking query on OpenStreetMaps Overpass API for objects with the passed tag.
+    Query OpenStreetMaps for polygons with the passed tag, using the spatially keyed cache where possible.
+    If a polygon provider has been set with `set_polygon_provider`, it is queried instead of OpenStreetMaps.
     Retain only polygons and store in GeoPandas GeoDataFrame
     :param osm_tag: OSM tag to query
     :param shapely.Polygon bound_poly: bounding box around requested area in EPSG:4326 coordinates
+    :param cache: the cache to use. Pass None to always query Overpass
+    """
+    provider = get_polygon_provider()
+    if provider is not None:
+        return provider.query(osm_tag, bound_poly)
+    if cache is None:
+        return fetch_osm_polygons(osm_tag, bound_poly.bounds)
+    return cache.query(osm_tag, bound_poly, fetch_osm_polygons)
+
+
+def query_osm_polygons_batch(osm_tags: List[str], bound_poly: sg.Polygon,
+                             cache: Optional[OSMPolygonCache] = osm_polygon_cache) -> Dict[str, gpd.GeoDataFrame]:
+    """
+    Query OpenStreetMaps for polygons with any of the passed tags in a single request, using the spatially keyed
+    cache where possible. The results are split back out per tag.
+    :param osm_tags: OSM tags to query
+    :param shapely.Polygon bound_poly: bounding box around requested area in EPSG:4326 coordinates
+    :param cache: the cache to use. Pass None to always query Overpass
+    :return: dict of tag to GeoDataFrame of polygons with that tag
+    """
+    provider = get_polygon_provider()
+    if provider is not None:
+        return {tag: provider.query(tag, bound_poly) for tag in osm_tags}
+    if cache is None:
+        return fetch_osm_polygons_batch(osm_tags, bound_poly.bounds)
+    return cache.query_batch(osm_tags, bound_poly, fetch_osm_polygons_batch)
+
+
+def fetch_osm_polygons(osm_tag, bounds: Tuple[float, float, float, float]) -> gpd.GeoDataFrame:
+    """
+    Perform blocking query on OpenStreetMaps Overpass API for objects with the passed tag.
+    Retain only polygons and store in GeoPandas GeoDataFrame
+    :param osm_tag: OSM tag to query
+    :param bounds: (south, west, north, east) bounds of the requested area in EPSG:4326 coordinates
+    """
+    return fetch_osm_polygons_batch([osm_tag], bounds)[osm_tag]
+
+
+def fetch_osm_polygons_batch(osm_tags: List[str], bounds: Tuple[float, float, float, float]) -> \
+        Dict[str, gpd.GeoDataFrame]:
+    """
+    Perform a single blocking query on OpenStreetMaps Overpass API for objects with any of the passed tags.
+    The response is split back out per tag and only polygons are retained.
+    :param osm_tags: OSM tags to query
+    :param bounds: (south, west, north, east) bounds of the requested area in EPSG:4326 coordinates
+    :return: dict of tag to GeoDataFrame of polygons with that tag
     """
     from time import time
 
     t0 = time()
-    bounds = bound_poly.bounds
-    overpass_urls = ["https://overpass.kumi.systems/api/interpreter", "https://lz4.overpass-api.de/api/interpreter",
-                     "https://z.overpass-api.de/api/interpreter", "https://overpass.openstreetmap.ru/api/interpreter",
-                     "https://overpass.openstreetmap.fr/api/interpreter",
-                     "https://overpass.nchc.org.tw/api/interpreter"]
-    for i, url in enumerate(overpass_urls):
-        resp, data = query_request(overpass_urls[i], osm_tag, bounds)
-        if resp.status_code == 200:
-            break
+    data = race_overpass_mirrors(make_overpass_query(osm_tags, bounds))
+    print("OSM query took ", time() - t0)
+
+    elements = data['elements']
+    nodes = [o for o in elements if o['type'] == 'node']
+    ways = {o['id']: o for o in elements if o['type'] == 'way'}
+    relations = [o for o in elements if o['type'] == 'relation']
+
+    out = {}
+    for tag in osm_tags:
+        if len(osm_tags) == 1:
+            # All elements in the response belong to the only tag
+            out[tag] = _parse_osm_polygons(elements)
+            continue
+        tag_relations = [o for o in relations if _element_has_tag(o, tag)]
+        # Ways must be included if they are tagged themselves or are members of a tagged relation
+        tag_way_ids = {way_id for way_id, o in ways.items() if _element_has_tag(o, tag)}
+        tag_member_way_ids = {m['ref'] for r in tag_relations for m in r['members'] if m['type'] == 'way'}
+        tag_ways = [ways[way_id] for way_id in tag_way_ids | tag_member_way_ids if way_id in ways]
+        out[tag] = _parse_osm_polygons(nodes + tag_ways + tag_relations)
+    return out
+
+
+def _element_has_tag(element: dict, osm_tag: str) -> bool:
+    key, _, value = osm_tag.partition('=')
+    tags = element.get('tags', {})
+    if value:
+        return tags.get(key) == value
+    return key in tags
+
+
+def _assemble_rings(member_ways: List[Tuple[str, list]]) -> Tuple[List[Tuple[str, list]], List[Tuple[str, list]]]:
+    """
+    Join the member ways of a relation end to end into rings.
+
+    Ways are joined through a map of endpoint to the ways ending there, so assembly is linear in the number of ways.
+    :param member_ways: list of (role, coordinates) of each way in the relation
+    :return: tuple of lists of (role, coordinates) of closed rings, and (role, coordinates) of chains of ways that
+     could not be closed. The role of a joined ring is that of its first way.
+    """
+    closed = []
+    open_ways = []
+    for role, locs in member_ways:
+        if locs[0] == locs[-1]:
+            # Simplest case where way is already valid ring
+            closed.append((role, locs))
         else:
-            print(resp.status_code)
+            open_ways.append((role, locs))
+
+    # Map of each open way endpoint to the indices of the ways ending there
+    endpoint_ways = {}
+    for idx, (_, locs) in enumerate(open_ways):
+        endpoint_ways.setdefault(locs[0], []).append(idx)
+        endpoint_ways.setdefault(locs[-1], []).append(idx)
+    used = [False] * len(open_ways)
+
+    def next_way(endpoint):
+        candidates = endpoint_ways.get(endpoint, [])
+        while candidates:
+            idx = candidates.pop()
+            if not used[idx]:
+                return idx
+        return None
+
+    unclosed = []
+    for idx, (role, locs) in enumerate(open_ways):
+        if used[idx]:
+            continue
+        used[idx] = True
+        chain = list(locs)
+        # Extend forwards from the end of the chain, then backwards from the start if that did not close it
+        for forwards in [True, False]:
+            while chain[0] != chain[-1]:
+                endpoint = chain[-1] if forwards else chain[0]
+                join_idx = next_way(endpoint)
+                if join_idx is None:
+                    break
+                used[join_idx] = True
+                join_locs = open_ways[join_idx][1]
+                # Orient the joined way to continue from the shared endpoint, dropping the duplicate coordinate
+                if forwards:
+                    chain.extend(join_locs[1:] if join_locs[0] == endpoint else join_locs[-2::-1])
+                else:
+                    chain[0:0] = join_locs[:-1] if join_locs[-1] == endpoint else join_locs[:0:-1]
+        if chain[0] == chain[-1]:
+            closed.append((role, chain))
+        else:
+            unclosed.append((role, chain))
+    return closed, unclosed
 
-    print("OSM query took ", time() - t0)
 
-    ways = {o['id']: o['nodes'] for o in data['elements'] if o['type'] == 'way'}
-    nodes = {o['id']: (o['lon'], o['lat']) for o in data['elements'] if o['type'] == 'node'}
-    relations = [o for o in data['elements'] if o['type'] == 'relation']
+def _parse_osm_polygons(elements: List[dict]) -> gpd.GeoDataFrame:
+    """
+    Assemble polygons from Overpass JSON elements, including multipolygon relations
+    :param elements: list of Overpass node, way and relation elements
+    """
+    ways = {o['id']: o['nodes'] for o in elements if o['type'] == 'way'}
+    nodes = {o['id']: (o['lon'], o['lat']) for o in elements if o['type'] == 'node'}
+    relations = [o for o in elements if o['type'] == 'relation']
 
-    used_ways = []
+    used_ways = set()
     df_list = []
     for rel in relations:
         # Get all the id and role (inner/outer) of all relation members that are ways
-        rw = [(w['ref'], w['role']) for w in rel['members'] if w['type'] == 'way']
-        rel_outer_rings = []
-        rel_inner_rings = []
-
-        unclosed_ways = []
-        # Iterate each way in relation
-        for way_id, role in rw:
-            # Find the way ID in ways
-            if way_id in ways:
-                way = ways[way_id]
-                # Find the vertices (AKA nodes) that make up each polygon
-                locs = [nodes[i] for i in way]
-                start = locs[0]
-                end = locs[-1]
-                # Check if way is already a closed ring
-                if start == end:
-                    # Simplest case where way is already valid ring
-                    # Create linear ring from vertices and classify by role
-                    ring = sg.LinearRing(locs)
-                    if role == 'inner':
-                        rel_inner_rings.append(ring)
-                    else:
-                        rel_outer_rings.append(ring)
-                elif len(unclosed_ways) > 0:
-                    consumed = False
-                    # Way is not a valid ring
-                    # Check if there are any matching dangling nodes in other unclosed ways
-                    for _, uw in unclosed_ways:
-                        uw_start = uw[0]
-                        uw_end = uw[-1]
-                        if uw_end == start:
-                            # If the start of this way is the same as the end of the unclosed way
-                            # Append this ways nodes with duplicate coord sliced off
-                            uw += locs
-                            consumed = True
-                        elif uw_end == end:
-                            # If the end of this way is the same as the end of the unclosed way
-                            # Append this ways nodes reversed with the duplicate coord sliced off
-                            uw += locs[::-1]
-                            consumed = True
-                        elif uw_start == end:
-                            # If the end of this way is the same as the start of the unclosed way
-                            # Prepend this ways nodes with the duplicate coord sliced off
-                            uw[0:0] = locs
-                            consumed = True
-                        elif uw_start == start:
-                            # If the start of this way is the same as the start of the unclosed way
-                            # Prepend this ways nodes reversed with the duplicate coord sliced off
-                            uw[0:0] = locs[::-1]
-                            consumed = True
-
-                        # Check if this way has been used
-                        if consumed:
-                            # uw_start/end may have changed by now
-                            if uw[0] == uw[-1]:
-                                # Made a closed ring
-                                # Create linear ring from vertices and classify by role
-                                ring = sg.LinearRing(uw)
-                                if role == 'inner':
-                                    rel_inner_rings.append(ring)
-                                else:
-                                    rel_outer_rings.append(ring)
-                                # Remove from unclosed ways
-                                unclosed_ways.remove((role, uw))
-                            break
-
-                    # unclosed_ways is never empty in this if block, therefore loop is always entered
-                    # and consumed is always defined
-                    if not consumed:
-                        # This way is currently isolated so store as another unclosed way
-                        unclosed_ways.append((role, locs))
-                else:
-                    unclosed_ways.append((role, locs))
-                # Store used ways to prevent double processing later on
-                # Do not pop them out as other relations could be using them!
-                used_ways.append(way_id)
-        # Link up remaining unclosed polys
-        if unclosed_ways:
-            for (r1, uw1), (r2, uw2) in combinations(unclosed_ways, 2):
-                consumed = False
-                uw1_start = uw1[0]
-                uw1_end = uw1[-1]
-                uw2_start = uw2[0]
-                uw2_end = uw2[-1]
-                if uw1_end == uw2_start:
-                    # If the start of this way is the same as the end of the unclosed way
-                    # Append this ways nodes with duplicate coord sliced off
-                    uw1 += uw2[1:]
-                    consumed = True
-                elif uw1_end == uw2_end:
-                    # If the end of this way is the same as the end of the unclosed way
-                    # Append this ways nodes reversed with the duplicate coord sliced off
-                    uw1 += uw2[:0:-1]
-                    consumed = True
-                elif uw1_start == uw2_end:
-                    # If the end of this way is the same as the start of the unclosed way
-                    # Prepend this ways nodes with the duplicate coord sliced off
-                    uw1[0:0] = uw2[:-1]
-                    consumed = True
-                elif uw1_start == uw2_start:
-                    # If the start of this way is the same as the start of the unclosed way
-                    # Prepend this ways nodes reversed with the duplicate coord sliced off
-                    uw1[0:0] = uw2[:0:-1]
-                    consumed = True
-
-                # Check if this way has been used
-                if consumed:
-                    unclosed_ways.remove((r2, uw2))
-                    # uw_start/end may have changed by now
-                    if uw1[0] == uw1[-1]:
-                        # Made a closed ring
-                        # Create linear ring from vertices and classify by role
-                        ring = sg.LinearRing(uw1)
-                        if r1 == 'inner':
-                            rel_inner_rings.append(ring)
-                        else:
-                            rel_outer_rings.append(ring)
-                        # Remove from unclosed ways
-                        unclosed_ways.remove((r1, uw1))
-                        if not unclosed_ways:
-                            break
+        rw = [(w['ref'], w['role']) for w in rel['members'] if w['type'] == 'way' and w['ref'] in ways]
+        # Store used ways to prevent double processing later on
+        # Do not pop them out as other relations could be using them!
+        used_ways.update(way_id for way_id, _ in rw)
+        # Find the vertices (AKA nodes) that make up each way
+        rings, unclosed_ways = _assemble_rings([(role, [nodes[i] for i in ways[way_id]]) for way_id, role in rw])
+
+        # Create linear rings from vertices and classify by role
+        rel_outer_rings = [sg.LinearRing(locs) for role, locs in rings if role != 'inner']
+        rel_inner_rings = [sg.LinearRing(locs) for role, locs in rings if role == 'inner']
 
         # Combine outer rings to a single ring
         if len(rel_outer_rings) > 1:
@@ -199,30 +221,87 @@ def query_osm_polygons(osm_tag, bound_poly: sg.Polygon) -> gpd.GeoDataFrame:
         df_list.append(poly)
     # OSM uses Web Mercator so set CRS without projecting as CRS is known
     poly_df = gpd.GeoDataFrame(df_list, columns=['geometry']).set_crs('EPSG:4326')
-    poly_df.drop_duplicates(subset='geometry', inplace=True, ignore_index=True)
-    return poly_df
+    # Compare WKB, as comparing shapely geometries directly is slow
+    return poly_df[~poly_df.geometry.to_wkb().duplicated().values].reset_index(drop=True)
+
+
+OVERPASS_URLS = ["https://overpass.kumi.systems/api/interpreter", "https://lz4.overpass-api.de/api/interpreter",
+                 "https://z.overpass-api.de/api/interpreter", "https://overpass.openstreetmap.ru/api/interpreter",
+                 "https://overpass.openstreetmap.fr/api/interpreter",
+                 "https://overpass.nchc.org.tw/api/interpreter"]
+
+_session_local = threading.local()
+# Long lived workers, so each keeps its pooled session between queries
+_overpass_executor = ThreadPoolExecutor(max_workers=len(OVERPASS_URLS), thread_name_prefix='overpass')
 
 
-def query_request(overpass_url, osm_tag, bounds):
-    headers = {'User-Agent': f'seedpod-ground-risk v0.13.0 (Python 3.8/requests v{requests.__version__};)',
-               'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8'}
-    query = """
+def _get_session() -> requests.Session:
+    # Sessions pool connections to each mirror, but are not guaranteed to be thread safe so keep one per thread
+    session = getattr(_session_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.headers.update(
+            {'User-Agent': f'seedpod-ground-risk v0.13.0 (Python 3.8/requests v{requests.__version__};)',
+             'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8'})
+        _session_local.session = session
+    return session
+
+
+def make_overpass_query(osm_tags, bounds) -> str:
+    """
+    Return an Overpass QL query for all nodes, ways and relations with any of the passed tags
+    :param osm_tags: OSM tag or list of OSM tags to query
+    :param bounds: (south, west, north, east) bounds of the requested area in EPSG:4326 coordinates
+    """
+    if isinstance(osm_tags, str):
+        osm_tags = [osm_tags]
+    statements = ''.join("""
+                  node[{tag}];
+                  way[{tag}];
+                  rel[{tag}];""".format(tag=tag) for tag in osm_tags)
+    return """
               [out:json]
               [timeout:30]
               [bbox:{s_bound}, {w_bound}, {n_bound}, {e_bound}];
-              (
-                  node[{tag}];
-                  way[{tag}];
-                  rel[{tag}];
+              ({statements}
               ); 
               out center body;
               >;
               out center qt;
-          """.format(tag=osm_tag,
+          """.format(statements=statements,
                      s_bound=bounds[0], w_bound=bounds[1], n_bound=bounds[2], e_bound=bounds[3])
-    resp = requests.post(overpass_url, data={'data': query}, headers=headers, verify=False)
-    data = resp.json()
-    return resp, data
+
+
+def race_overpass_mirrors(query: str, urls: List[str] = OVERPASS_URLS, n_racing: int = 2, timeout=(5, 60)) -> dict:
+    """
+    Send an Overpass query to several mirrors at once and return the data from the first successful response.
+    Another mirror is started whenever one fails, until all mirrors have been tried.
+    :param query: Overpass QL query
+    :param urls: Overpass mirror interpreter URLs in order of preference
+    :param n_racing: number of mirrors to query concurrently
+    :param timeout: (connect, read) timeouts in seconds for each mirror
+    :return: decoded JSON data of the first successful response
+    """
+
+    def post(url):
+        resp = _get_session().post(url, data={'data': query}, verify=False, timeout=timeout)
+        if resp.status_code != 200:
+            raise requests.HTTPError(f'{url} returned {resp.status_code}', response=resp)
+        return resp.json()
+
+    pending_urls = list(urls)
+    futures = {_overpass_executor.submit(post, pending_urls.pop(0)) for _ in range(min(n_racing, len(pending_urls)))}
+    while futures:
+        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                # Slower mirrors still in flight are left to finish in the background
+                return future.result()
+            except (requests.RequestException, ValueError) as e:
+                print(e)
+                if pending_urls:
+                    futures.add(_overpass_executor.submit(post, pending_urls.pop(0)))
+    raise ConnectionError('No Overpass mirror returned a successful response')
 
 
 class OSMTagLayer(BlockableDataLayer):
@@ -7,9 +7,12 @@ from holoviews.element import Overlay
 
 from seedpod_ground_risk.layers.annotation_layer import AnnotationLayer
 from seedpod_ground_risk.path_analysis.descent_models.ballistic_model import BallisticModel
+from seedpod_ground_risk.path_analysis.descent_models.descent_cache import descent_cache, aircraft_key
+from seedpod_ground_risk.path_analysis.descent_models.heading_table import HeadingDistributionTable
 from seedpod_ground_risk.path_analysis.harm_models.fatality_model import FatalityModel
 from seedpod_ground_risk.path_analysis.harm_models.strike_model import StrikeModel
-from seedpod_ground_risk.path_analysis.utils import snap_coords_to_grid, bearing_to_angle, velocity_to_kinetic_energy
+from seedpod_ground_risk.path_analysis.utils import snap_coords_to_grid, bearing_to_angle, velocity_to_kinetic_energy, \
+    make_impact_kernel, stamp_kernel
 from seedpod_ground_risk.pathfinding import bresenham
 
 
@@ -48,7 +51,6 @@ class PathAnalysisLayer(AnnotationLayer):
                  resolution=30, **kwargs) -> Overlay:
         import geoviews as gv
         import scipy.stats as ss
-        import joblib as jl
 
         bounds = (raster_data[0]['Longitude'].min(), raster_data[0]['Latitude'].min(),
                   raster_data[0]['Longitude'].max(), raster_data[0]['Latitude'].max())
@@ -67,53 +69,38 @@ class PathAnalysisLayer(AnnotationLayer):
         wind_vel_y = wind_vels * np.sin(wind_dirs)
         wind_vel_x = wind_vels * np.cos(wind_dirs)
 
-        # Create grid on which to evaluate each point of path with its pdf
-        raster_shape = raster_data[1].shape
-        x, y = np.mgrid[0:raster_shape[0], 0:raster_shape[1]]
-        eval_grid = np.vstack((x.ravel(), y.ravel())).T
-
-        def wrap_hdg_dists(alt, vel, hdg, wind_vel_y, wind_vel_x):
-            (mean, cov), v_i, a_i = bm.transform(alt, vel,
-                                                 ss.norm(hdg, np.deg2rad(2)).rvs(samples),
-                                                 wind_vel_y, wind_vel_x,
-                                                 0, 0)
-            return hdg, (mean / resolution, cov / resolution, v_i, a_i)
-
-        njobs = 1 if len(headings) < 3 else -1
-
-        # Hardcode backend to prevent Qt freaking out
-        res = jl.Parallel(n_jobs=njobs, backend='threading', verbose=1)(
-            jl.delayed(wrap_hdg_dists)(alt, vel, hdg, wind_vel_y, wind_vel_x) for hdg in headings)
-        dists_for_hdg = dict(res)
-
-        def point_distr(c):
-            dist_params = dists_for_hdg[c[2]]
-            pdf = np.array(
-                ss.multivariate_normal(dist_params[0] + np.array([c[0], c[1]]), dist_params[1]).pdf(eval_grid),
-                dtype=np.longdouble)
-            return pdf
-
-        sm = StrikeModel(raster_data[1].ravel(), resolution * resolution, self.aircraft.width)
-        fm = FatalityModel(0.5, 1e6, 34)
-        ac_mass = self.aircraft.mass
+        def make_table():
+            return HeadingDistributionTable(bm, alt, vel, wind_vel_y, wind_vel_x, heading_std=np.deg2rad(2))
 
-        def wrap_pipeline(path_point_state):
-            impact_pdf = point_distr(path_point_state)
-            impact_vel = dists_for_hdg[path_point_state[2]][2]
-            impact_angle = dists_for_hdg[path_point_state[2]][3]
-            impact_ke = velocity_to_kinetic_energy(ac_mass, impact_vel)
+        # The descent model is only solved once for all headings along the path
+        # Only the mean states are needed in the key, as the samples are always drawn from the same distributions
+        key = ('path_hdg_table', aircraft_key(self.aircraft), self.alt, self.vel, self.wind_vel, self.wind_dir,
+               samples)
+        hdg_table = descent_cache.get(key, make_table)
+        dists_for_hdg = {}
+        for hdg in headings:
+            mean, cov = hdg_table(hdg)
+            dists_for_hdg[hdg] = (mean / resolution, cov / resolution, hdg_table.v_i, hdg_table.a_i)
 
-            strike_pdf = sm.transform(impact_pdf, impact_angle=impact_angle)
-            fatality_pdf = fm.transform(strike_pdf, impact_ke=impact_ke)
+        raster_shape = raster_data[1].shape
+        # Impact velocity and angle do not depend on heading
+        premult = StrikeModel(raster_data[1], resolution * resolution, self.aircraft.width,
+                              hdg_table.a_i).premult_mat
+        fm = FatalityModel(0.5, 1e6, 34)
+        fatality_prob = fm.transform(1, impact_ke=velocity_to_kinetic_energy(self.aircraft.mass, hdg_table.v_i))
 
-            return fatality_pdf, fatality_pdf.max(), strike_pdf.max()
+        # Grid points are integer indices, so the impact PDF relative to each point only depends on heading
+        kernels_for_hdg = {hdg: make_impact_kernel([dists_for_hdg[hdg][:2]]) for hdg in headings}
 
-        res = jl.Parallel(n_jobs=-1, backend='threading', verbose=1)(
-            jl.delayed(wrap_pipeline)(c) for c in path_grid_points)
-        fatality_pdfs = [r[0] for r in res]
-        # PDFs come out in input order so sorting not required
-        pathwise_fatality_maxs = np.array([r[1] for r in res], dtype=np.longdouble)
-        pathwise_strike_maxs = np.array([r[2] for r in res], dtype=np.longdouble)
+        # Stamp each point's strike PDF onto a single running map over the support of its PDF only
+        strike_map = np.zeros(raster_shape, dtype=float)
+        pathwise_strike_maxs = np.zeros(len(path_grid_points))
+        for idx, (y, x, hdg) in enumerate(path_grid_points):
+            kernel, kernel_centre = kernels_for_hdg[hdg]
+            strike_pdf = stamp_kernel(strike_map, kernel, kernel_centre, (int(y), int(x)), weights=premult)
+            if strike_pdf.size:
+                pathwise_strike_maxs[idx] = strike_pdf.max()
+        pathwise_fatality_maxs = pathwise_strike_maxs * fatality_prob
 
         import matplotlib.pyplot as mpl
         import tempfile
@@ -138,7 +125,7 @@ class PathAnalysisLayer(AnnotationLayer):
         fig.savefig(tmppath)
         subprocess.run("explorer " + tmppath)
 
-        risk_map = np.sum(fatality_pdfs, axis=0).reshape(raster_shape) * self.event_prob
+        risk_map = strike_map * fatality_prob * self.event_prob
 
         risk_raster = gv.Image(risk_map, vdims=['fatality_risk'], bounds=bounds).options(alpha=0.7, cmap='viridis',
                                                                                          tools=['hover'],
@@ -10,6 +10,7 @@ from holoviews.element import Geometry
 from seedpod_ground_risk.layers.annotation_layer import AnnotationLayer
 from seedpod_ground_risk.path_analysis.utils import snap_coords_to_grid
 from seedpod_ground_risk.pathfinding.a_star import RiskGridAStar
+from seedpod_ground_risk.pathfinding.array_a_star import ArrayRiskGridAStar
 from seedpod_ground_risk.pathfinding.algorithm import Algorithm
 from seedpod_ground_risk.pathfinding.environment import GridEnvironment, Node
 from seedpod_ground_risk.pathfinding.heuristic import Heuristic, ManhattanRiskHeuristic
@@ -58,7 +59,7 @@ class PathfindingLayer(AnnotationLayer):
         t0 = time()
         if isinstance(algo, RiskThetaStar):
             self.path = algo.find_path(env, Node((start_y, start_x)), Node((end_y, end_x)), thres=self.thresh)
-        elif isinstance(algo, RiskGridAStar):
+        elif isinstance(algo, (RiskGridAStar, ArrayRiskGridAStar)):
             self.path = algo.find_path(env, Node((start_y, start_x)), Node((end_y, end_x)))
         if self.path is None:
             print("Path not found")
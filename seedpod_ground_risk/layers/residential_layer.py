@@ -6,7 +6,7 @@ import shapely.geometry as sg
 from holoviews.element import Geometry
 from shapely import speedups
 
-from seedpod_ground_risk.data import england_wa_2011_clipped_filepath, density_filepath
+from seedpod_ground_risk.data.census_wards import load_census_wards, CENSUS_WARDS_KEY
 from seedpod_ground_risk.layers.osm_tag_layer import OSMTagLayer
 
 gpd.options.use_pygeos = True  # Use GEOS optimised C++ routines
@@ -71,23 +71,12 @@ class ResidentialLayer(OSMTagLayer):
 
         return gv_polys, raster_grid, gpd.GeoDataFrame(census_df)
 
+    def release_data(self):
+        super().release_data()
+        self._census_wards = gpd.GeoDataFrame()
+
     def ingest_census_data(self) -> NoReturn:
         """
         Ingest Census boundaries and density values and overlay/merge
         """
-        import pandas as pd
-
-        # Import Census boundaries in Ordnance Survey grid and reproject
-        census_wards_df = gpd.read_file(england_wa_2011_clipped_filepath()).drop(
-            ['altname', 'oldcode'], axis=1)
-        if not census_wards_df.crs:
-            census_wards_df = census_wards_df.set_crs('EPSG:27700')
-        census_wards_df = census_wards_df.to_crs('EPSG:4326')
-        # Import census ward densities
-        density_df = pd.read_csv(density_filepath(), header=0)
-        # Scale from hectares to km^2
-        density_df['area'] = density_df['area'] * 0.01
-        density_df['density'] = density_df['density'] / 0.01
-
-        # These share a common UID, so merge together on it and store
-        self._census_wards = census_wards_df.merge(density_df, on='code')
+        self._census_wards = self._acquire_static_data(CENSUS_WARDS_KEY, load_census_wards)
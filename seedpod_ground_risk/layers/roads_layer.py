@@ -1,3 +1,5 @@
+import threading
+from collections import OrderedDict
 from typing import NoReturn, Tuple
 
 import geopandas as gpd
@@ -6,8 +8,8 @@ from holoviews.element import Geometry
 from shapely import geometry as sg
 from shapely import speedups
 
-from seedpod_ground_risk.data import traffic_count_filepath, road_geometry_filepath, \
-    relative_variation_filepath
+from seedpod_ground_risk.data import road_geometry_filepath, relative_variation_filepath
+from seedpod_ground_risk.data.traffic_counts import load_traffic_counts
 from seedpod_ground_risk.layers.data_layer import DataLayer
 
 gpd.options.use_pygeos = True  # Use GEOS optimised C++ routines
@@ -16,21 +18,6 @@ speedups.enable()  # Enable shapely speedups
 DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
 HOURS_OF_DAY = range(24)
 
-TRAFFIC_COUNT_COLUMNS = ['count_point_id', 'year', 'latitude', 'longitude', 'road_name', 'pedal_cycles',
-                         'two_wheeled_motor_vehicles', 'cars_and_taxis', 'buses_and_coaches',
-                         'lgvs', 'all_hgvs', 'all_motor_vehicles']
-
-# https://www.gov.uk/government/statistical-data-sets/nts09-vehicle-mileage-and-occupancy#carvan-occupancy
-# other types plausibly estimated.
-TYPE_OCCUPANCY = {
-    'pedal_cycles': 1,
-    'two_wheeled_motor_vehicles': 1.4,
-    'cars_and_taxis': 1.6,
-    'buses_and_coaches': 40,
-    'lgvs': 1.5,
-    'all_hgvs': 1.6
-}
-
 
 def generate_week_timesteps():
     timestep_index = []
@@ -41,47 +28,40 @@ def generate_week_timesteps():
     return timestep_index
 
 
-# https://gis.stackexchange.com/questions/291247/interchange-y-x-to-x-y-with-geopandas-python-or-qgis
-def swap_xy(geom):
-    if geom.is_empty:
-        return geom
-
-    if geom.has_z:
-        def swap_xy_coords(coords):
-            for x, y, z in coords:
-                yield (y, x, z)
-    else:
-        def swap_xy_coords(coords):
-            for x, y in coords:
-                yield (y, x)
-
-    # Process coordinates from each supported geometry type
-    if geom.type in ('Point', 'LineString', 'LinearRing'):
-        return type(geom)(list(swap_xy_coords(geom.coords)))
-    elif geom.type == 'Polygon':
-        ring = geom.exterior
-        shell = type(ring)(list(swap_xy_coords(ring.coords)))
-        holes = list(geom.interiors)
-        for pos, ring in enumerate(holes):
-            holes[pos] = type(ring)(list(swap_xy_coords(ring.coords)))
-        return type(geom)(shell, holes)
-    elif geom.type.startswith('Multi') or geom.type == 'GeometryCollection':
-        # Recursive call
-        return type(geom)([swap_xy(part) for part in geom.geoms])
-    else:
-        raise ValueError('Type %r not recognized' % geom.type)
+def interpolate_along_line(line, distances: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the points at many distances along a line at once, as `line.interpolate` would for each distance.
+    :param line: LineString or MultiLineString. The parts of a MultiLineString are followed in order
+    :param distances: array of distances along the line
+    :return: tuple of arrays of the x and y coordinates of the points
+    """
+    parts = line.geoms if line.type == 'MultiLineString' else [line]
+    coords = []
+    vertex_distances = []
+    offset = 0
+    for part in parts:
+        part_coords = np.asarray(part.coords)[:, :2]
+        cum_lengths = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(part_coords, axis=0).T))])
+        coords.append(part_coords)
+        vertex_distances.append(offset + cum_lengths)
+        offset += cum_lengths[-1]
+    coords = np.concatenate(coords)
+    vertex_distances = np.concatenate(vertex_distances)
+    distances = np.clip(distances, 0, vertex_distances[-1])
+    return np.interp(distances, vertex_distances, coords[:, 0]), np.interp(distances, vertex_distances, coords[:, 1])
 
 
 class RoadsLayer(DataLayer):
     _traffic_counts: gpd.GeoDataFrame
 
-    def __init__(self, key, **kwargs):
-        from pyproj import Transformer
-
+    def __init__(self, key, max_cached_bounds: int = 4, **kwargs):
+        """
+        :param key: unique key of the layer
+        :param max_cached_bounds: number of bounds to keep interpolated roads for, which are reused for any hour
+        """
         super(RoadsLayer, self).__init__(key)
 
-        self.proj = Transformer.from_crs(27700, 4326, always_xy=True)
-        self.reverse_proj = Transformer.from_crs(4326, 27700, always_xy=True)
+        self._make_transformers()
 
         self.week_timesteps = generate_week_timesteps()
 
@@ -89,32 +69,47 @@ class RoadsLayer(DataLayer):
         self._roads_geometries = gpd.GeoDataFrame()  # Road Geometries in EPSG:27700 coords
         self.relative_variations_flat = gpd.GeoDataFrame()  # Relative traffic variations
 
+        self.max_cached_bounds = max_cached_bounds
+        self._weekly_roads_cache = OrderedDict()  # Interpolated roads by bounds, see `_get_weekly_roads`
+        self._weekly_rasters_cache = OrderedDict()  # Rasters of weekly densities, see `_get_weekly_raster`
+        self._weekly_roads_lock = threading.Lock()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        # Transformers and locks cannot be pickled, so are remade when unpickled
+        for name in ['proj', 'reverse_proj', '_weekly_roads_lock']:
+            del state[name]
+        state['_weekly_roads_cache'] = OrderedDict()
+        state['_weekly_rasters_cache'] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._make_transformers()
+        self._weekly_roads_lock = threading.Lock()
+
+    def _make_transformers(self) -> NoReturn:
+        from pyproj import Transformer
+
+        self.proj = Transformer.from_crs(27700, 4326, always_xy=True)
+        self.reverse_proj = Transformer.from_crs(4326, 27700, always_xy=True)
+
     def preload_data(self) -> NoReturn:
 
         print("Preloading Roads Layer")
-        self._ingest_traffic_counts()
-        self._estimate_road_populations()
-        self._ingest_road_geometries()
-        self._ingest_relative_traffic_variations()
+        # Static data is shared between all roads layers, such as those of each aircraft
+        self._traffic_counts = self._acquire_static_data('roads_traffic_counts', load_traffic_counts)
+        self._roads_geometries = self._acquire_static_data('roads_geometries', self._ingest_road_geometries)
+        self.relative_variations_flat = self._acquire_static_data('roads_relative_variations',
+                                                                  self._ingest_relative_traffic_variations)
 
     def generate(self, bounds_polygon: sg.Polygon, raster_shape: Tuple[int, int], from_cache: bool = False,
                  hour: int = 8, resolution: float = 20, **kwargs) -> \
             Tuple[Geometry, np.ndarray, gpd.GeoDataFrame]:
-        from holoviews.operation.datashader import rasterize
         import geoviews as gv
-        import datashader as ds
         import colorcet
 
-        relative_variation = self.relative_variations_flat[hour]
-
-        roads_gdf = self._interpolate_traffic_counts(bounds_polygon)
-        roads_gdf['population_per_hour'] = roads_gdf['population_per_hour'] * relative_variation
-        roads_gdf['population'] = roads_gdf['population_per_hour'] / 3600
-        roads_gdf['density'] = roads_gdf['population'] / (roads_gdf.geometry.area * 1e-6)  # km^2
-        ln_mask = roads_gdf['density'] > 0
-        roads_gdf.loc[ln_mask, 'ln_density'] = np.log(roads_gdf.loc[ln_mask, 'density'])
-        roads_gdf['ln_density'].fillna(0, inplace=True)
-        roads_gdf = roads_gdf.set_crs('EPSG:27700').to_crs('EPSG:4326')
+        roads_gdf = self._get_hourly_roads(bounds_polygon, hour)
 
         points = gv.Polygons(roads_gdf,
                              kdims=['Longitude', 'Latitude'],
@@ -123,63 +118,117 @@ class RoadsLayer(DataLayer):
             cmap=colorcet.CET_L18,
             color='ln_density',
             line_color='ln_density')
-        bounds = bounds_polygon.bounds
-        raster = rasterize(points, aggregator=ds.mean('density'), width=raster_shape[0], height=raster_shape[1],
-                           x_range=(bounds[1], bounds[3]), y_range=(bounds[0], bounds[2]), dynamic=False)
-        raster_grid = np.copy(list(raster.data.data_vars.items())[0][1].data.astype(np.float))
+        # All densities scale by the same relative variation, so the mean density of each pixel does too
+        raster_grid = self._get_weekly_raster(bounds_polygon, raster_shape) * self.relative_variations_flat[hour]
         return points, raster_grid, gpd.GeoDataFrame(roads_gdf)
 
     def clear_cache(self) -> NoReturn:
+        with self._weekly_roads_lock:
+            self._weekly_roads_cache.clear()
+            self._weekly_rasters_cache.clear()
+
+    def release_data(self) -> NoReturn:
+        super().release_data()
+        self.clear_cache()
         self._traffic_counts = gpd.GeoDataFrame()
         self._roads_geometries = gpd.GeoDataFrame()
+        self.relative_variations_flat = gpd.GeoDataFrame()
 
-    def _ingest_traffic_counts(self) -> NoReturn:
+    def _get_weekly_roads(self, bounds_poly: sg.Polygon) -> gpd.GeoDataFrame:
         """
-        Ingest annualised average daily flow traffic counts
-        Only the latest year of data is used.
+        Return the interpolated roads within bounds in EPSG:4326 coords, with their weekly mean population per hour
+        and area in km^2. These do not depend on the hour, so are cached by bounds.
+        :param bounds_poly: Bounding polygon for roads to interpolate
         """
-        import pandas as pd
-
-        # Ingest raw data
-        counts_df = pd.read_csv(traffic_count_filepath())
-        # Select only desired columns
-        counts_df = counts_df[TRAFFIC_COUNT_COLUMNS]
-        # Groupby year and select out only the latest year
-        latest_counts_df = counts_df.groupby(['year']).get_group(counts_df.year.max())
-        self._traffic_counts = gpd.GeoDataFrame(latest_counts_df,
-                                                geometry=gpd.points_from_xy(
-                                                    latest_counts_df.longitude,
-                                                    latest_counts_df.latitude)).set_crs('EPSG:4326')
-
-    def _estimate_road_populations(self) -> NoReturn:
+        key = bounds_poly.bounds
+        with self._weekly_roads_lock:
+            if key in self._weekly_roads_cache:
+                self._weekly_roads_cache.move_to_end(key)
+                return self._weekly_roads_cache[key]
+
+        roads_gdf = self._interpolate_traffic_counts(bounds_poly)
+        weekly_roads = gpd.GeoDataFrame({'population_per_hour': roads_gdf['population_per_hour'].values,
+                                         'road_name': roads_gdf['road_name'].values,
+                                         'area': roads_gdf.geometry.area.values * 1e-6},  # km^2
+                                        geometry=roads_gdf.geometry.values, crs='EPSG:27700').to_crs('EPSG:4326')
+
+        with self._weekly_roads_lock:
+            self._weekly_roads_cache[key] = weekly_roads
+            while len(self._weekly_roads_cache) > self.max_cached_bounds:
+                self._weekly_roads_cache.popitem(last=False)
+        return weekly_roads
+
+    def _get_weekly_raster(self, bounds_poly: sg.Polygon, raster_shape: Tuple[int, int]) -> np.ndarray:
         """
-        Use estimates of vehicle occupancy based on vehicle type to estimate the population passing each count point.
+        Return the raster grid of the weekly mean density of the roads within bounds. This does not depend on the hour,
+        so is cached by bounds and raster shape.
+        :param bounds_poly: Bounding polygon for roads to interpolate
+        :param raster_shape: shape of the raster
         """
+        from holoviews.operation.datashader import rasterize
+        import geoviews as gv
+        import datashader as ds
 
-        def calc_population(row):
-            pop = 0
-            for k, v in TYPE_OCCUPANCY.items():
-                pop += row[k] * v
-            return pop
+        key = (bounds_poly.bounds, tuple(raster_shape))
+        with self._weekly_roads_lock:
+            if key in self._weekly_rasters_cache:
+                self._weekly_rasters_cache.move_to_end(key)
+                return self._weekly_rasters_cache[key]
+
+        weekly_roads = self._get_weekly_roads(bounds_poly)
+        weekly_density = gpd.GeoDataFrame(
+            {'density': weekly_roads['population_per_hour'].values / 3600 / weekly_roads['area'].values},
+            geometry=weekly_roads.geometry.values, crs=weekly_roads.crs)
+        polys = gv.Polygons(weekly_density, kdims=['Longitude', 'Latitude'], vdims=['density'])
+        bounds = bounds_poly.bounds
+        raster = rasterize(polys, aggregator=ds.mean('density'), width=raster_shape[0], height=raster_shape[1],
+                           x_range=(bounds[1], bounds[3]), y_range=(bounds[0], bounds[2]), dynamic=False)
+        weekly_raster = np.copy(list(raster.data.data_vars.items())[0][1].data.astype(float))
 
-        self._traffic_counts['population_per_hour'] = self._traffic_counts.apply(calc_population, axis=1) / 24
+        with self._weekly_roads_lock:
+            self._weekly_rasters_cache[key] = weekly_raster
+            while len(self._weekly_rasters_cache) > self.max_cached_bounds:
+                self._weekly_rasters_cache.popitem(last=False)
+        return weekly_raster
 
-    def _ingest_relative_traffic_variations(self):
+    def _get_hourly_roads(self, bounds_poly: sg.Polygon, hour: int) -> gpd.GeoDataFrame:
+        """
+        Return the interpolated roads within bounds in EPSG:4326 coords, with their population and density at an hour
+        of the week
+        :param bounds_poly: Bounding polygon for roads to interpolate
+        :param hour: hour of the week, from Monday 00:00
+        """
+        weekly_roads = self._get_weekly_roads(bounds_poly)
+        population_per_hour = weekly_roads['population_per_hour'].values * self.relative_variations_flat[hour]
+        population = population_per_hour / 3600
+        density = population / weekly_roads['area'].values
+        # Build a new frame rather than assigning to a copy, so the cached roads are never modified
+        return gpd.GeoDataFrame({'population_per_hour': population_per_hour,
+                                 'road_name': weekly_roads['road_name'].values,
+                                 'population': population,
+                                 'density': density,
+                                 'ln_density': np.log(np.where(density > 0, density, 1))},
+                                geometry=weekly_roads.geometry.values, crs=weekly_roads.crs)
+
+    @staticmethod
+    def _ingest_relative_traffic_variations():
         import pandas as pd
 
         # Ingest data, ignoring header and footer info
         relative_variations_df = pd.read_excel(relative_variation_filepath(), engine='odf',
                                                header=5, skipfooter=8)
         # Flatten into continuous list of hourly variations for the week
-        self.relative_variations_flat = (relative_variations_df.iloc[:, 1:] / 100).melt()['value']
+        return (relative_variations_df.iloc[:, 1:] / 100).melt()['value']
 
-    def _ingest_road_geometries(self) -> NoReturn:
+    @staticmethod
+    def _ingest_road_geometries() -> gpd.GeoDataFrame:
         """
         Ingest simplified road geometries in EPSG:27700 coords
         """
-        self._roads_geometries = gpd.read_file(road_geometry_filepath()).rename(columns={'CP_Number': 'count_point_id'})
-        if not self._roads_geometries.crs:
-            self._roads_geometries = self._roads_geometries.set_crs('EPSG:27700')
+        roads_geometries = gpd.read_file(road_geometry_filepath()).rename(columns={'CP_Number': 'count_point_id'})
+        if not roads_geometries.crs:
+            roads_geometries = roads_geometries.set_crs('EPSG:27700')
+        return roads_geometries
 
     def _interpolate_traffic_counts(self, bounds_poly: sg.Polygon, resolution: int = 20) -> gpd.GeoDataFrame:
         """
@@ -188,74 +237,68 @@ class RoadsLayer(DataLayer):
         :param bounds_poly: Bounding polygon for roads to interpolate
         :param resolution: The distance in metres between interpolation points along a road
         """
-        import numpy as np
         import shapely.ops as so
-        import pandas as pd
 
         b = bounds_poly.bounds
         bounds = [0] * 4
         bounds[0], bounds[1] = self.reverse_proj.transform(b[1], b[0])
         bounds[2], bounds[3] = self.reverse_proj.transform(b[3], b[2])
-        unique_road_names = self._roads_geometries.cx[bounds[0]:bounds[2], bounds[1]:bounds[3]]['RoadNumber'].unique()
-
-        all_road_gdfs = []
-        for road_name in unique_road_names:
-            if road_name.startswith('M'):
-                road_width = 22
-            else:
-                road_width = 14.6
-            # Get the line segments that make up the road
-            road_segments = self._roads_geometries[self._roads_geometries['RoadNumber'] == road_name].cx[
-                            bounds[0]:bounds[2], bounds[1]:bounds[3]]
-            # Get all counts associated with this road
-            counts = self._traffic_counts.loc[self._traffic_counts['road_name'] == road_name]
-            # Iterate over all road segments
-            # Add all road segment coords to flat list of all road coords
-            all_segments = []
-            all_segments_append = all_segments.append
-
-            flat_proj = [(0, 0)]  # A 1D projection of the road as a line in form (length_coord, value)
-            flat_proj_append = flat_proj.append
-            carried_length = 0  # Holder for any carried over road length if a segment is missing a counter
-            for _, seg in road_segments.iterrows():
-                # Flip the coords around for folium
-                coords = np.array(seg['geometry'].coords)[:, [1, 0]]
-                all_segments_append(coords)
-                # Lookup ID of counter on this segment of road
-                pop = counts.loc[counts['count_point_id'] == seg['count_point_id']]['population_per_hour']
-                # Check if counter actually exists on this segment
-                if pop.size > 0:
-                    # If exists append and accumulate this segments length onto
-                    #  the 1D projection of this road with the pop/hr value
-                    flat_proj_append((seg['geometry'].length + flat_proj[-1][0] + carried_length, pop.item()))
-                    carried_length = 0
-                else:
-                    # If not, carry the length of this segment in the hope the next one will have a counter!
-                    carried_length += seg['geometry'].length
-            flat_proj = np.array(flat_proj)
-            road_ls = swap_xy(so.linemerge(all_segments))  # Stitch the line segments together
-            road_width_buffer_gdf = gpd.GeoDataFrame(geometry=[road_ls.buffer(road_width)])
-            road_length = flat_proj[-1, 0]
+        road_segments = self._roads_geometries.cx[bounds[0]:bounds[2], bounds[1]:bounds[3]]
+        if road_segments.empty:
+            return gpd.GeoDataFrame({'population_per_hour': [], 'road_name': []}, geometry=[])
+
+        # Join the count of the counter on each segment, if it has one. A left join keeps segments in order along roads
+        counts = self._traffic_counts[['road_name', 'count_point_id', 'population_per_hour']] \
+            .drop_duplicates(['road_name', 'count_point_id'])
+        road_segments = road_segments[['RoadNumber', 'count_point_id', 'geometry']] \
+            .merge(counts, how='left', left_on=['RoadNumber', 'count_point_id'],
+                   right_on=['road_name', 'count_point_id'])
+        # A 1D projection of each road as a line. Segments without a counter carry their length over to the next
+        # segment with one, so each counter is at the total length of all segments up to and including its own
+        road_segments['length_coord'] = road_segments.geometry.length.values
+        road_segments['length_coord'] = road_segments.groupby('RoadNumber', sort=False)['length_coord'].cumsum()
+
+        road_lines = []
+        road_widths = []
+        road_names = []
+        all_xs, all_ys, all_pops = [], [], []
+        for road_name, segments in road_segments.groupby('RoadNumber', sort=False):
+            counted = segments[segments['population_per_hour'].notnull()]
+            flat_proj_length = np.concatenate([[0], counted['length_coord'].values])
+            flat_proj_pop = np.concatenate([[0], counted['population_per_hour'].values])
+            road_length = flat_proj_length[-1]
             # Generate some intermediate points to interpolate on
-            coord_spacing = np.linspace(0, road_length,
-                                        int(road_length / resolution))
-            # Interpolate linearly on the 1D projection of the road to estimate the interstitial values
-            interp_flat_proj = np.interp(coord_spacing, flat_proj[:, 0], flat_proj[:, 1])
-
-            point_polys = []
-            pops = []
+            coord_spacing = np.linspace(0, road_length, int(road_length / resolution))
+            if coord_spacing.size == 0:
+                continue
+            road_ls = so.linemerge(list(segments.geometry))  # Stitch the line segments together
+            road_lines.append(road_ls)
+            road_widths.append(22 if road_name.startswith('M') else 14.6)
+            road_names.append(road_name)
             # Recover the true road geometry along with the interpolated values
-            for idx, mark in enumerate(coord_spacing):
-                c = road_ls.interpolate(mark)
-                point_poly = c.buffer(resolution / 2, cap_style=sg.CAP_STYLE.square)
-                point_polys.append(point_poly)
-                pops.append(interp_flat_proj[idx])
-
-            road_gdf = gpd.GeoDataFrame(
-                {'geometry': point_polys, 'population_per_hour': pops, 'road_name': len(pops) * [road_name]})
-            if not road_gdf.empty:
-                road_gdf = gpd.overlay(road_gdf, road_width_buffer_gdf, how='intersection')
-                all_road_gdfs.append(road_gdf)
-
-        roads_gdf = pd.concat(all_road_gdfs)
+            xs, ys = interpolate_along_line(road_ls, coord_spacing)
+            all_xs.append(xs)
+            all_ys.append(ys)
+            # Interpolate linearly on the 1D projection of the road to estimate the interstitial values
+            all_pops.append(np.interp(coord_spacing, flat_proj_length, flat_proj_pop))
+
+        if not road_lines:
+            return gpd.GeoDataFrame({'population_per_hour': [], 'road_name': []}, geometry=[])
+
+        # Index of the road of each interpolation point
+        point_roads = np.repeat(np.arange(len(road_lines)), [xs.size for xs in all_xs])
+        point_polys = gpd.GeoSeries(gpd.points_from_xy(np.concatenate(all_xs), np.concatenate(all_ys))) \
+            .buffer(resolution / 2, cap_style=sg.CAP_STYLE.square)
+        roads_gdf = gpd.GeoDataFrame({'population_per_hour': np.concatenate(all_pops),
+                                      'road_name': np.array(road_names, dtype=object)[point_roads]},
+                                     geometry=point_polys)
+
+        # Clip the point squares to the width of their road. As they are centred on the road, only squares with
+        # corners further from their centre than the road width can extend past it
+        clip_mask = resolution / np.sqrt(2) > np.array(road_widths)[point_roads]
+        if clip_mask.any():
+            road_buffers = gpd.GeoSeries(road_lines).buffer(np.array(road_widths))
+            clip_buffers = gpd.GeoSeries(road_buffers.values[point_roads[clip_mask]], index=roads_gdf.index[clip_mask])
+            roads_gdf.loc[clip_mask, 'geometry'] = roads_gdf.geometry[clip_mask].intersection(clip_buffers)
+            roads_gdf = roads_gdf[~roads_gdf.geometry.is_empty].reset_index(drop=True)
         return roads_gdf
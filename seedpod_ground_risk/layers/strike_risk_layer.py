@@ -3,7 +3,6 @@ import os
 import casex
 import geoviews as gv
 import numpy as np
-import scipy.stats as ss
 from numba import cuda, njit, float64, prange
 
 from seedpod_ground_risk.core.utils import remove_raster_nans
@@ -11,9 +10,10 @@ from seedpod_ground_risk.layers.blockable_data_layer import BlockableDataLayer
 from seedpod_ground_risk.layers.roads_layer import RoadsLayer
 from seedpod_ground_risk.layers.temporal_population_estimate_layer import TemporalPopulationEstimateLayer
 from seedpod_ground_risk.path_analysis.descent_models.ballistic_model import BallisticModel
+from seedpod_ground_risk.path_analysis.descent_models.descent_cache import make_impact_dists
 from seedpod_ground_risk.path_analysis.descent_models.glide_model import GlideDescentModel
 from seedpod_ground_risk.path_analysis.harm_models.strike_model import StrikeModel
-from seedpod_ground_risk.path_analysis.utils import bearing_to_angle, velocity_to_kinetic_energy
+from seedpod_ground_risk.path_analysis.utils import velocity_to_kinetic_energy, make_impact_kernel
 from seedpod_ground_risk.ui_resources.aircraft_options import AIRCRAFT_LIST
 
 
@@ -78,7 +78,86 @@ def wrap_row_pipeline(row, shape, padded_pdf, padded_centre, sm):
     ]
 
 
+# ~2sec for 567,630 elements
+def wrap_pipeline_fft(pdf, pdf_centre, sm_premult):
+    """
+    Convolve the impact PDF with the premultiplied strike model matrix in the frequency domain.
+
+    This is numerically equivalent to `wrap_all_pipeline`, but is O(N log N) rather than O(N^2) in raster cells.
+    Overlap-add is used, so this also stays efficient when the PDF is much smaller than the raster.
+
+    :param pdf: impact PDF grid
+    :param pdf_centre: (y, x) index into `pdf` of the event location
+    :param sm_premult: premultiplied strike model matrix
+    :return: risk map with the same shape as `sm_premult`
+    """
+    from scipy.signal import oaconvolve
+
+    nr, nc = sm_premult.shape
+    pcy, pcx = pdf_centre
+    # Flipping the PDF turns the convolution into the correlation computed by the sliding window kernels
+    full = oaconvolve(sm_premult, pdf[::-1, ::-1], mode='full')
+    start_y = pdf.shape[0] - 1 - pcy
+    start_x = pdf.shape[1] - 1 - pcx
+    out = full[start_y:start_y + nr, start_x:start_x + nc]
+    # FFT round off leaves tiny negative values, which would otherwise be read as blocked cells downstream
+    return np.clip(out, 0, None)
+
+
+def convolve_strike_pdf(pdf, pdf_centre, sm_premult, backend='fft'):
+    """
+    Compute the strike risk map from the impact PDF and the premultiplied strike model matrix.
+
+    The PDF can be of any shape, usually a compact kernel from `make_impact_kernel`. Any part of it further than the
+    raster extent from the event location cannot contribute to the result and is ignored.
+
+    :param pdf: impact PDF grid
+    :param pdf_centre: (y, x) index into `pdf` of the event location
+    :param sm_premult: premultiplied strike model matrix
+    :param backend: one of 'fft', 'numba' or 'cuda'. 'cuda' falls back to 'numba' if the CUDA toolkit is not found
+    :return: risk map with the same shape as `sm_premult`
+    """
+    if backend == 'fft':
+        return wrap_pipeline_fft(pdf, pdf_centre, sm_premult)
+    elif backend not in ['numba', 'cuda']:
+        raise ValueError(f'Unknown convolution backend {backend}')
+
+    raster_shape = sm_premult.shape
+    # The sliding window kernels need the PDF to cover every offset between any two raster cells
+    padded_pdf = np.zeros(((raster_shape[0] * 2) - 1, (raster_shape[1] * 2) - 1))
+    padded_centre_y, padded_centre_x = raster_shape[0] - 1, raster_shape[1] - 1
+    lo_y = max(-pdf_centre[0], -padded_centre_y)
+    hi_y = min(pdf.shape[0] - pdf_centre[0], raster_shape[0])
+    lo_x = max(-pdf_centre[1], -padded_centre_x)
+    hi_x = min(pdf.shape[1] - pdf_centre[1], raster_shape[1])
+    padded_pdf[padded_centre_y + lo_y:padded_centre_y + hi_y, padded_centre_x + lo_x:padded_centre_x + hi_x] = \
+        pdf[pdf_centre[0] + lo_y:pdf_centre[0] + hi_y, pdf_centre[1] + lo_x:pdf_centre[1] + hi_x]
+    # Check if CUDA toolkit available through env var otherwise fallback to CPU bound numba version
+    if backend == 'cuda' and not os.getenv('CUDA_HOME'):
+        print('CUDA NOT found, falling back to Numba JITed CPU code')
+        backend = 'numba'
+
+    if backend == 'numba':
+        # Leaving parallelisation to Numba seems to be faster
+        risk_map = wrap_all_pipeline(raster_shape, padded_pdf, padded_centre_y, padded_centre_x, sm_premult)
+
+    else:
+
+        risk_map = np.zeros(raster_shape, dtype=float)
+        threads_per_block = (32, 32)  # 1024 max per block
+        blocks_per_grid = (
+            int(np.ceil(raster_shape[1] / threads_per_block[1])),
+            int(np.ceil(raster_shape[0] / threads_per_block[0]))
+        )
+        print('CUDA found, using config <<<' + str(blocks_per_grid) + ',' + str(threads_per_block) + '>>>')
+        wrap_pipeline_cuda[blocks_per_grid, threads_per_block](raster_shape, padded_pdf, padded_centre_y,
+                                                               padded_centre_x, sm_premult, risk_map)
+    return risk_map
+
+
 class StrikeRiskLayer(BlockableDataLayer):
+    raster_north_up = True
+
     def __init__(self, key, colour: str = None, blocking=False, buffer_dist=0,
                  ac: dict = AIRCRAFT_LIST['Default'],
                  wind_vel: float = 0, wind_dir: float = 0):
@@ -108,9 +187,15 @@ class StrikeRiskLayer(BlockableDataLayer):
         self.bm = BallisticModel(self.aircraft)
         self.gm = GlideDescentModel(self.aircraft)
 
+        self._impact_kernels = {}  # Impact kernels by sigma cutoff and resolution, see `_get_impact_kernel`
+
     def preload_data(self):
         [layer.preload_data() for layer in self._layers]
 
+    def release_data(self):
+        super().release_data()
+        [layer.release_data() for layer in self._layers]
+
     def generate(self, bounds_polygon, raster_shape, resolution=30, hour: int = 8, **kwargs):
         risk_map, _ = self.make_strike_map(bounds_polygon, hour, raster_shape, resolution)
 
@@ -137,65 +222,49 @@ class StrikeRiskLayer(BlockableDataLayer):
 
         return risk_raster, risk_map, None
 
-    def make_strike_map(self, bounds_polygon, hour, raster_shape, resolution):
+    def make_strike_map(self, bounds_polygon, hour, raster_shape, resolution, backend: str = 'fft',
+                        sigma_cutoff: float = 5):
         generated_layers = [
             layer.generate(bounds_polygon, raster_shape, hour=hour, resolution=resolution) for layer in self._layers]
         raster_grid = np.flipud(np.sum(
             [remove_raster_nans(res[1]) for res in generated_layers if
              res[1] is not None],
             axis=0))
-        raster_shape = raster_grid.shape
-        x, y = np.mgrid[0:raster_shape[0], 0:raster_shape[1]]
-        eval_grid = np.vstack((x.ravel(), y.ravel())).T
-        samples = 5000
-        # Conjure up our distributions for various things
-        alt = ss.norm(self.alt, 5).rvs(samples)
-        vel = ss.norm(self.vel, 2.5).rvs(samples)
-        wind_vels = ss.norm(self.wind_vel, 1).rvs(samples)
-        wind_dirs = bearing_to_angle(ss.norm(self.wind_dir, np.deg2rad(5)).rvs(samples))
-        wind_vel_y = wind_vels * np.sin(wind_dirs)
-        wind_vel_x = wind_vels * np.cos(wind_dirs)
-        (bm_mean, bm_cov), v_ib, a_ib = self.bm.transform(alt, vel,
-                                                          ss.uniform(0, 360).rvs(samples),
-                                                          wind_vel_y, wind_vel_x,
-                                                          0, 0)
-        (gm_mean, gm_cov), v_ig, a_ig = self.gm.transform(alt, vel,
-                                                          ss.uniform(0, 360).rvs(samples),
-                                                          wind_vel_y, wind_vel_x,
-                                                          0, 0)
-        sm_b = StrikeModel(raster_grid, resolution ** 2, self.aircraft.width, a_ib)
-        sm_g = StrikeModel(raster_grid, resolution ** 2, self.aircraft.width, a_ig)
+        pdf, pdf_centre, (a_ib, a_ig), impact_kes = self._get_impact_kernel(sigma_cutoff, resolution)
+        # Only the population, and so the strike model, changes with the hour.
+        # The kernel is the probability mass of impact in each cell, so weighting it by the lethal area times the
+        # people per m^2 gives the expected number of people struck. This does not depend on the cell size, so no
+        # pixel area is divided out and maps generated at different resolutions agree.
+        sm_b = StrikeModel(raster_grid, 1, self.aircraft.width, a_ib)
+        sm_g = StrikeModel(raster_grid, 1, self.aircraft.width, a_ig)
         premult = sm_b.premult_mat + sm_g.premult_mat
-        offset_y, offset_x = raster_shape[0] // 2, raster_shape[1] // 2
-        bm_pdf = ss.multivariate_normal(bm_mean + np.array([offset_y, offset_x]), bm_cov).pdf(eval_grid)
-        gm_pdf = ss.multivariate_normal(gm_mean + np.array([offset_y, offset_x]), gm_cov).pdf(eval_grid)
-        pdf = bm_pdf + gm_pdf
-        pdf = pdf.reshape(raster_shape)
-        padded_pdf = np.zeros(((raster_shape[0] * 3) + 1, (raster_shape[1] * 3) + 1))
-        padded_pdf[raster_shape[0]:raster_shape[0] * 2, raster_shape[1]:raster_shape[1] * 2] = pdf
-        padded_pdf = padded_pdf * self.event_prob
-        padded_centre_y, padded_centre_x = raster_shape[0] + offset_y, raster_shape[1] + offset_x
-        # Check if CUDA toolkit available through env var otherwise fallback to CPU bound numba version
-        if not os.getenv('CUDA_HOME'):
-            print('CUDA NOT found, falling back to Numba JITed CPU code')
-            # Leaving parallelisation to Numba seems to be faster
-            risk_map = wrap_all_pipeline(raster_shape, padded_pdf, padded_centre_y, padded_centre_x, premult)
-
-        else:
-
-            risk_map = np.zeros(raster_shape, dtype=float)
-            threads_per_block = (32, 32)  # 1024 max per block
-            blocks_per_grid = (
-                int(np.ceil(raster_shape[1] / threads_per_block[1])),
-                int(np.ceil(raster_shape[0] / threads_per_block[0]))
-            )
-            print('CUDA found, using config <<<' + str(blocks_per_grid) + ',' + str(threads_per_block) + '>>>')
-            wrap_pipeline_cuda[blocks_per_grid, threads_per_block](raster_shape, padded_pdf, padded_centre_y,
-                                                                   padded_centre_x, premult, risk_map)
-        ac_mass = self.aircraft.mass
-        impact_kes = (velocity_to_kinetic_energy(ac_mass, v_ib), velocity_to_kinetic_energy(ac_mass, v_ig))
+        risk_map = convolve_strike_pdf(pdf, pdf_centre, premult, backend=backend)
 
         return risk_map, impact_kes
 
+    def _get_impact_kernel(self, sigma_cutoff: float, resolution: float):
+        """
+        Return the impact kernel scaled by the event probability, its centre, the impact angles and the impact kinetic
+        energies. These only depend on the aircraft and flight state, so are cached by sigma cutoff and resolution.
+        """
+        kernel_key = sigma_cutoff, resolution
+        if kernel_key not in self._impact_kernels:
+            dists, (v_ib, v_ig), impact_angles = make_impact_dists(self.aircraft, self.alt, self.vel, self.wind_vel,
+                                                                   self.wind_dir)
+            # Scale the distributions from metres to cells. The variance of a uniform distribution over a cell is
+            # added, so distributions narrower than a cell are spread over the cells they overlap
+            cell_dists = [(mean / resolution, cov / resolution ** 2 + np.eye(2) / 12) for mean, cov in dists]
+            pdf, pdf_centre = make_impact_kernel(cell_dists, sigma_cutoff=sigma_cutoff, normalise=True)
+            ac_mass = self.aircraft.mass
+            impact_kes = (velocity_to_kinetic_energy(ac_mass, v_ib), velocity_to_kinetic_energy(ac_mass, v_ig))
+            self._impact_kernels[kernel_key] = pdf * self.event_prob, pdf_centre, impact_angles, impact_kes
+        return self._impact_kernels[kernel_key]
+
     def clear_cache(self):
-        pass
+        self._impact_kernels = {}
+        [layer.clear_cache() for layer in self._layers]
+
+    @property
+    def cache_key(self):
+        return (type(self).__name__, self.key, self.aircraft.width, self.aircraft.length, self.aircraft.mass, self.alt,
+                self.vel, self.wind_vel, self.wind_dir, self.event_prob, self.buffer_dist)
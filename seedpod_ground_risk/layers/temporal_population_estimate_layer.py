@@ -1,11 +1,13 @@
+import threading
+from collections import OrderedDict
 from typing import NoReturn
 
 import geopandas as gpd
 
-from seedpod_ground_risk.data import england_wa_2011_clipped_filepath, nhaps_data_filepath, \
-    density_filepath
+from seedpod_ground_risk.data import nhaps_data_filepath
+from seedpod_ground_risk.data.census_wards import load_census_wards, CENSUS_WARDS_KEY
 from seedpod_ground_risk.layers.blockable_data_layer import BlockableDataLayer
-from seedpod_ground_risk.layers.osm_tag_layer import query_osm_polygons
+from seedpod_ground_risk.layers.osm_tag_layer import query_osm_polygons_batch
 
 nhaps_category_groupings = [
     [0, 1],
@@ -23,12 +25,36 @@ nhaps_group_tags = [
 ]
 
 
+def _read_nhaps_proportions():
+    import pandas as pd
+    return pd.read_json(nhaps_data_filepath())
+
+
 class TemporalPopulationEstimateLayer(BlockableDataLayer):
 
-    def __init__(self, key, colour: str = None, blocking=False, buffer_dist=0):
+    def __init__(self, key, colour: str = None, blocking=False, buffer_dist=0, max_cached_bounds: int = 4):
+        """
+        :param max_cached_bounds: number of bounds to keep population groups and their rasters for, which are reused
+         for any hour
+        """
         super().__init__(key, colour, blocking, buffer_dist)
         delattr(self, '_colour')
 
+        self.max_cached_bounds = max_cached_bounds
+        self._groups_cache = OrderedDict()  # Population groups by bounds and raster shape, see `_get_population_groups`
+        self._groups_lock = threading.Lock()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        # Locks cannot be pickled, so are remade when unpickled
+        del state['_groups_lock']
+        state['_groups_cache'] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._groups_lock = threading.Lock()
+
     def preload_data(self):
         self._ingest_census_data()
         self._ingest_nhaps_proportions()
@@ -37,14 +63,72 @@ class TemporalPopulationEstimateLayer(BlockableDataLayer):
         import pandas as pd
         import numpy as np
         import geoviews as gv
-        from copy import deepcopy
-        from holoviews.operation.datashader import rasterize
         import colorcet
-        import datashader as ds
+
+        group_gdfs, group_rasters = self._get_population_groups(bounds_polygon, raster_shape)
+
+        if len(group_gdfs) > 1:
+            hour_categories = self.nhaps_df.iloc[:, hour % 24]
+            group_proportions = [hour_categories.iloc[categories].sum() for categories in nhaps_category_groupings]
+        else:
+            # Too few people for the NHAPS proportions, so the census densities are used as is
+            group_proportions = [1]
+
+        # Densities of each group scale with their proportion, so the rasterised maximum of all groups is the maximum
+        # of the scaled rasters of each group
+        raster_grid = None
+        nhaps_category_gdfs = []
+        for group_gdf, group_raster, group_proportion in zip(group_gdfs, group_rasters, group_proportions):
+            scaled_raster = group_raster * group_proportion
+            raster_grid = scaled_raster if raster_grid is None else np.fmax(raster_grid, scaled_raster)
+
+            # Build new frames rather than assigning to copies, so the cached groups are never modified
+            density = group_gdf['density'].values * group_proportion
+            nhaps_category_gdfs.append(
+                gpd.GeoDataFrame({'population': group_gdf['population'].values * group_proportion,
+                                  'density': density,
+                                  'ln_density': np.log(density)},
+                                 geometry=group_gdf.geometry.values, crs='EPSG:4326'))
+
+        df = gpd.GeoDataFrame(pd.concat(nhaps_category_gdfs, ignore_index=True), crs='EPSG:4326')
+        # Construct the GeoViews Polygons
+        gv_polys = gv.Polygons(df, kdims=['Longitude', 'Latitude'],
+                               vdims=['population', 'ln_density', 'density']) \
+            .opts(color='ln_density',
+                  cmap=colorcet.CET_L18, alpha=0.6 if len(group_gdfs) > 1 else 0.8,
+                  colorbar=True, colorbar_opts={'title': 'Log Population Density [ln(people/km^2)]'},
+                  show_legend=False,
+                  line_color='ln_density')
+
+        return gv_polys, raster_grid, df
+
+    def _get_population_groups(self, bounds_polygon, raster_shape):
+        """
+        Return the polygons of each NHAPS population group within bounds with their densities and populations as if
+        all people were in that group, along with the rasters of these densities. These do not depend on the hour, so
+        are cached by bounds and raster shape.
+
+        If the population within bounds is too small for the NHAPS proportions to be valid, the census wards
+        intersecting residential areas are returned as a single group instead.
+
+        :param bounds_polygon: the bounding polygon
+        :param raster_shape: shape of the rasters
+        :return: tuple of list of GeoDataFrames of each group and list of their raster grids
+        """
+        import pandas as pd
+
+        key = (bounds_polygon.bounds, tuple(raster_shape))
+        with self._groups_lock:
+            if key in self._groups_cache:
+                self._groups_cache.move_to_end(key)
+                return self._groups_cache[key]
 
         bounds = bounds_polygon.bounds
         # Hardcode residential tag in as this is always the first OSM query made to find the total area population
-        residential_df = query_osm_polygons('landuse=residential', bounds_polygon)
+        # All tags are fetched together in one request
+        all_tags = ['landuse=residential'] + [tag for tags in nhaps_group_tags[1:] for tag in tags]
+        tag_dfs = query_osm_polygons_batch(all_tags, bounds_polygon)
+        residential_df = tag_dfs['landuse=residential']
         bounded_census_wards = self._census_wards.cx[bounds[1]:bounds[3], bounds[0]:bounds[2]]
 
         # Find landuse polygons intersecting/within census wards and merge left
@@ -58,114 +142,59 @@ class TemporalPopulationEstimateLayer(BlockableDataLayer):
         census_df['population'] = census_df['density'] * census_reproj_areas
         total_population = census_df['population'].sum()
 
-        df = None
-
+        group_gdfs = [census_df]
         # Ensure we have a large enough population for this approximation to be valid
         if total_population > 200000:
-            hour_categories = self.nhaps_df.iloc[:, hour % 24]
-            nhaps_category_gdfs = []
-
-            for idx, categories in enumerate(nhaps_category_groupings):
-                group_proportion = hour_categories.iloc[categories].sum()
-                group_population = total_population * group_proportion
-
-                # Residential areas are handled separately as they depend upon census data
-                # Otherwise, they would become uniform density, when we have census data providing us (unscaled) densities
-                if idx == 0:
-                    group_gdf = deepcopy(census_df)
-                    group_gdf['population'] = group_gdf['population'] * group_proportion
-                    group_gdf['density'] = group_gdf['population'] / census_reproj_areas
-                    group_gdf['ln_density'] = np.log(group_gdf['density'])
-                else:
-                    group_gdfs = [query_osm_polygons(tag, bounds_polygon) for tag in nhaps_group_tags[idx]]
-                    group_gdf = gpd.GeoDataFrame(pd.concat(group_gdfs, ignore_index=True), crs='EPSG:4326')
-                    areas = group_gdf.to_crs(epsg=3395).geometry.area * 1e-6  # km^2
-                    group_density = group_population / areas.sum()
-                    group_gdf['density'] = group_density
-                    group_gdf['ln_density'] = np.log(group_gdf['density'])
-                    group_gdf['population'] = group_density * areas
-                nhaps_category_gdfs.append(group_gdf)
-
-            nhaps_category_gdf = gpd.GeoDataFrame(pd.concat(nhaps_category_gdfs, ignore_index=True), crs='EPSG:4326')
-            # Construct the GeoViews Polygons
-            gv_polys = gv.Polygons(nhaps_category_gdf, kdims=['Longitude', 'Latitude'],
-                                   vdims=['population', 'ln_density', 'density']) \
-                .opts(color='ln_density',
-                      cmap=colorcet.CET_L18, alpha=0.6,
-                      colorbar=True, colorbar_opts={'title': 'Log Population Density [ln(people/km^2)]'},
-                      show_legend=False,
-                      line_color='ln_density')
-
-            if self.buffer_dist > 0:
-                buffered_df = deepcopy(nhaps_category_gdf)
-                buffered_df.geometry = buffered_df.to_crs('EPSG:27700') \
-                    .buffer(self.buffer_dist).to_crs('EPSG:4326')
-                buffered_polys = gv.Polygons(buffered_df, kdims=['Longitude', 'Latitude'], vdims=['density'])
-                raster = rasterize(buffered_polys, aggregator=ds.max('density'), width=raster_shape[0],
-                                   height=raster_shape[1], x_range=(bounds[1], bounds[3]),
-                                   y_range=(bounds[0], bounds[2]),
-                                   dynamic=False)
-            else:
-                raster = rasterize(gv_polys, aggregator=ds.max('density'), width=raster_shape[0],
-                                   height=raster_shape[1],
-                                   x_range=(bounds[1], bounds[3]), y_range=(bounds[0], bounds[2]), dynamic=False)
-            df = nhaps_category_gdf
-        else:
-            census_df['ln_density'] = np.log(census_df['density'])
-            # Construct the GeoViews Polygons
-            gv_polys = gv.Polygons(census_df, kdims=['Longitude', 'Latitude'],
-                                   vdims=['population', 'ln_density', 'density']) \
-                .opts(color='ln_density',
-                      cmap=colorcet.CET_L18, alpha=0.8,
-                      colorbar=True, colorbar_opts={'title': 'Log Population Density [ln(people/km^2)]'},
-                      show_legend=False,
-                      line_color='ln_density')
-
-            if self.buffer_dist > 0:
-                buffered_df = deepcopy(census_df)
-                buffered_df.geometry = buffered_df.to_crs('EPSG:27700') \
-                    .buffer(self.buffer_dist).to_crs('EPSG:4326')
-                buffered_polys = gv.Polygons(buffered_df, kdims=['Longitude', 'Latitude'], vdims=['name', 'density'])
-                raster = rasterize(buffered_polys, aggregator=ds.max('density'), width=raster_shape[0],
-                                   height=raster_shape[1], x_range=(bounds[1], bounds[3]),
-                                   y_range=(bounds[0], bounds[2]),
-                                   dynamic=False)
-            else:
-                raster = rasterize(gv_polys, aggregator=ds.max('density'), width=raster_shape[0],
-                                   height=raster_shape[1],
-                                   x_range=(bounds[1], bounds[3]), y_range=(bounds[0], bounds[2]), dynamic=False)
-            df = census_df
-
-        raster_grid = np.copy(list(raster.data.data_vars.items())[0][1].data.astype(float))
-
-        return gv_polys, raster_grid, gpd.GeoDataFrame(df)
+            # Residential areas are handled separately as they depend upon census data
+            # Otherwise, they would become uniform density, when we have census data providing us (unscaled) densities
+            for tags in nhaps_group_tags[1:]:
+                group_gdf = gpd.GeoDataFrame(pd.concat([tag_dfs[tag] for tag in tags], ignore_index=True),
+                                             crs='EPSG:4326')
+                areas = group_gdf.to_crs(epsg=3395).geometry.area * 1e-6  # km^2
+                group_gdf['density'] = total_population / areas.sum()
+                group_gdf['population'] = group_gdf['density'] * areas
+                group_gdfs.append(group_gdf)
+
+        group_rasters = [self._rasterise_densities(group_gdf, bounds, raster_shape) for group_gdf in group_gdfs]
+
+        with self._groups_lock:
+            self._groups_cache[key] = group_gdfs, group_rasters
+            while len(self._groups_cache) > self.max_cached_bounds:
+                self._groups_cache.popitem(last=False)
+        return group_gdfs, group_rasters
+
+    def _rasterise_densities(self, gdf, bounds, raster_shape):
+        import numpy as np
+        import geoviews as gv
+        from holoviews.operation.datashader import rasterize
+        import datashader as ds
+
+        if self.buffer_dist > 0:
+            buffered = gdf.to_crs('EPSG:27700').buffer(self.buffer_dist).to_crs('EPSG:4326')
+            gdf = gpd.GeoDataFrame({'density': gdf['density'].values}, geometry=buffered.values, crs='EPSG:4326')
+        polys = gv.Polygons(gdf[['geometry', 'density']], kdims=['Longitude', 'Latitude'], vdims=['density'])
+        raster = rasterize(polys, aggregator=ds.max('density'), width=raster_shape[0], height=raster_shape[1],
+                           x_range=(bounds[1], bounds[3]), y_range=(bounds[0], bounds[2]), dynamic=False)
+        return np.copy(list(raster.data.data_vars.items())[0][1].data.astype(float))
 
     def clear_cache(self):
-        pass
+        with self._groups_lock:
+            self._groups_cache.clear()
+
+    def release_data(self):
+        super().release_data()
+        self.clear_cache()
+        self._census_wards = None
+        self.nhaps_df = None
 
     def _ingest_census_data(self) -> NoReturn:
         """
         Ingest Census boundaries and density values and overlay/merge
         """
-        import pandas as pd
-
-        # Import Census boundaries in Ordnance Survey grid and reproject
-        census_wards_df = gpd.read_file(england_wa_2011_clipped_filepath()).drop(['altname', 'oldcode'], axis=1)
-        if not census_wards_df.crs:
-            census_wards_df = census_wards_df.set_crs('EPSG:27700')
-        census_wards_df = census_wards_df.to_crs('EPSG:4326')
-        # Import census ward densities
-        density_df = pd.read_csv(density_filepath(), header=0)
-        # Scale from hectares to km^2
-        density_df['area'] = density_df['area'] * 0.01
-        density_df['density'] = density_df['density'] / 0.01
-
-        # These share a common UID, so merge together on it and store
-        self._census_wards = census_wards_df.merge(density_df, on='code')
+        self._census_wards = self._acquire_static_data(CENSUS_WARDS_KEY, load_census_wards)
 
     def _ingest_nhaps_proportions(self) -> NoReturn:
         """
         Ingest NHAPS serialised spatiotemporal population location proportions
         """
-        import pandas as pd
-        self.nhaps_df = pd.read_json(nhaps_data_filepath())
+        self.nhaps_df = self._acquire_static_data('nhaps_proportions', _read_nhaps_proportions)
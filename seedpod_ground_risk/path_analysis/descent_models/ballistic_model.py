@@ -50,8 +50,11 @@ class BallisticModel(DescentModel):
         :return: a tuple of (means, covariances) of the distribution
         :rtype: tuple of np.arrays of shape (2,) for the means and (2,2) for the covariances
         """
-        # Compute impact distances and times in the PAE frame
-        # The velocity vector is assumed to be aligned with path vector, hence v_y is 0
-        d_i, v_i, a_i, t_i = self.bm.compute_ballistic_distance(altitude, velocity, 0)
+        d_i, v_i, a_i, t_i = self.compute_primitives(altitude, velocity)
 
         return primitives_to_dist(a_i, d_i, heading, loc_x, loc_y, t_i, v_i, wind_vel_x, wind_vel_y)
+
+    def compute_primitives(self, altitude, velocity):
+        # Compute impact distances and times in the PAE frame
+        # The velocity vector is assumed to be aligned with path vector, hence v_y is 0
+        return self.bm.compute_ballistic_distance(altitude, velocity, 0)
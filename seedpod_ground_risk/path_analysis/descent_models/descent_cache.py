@@ -0,0 +1,147 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Callable, Any, Optional, Hashable
+
+import numpy as np
+from casex import AircraftSpecs
+
+from seedpod_ground_risk.data.cache import atomic_write
+
+
+def aircraft_key(aircraft: AircraftSpecs) -> tuple:
+    """
+    Return a hashable key uniquely identifying the parameters of an aircraft
+    :param aircraft: casex aircraft specification
+    :return: tuple of sorted (parameter name, value repr) pairs
+    """
+    return tuple(sorted((k, repr(v)) for k, v in vars(aircraft).items()))
+
+
+class DescentCache:
+    """
+    Cache of descent model results, such as impact distributions, keyed on aircraft and flight state parameters.
+
+    Results are held in an in-memory LRU and optionally persisted to disk, so they survive application restarts.
+    """
+
+    def __init__(self, max_size: int = 256, cache_dir: Optional[str] = None) -> None:
+        """
+        :param max_size: maximum number of results to keep in memory
+        :param cache_dir: optional directory to persist results in. Results are only kept in memory if None
+        """
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self._store = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached result for a key, calling `compute` to create it if it is not cached.
+        :param key: hashable key of the result. This must have a stable repr between runs if persisting to disk
+        :param compute: callable taking no arguments that returns the result for this key
+        """
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        with self._lock:
+            if digest in self._store:
+                self._store.move_to_end(digest)
+                return self._store[digest]
+
+        value = self._load(digest)
+        if value is None:
+            value = compute()
+            self._save(digest, value)
+
+        with self._lock:
+            self._store[digest] = value
+            self._store.move_to_end(digest)
+            while len(self._store) > self.max_size:
+                self._store.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        """
+        Clear the in-memory cache. Any results persisted to disk are kept.
+        """
+        with self._lock:
+            self._store.clear()
+
+    def _load(self, digest: str) -> Any:
+        if self.cache_dir is None:
+            return None
+        path = os.path.join(self.cache_dir, digest + '.pkl')
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            # Treat unreadable entries as a miss, they are overwritten once recomputed
+            return None
+
+    def _save(self, digest: str, value: Any) -> None:
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        def write(path):
+            with open(path, 'wb') as f:
+                pickle.dump(value, f)
+
+        atomic_write(os.path.join(self.cache_dir, digest + '.pkl'), write)
+
+
+# Process wide cache shared by all layers and the API
+descent_cache = DescentCache()
+
+
+def make_impact_dists(aircraft: AircraftSpecs, altitude: float, airspeed: float, wind_vel: float, wind_dir: float,
+                      cache: Optional[DescentCache] = descent_cache):
+    """
+    Return the ballistic and glide ground impact distributions for an aircraft failing at a random heading.
+
+    Results are cached on the aircraft and flight state parameters, so repeated calls with the same parameters
+    skip sampling and the descent models entirely.
+
+    :param aircraft: casex aircraft specification
+    :param altitude: mean altitude in metres
+    :param airspeed: mean airspeed in m/s
+    :param wind_vel: mean wind speed in m/s
+    :param wind_dir: mean wind bearing in radians
+    :param cache: the cache to use. Pass None to always recompute
+    :return: tuple of ([(ballistic mean, ballistic cov), (glide mean, glide cov)], (ballistic impact velocity,
+     glide impact velocity), (ballistic impact angle, glide impact angle))
+    """
+
+    def compute():
+        import scipy.stats as ss
+        from seedpod_ground_risk.path_analysis.descent_models.ballistic_model import BallisticModel
+        from seedpod_ground_risk.path_analysis.descent_models.glide_model import GlideDescentModel
+        from seedpod_ground_risk.path_analysis.utils import bearing_to_angle
+
+        bm = BallisticModel(aircraft)
+        gm = GlideDescentModel(aircraft)
+        samples = 5000
+        # Conjure up our distributions for various things
+        alt = ss.norm(altitude, 5).rvs(samples)
+        vel = ss.norm(airspeed, 2.5).rvs(samples)
+        wind_vels = ss.norm(wind_vel, 1).rvs(samples)
+        wind_dirs = bearing_to_angle(ss.norm(wind_dir, np.deg2rad(5)).rvs(samples))
+        wind_vel_y = wind_vels * np.sin(wind_dirs)
+        wind_vel_x = wind_vels * np.cos(wind_dirs)
+        (bm_mean, bm_cov), v_ib, a_ib = bm.transform(alt, vel,
+                                                     ss.uniform(0, 360).rvs(samples),
+                                                     wind_vel_y, wind_vel_x,
+                                                     0, 0)
+        (gm_mean, gm_cov), v_ig, a_ig = gm.transform(alt, vel,
+                                                     ss.uniform(0, 360).rvs(samples),
+                                                     wind_vel_y, wind_vel_x,
+                                                     0, 0)
+        return [(bm_mean, bm_cov), (gm_mean, gm_cov)], (v_ib, v_ig), (a_ib, a_ig)
+
+    if cache is None:
+        return compute()
+    key = ('impact_dists', aircraft_key(aircraft), float(altitude), float(airspeed), float(wind_vel), float(wind_dir))
+    return cache.get(key, compute)
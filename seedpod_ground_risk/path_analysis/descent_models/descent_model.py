@@ -2,45 +2,55 @@ import abc
 
 import numpy as np
 from casex import AircraftSpecs
-from numba import njit
-from sklearn.mixture import GaussianMixture
 
-from seedpod_ground_risk.path_analysis.utils import bearing_to_angle, rotate_2d
+from seedpod_ground_risk.path_analysis.utils import bearing_to_angle
 
 
-@njit(cache=True)
-def paef_to_ned_with_wind(x):
+def paef_to_ned_with_wind(d_i, t_i, theta, wind_vel_x, wind_vel_y):
     """
-    Transform PAE frame distances to NED frame and transform with wind.
-    This func is designed to be used in np apply, hence the single arg. The column ordering is very specific!
-    :param x: array row with ordering [paef_y (always 0), paef_x, impact_time, theta (rad), wind_vel_x, wind_vel_y]
-    :return:
+    Transform PAE frame impact distances to the NED frame and drift them with the wind.
+
+    This is vectorised over samples, all arguments must be scalars or broadcastable arrays. It is equivalent to
+    rotating the PAEF vector (0, d_i) anticlockwise by theta with `rotate_2d` for each sample, then adding the wind
+    drift over the time to impact.
+
+    :param d_i: impact distance(s) along the path in the PAE frame
+    :param t_i: time(s) to impact
+    :param theta: path angle(s) in radians anticlockwise from the x axis
+    :param wind_vel_x: the x component of the wind in m/s
+    :param wind_vel_y: the y component of the wind in m/s
+    :return: array of shape (2, n) of the transformed samples
+    """
+    return np.vstack(np.broadcast_arrays(d_i * np.cos(theta) + wind_vel_x * t_i,
+                                         d_i * np.sin(theta) + wind_vel_y * t_i))
+
+
+def fit_dist_moments(samples):
     """
-    paef_c = x[0:2]
-    t_i = x[2]
-    theta = x[3]
-    wind_vect = x[4:6]
-    return rotate_2d(paef_c, theta) + wind_vect * t_i
+    Fit a multivariate normal distribution to samples with the closed form maximum likelihood estimators.
+
+    This gives the same result as fitting a single component `sklearn.mixture.GaussianMixture`, including its
+    default covariance regularisation, without the iterative fitting overhead.
+
+    :param samples: array of shape (n_dims, n_samples)
+    :return: a tuple of (means, covariances) of shape (n_dims,) and (n_dims, n_dims)
+    """
+    means = samples.mean(axis=1)
+    covariances = np.cov(samples, bias=True) + (1e-6 * np.eye(samples.shape[0]))
+    return means, covariances
 
 
 def primitives_to_dist(a_i, d_i, heading, loc_x, loc_y, t_i, v_i, wind_vel_x, wind_vel_y):
     # Compensate for x,y axes being rotated compared to bearings
     theta = bearing_to_angle(heading)
-    # Form the array structure required and transform
-    arr = np.vstack((np.zeros(d_i.shape), d_i, t_i, theta, wind_vel_x, wind_vel_y))
-    transformed_arr = np.apply_along_axis(paef_to_ned_with_wind, 0, arr)
+    transformed_arr = paef_to_ned_with_wind(d_i, t_i, theta, wind_vel_x, wind_vel_y)
     # Remove nan rows
     transformed_arr = transformed_arr[:, ~np.isnan(transformed_arr).all(axis=0)]
-    gm = GaussianMixture()
-    gm.fit_predict(transformed_arr.T)
+    means, covariances = fit_dist_moments(transformed_arr)
     # If there the event and NED origins match, no need to translate
-    if not loc_x or not loc_y:
-        means = gm.means_[0]
-    else:
-        means = gm.means_[0] + np.array([loc_x, loc_y])
-    # Gaussian Mixture model can deal with up to 3D distributions, but we are only dealing with 2D here,
-    # so take first index into the depth
-    return (means, gm.covariances_[0]), v_i.mean(), a_i.mean()
+    if loc_x and loc_y:
+        means = means + np.array([loc_x, loc_y])
+    return (means, covariances), np.mean(v_i), np.mean(a_i)
 
 
 class DescentModel(abc.ABC):
@@ -72,3 +82,16 @@ class DescentModel(abc.ABC):
         :type loc_y: int
         """
         pass
+
+    @abc.abstractmethod
+    def compute_primitives(self, altitude, velocity):
+        """
+        Compute the impact primitives in the Path Aligned Event frame (PAEF). These are independent of heading and wind.
+
+        :param altitude: the altitude in metres
+        :type altitude: float or np.array
+        :param velocity: the velocity over the ground of the aircraft in the direction of flight in m/s
+        :type velocity: float or np.array
+        :return: a tuple of (impact distance, impact velocity, impact angle, impact time)
+        """
+        pass
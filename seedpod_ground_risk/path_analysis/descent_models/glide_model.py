@@ -10,9 +10,13 @@ class GlideDescentModel(DescentModel):
         super().__init__(aircraft, n_samples)
 
     def transform(self, altitude, velocity, heading, wind_vel_y, wind_vel_x, loc_x, loc_y):
+        d_i, v_i, a_i, t_i = self.compute_primitives(altitude, velocity)
+
+        return primitives_to_dist(a_i, d_i, heading, loc_x, loc_y, t_i, v_i, wind_vel_x, wind_vel_y)
+
+    def compute_primitives(self, altitude, velocity):
         d_i = self.aircraft.glide_ratio * altitude  # Horizontal distance
         t_i = np.sqrt((d_i ** 2) + (altitude ** 2)) / self.aircraft.glide_speed  # 3D distance/airspeed
         a_i = np.arctan(1 / self.aircraft.glide_ratio)
         v_i = d_i / t_i
-
-        return primitives_to_dist(a_i, d_i, heading, loc_x, loc_y, t_i, v_i, wind_vel_x, wind_vel_y)
+        return d_i, v_i, a_i, t_i
@@ -0,0 +1,81 @@
+from typing import Tuple
+
+import numpy as np
+
+from seedpod_ground_risk.path_analysis.descent_models.descent_model import DescentModel
+from seedpod_ground_risk.path_analysis.utils import bearing_to_angle
+
+
+class HeadingDistributionTable:
+    """
+    Lookup table of ground impact distribution parameters over a discretised circle of headings.
+
+    The PAEF impact primitives do not depend on heading, so the descent model is only solved once. The samples are
+    then rotated to every heading bin and drifted by the wind, from which the distribution parameters at each bin
+    are estimated. Lookups between bins are linearly interpolated.
+    """
+
+    def __init__(self, model: DescentModel, altitude, velocity, wind_vel_y, wind_vel_x,
+                 heading_std: float = np.deg2rad(2), bin_width: float = np.deg2rad(1)) -> None:
+        """
+        :param model: the descent model to solve
+        :param altitude: the altitude in metres
+        :type altitude: float or np.array
+        :param velocity: the velocity over the ground of the aircraft in the direction of flight in m/s
+        :type velocity: float or np.array
+        :param wind_vel_y: the y component of the wind in m/s
+        :type wind_vel_y: float or np.array
+        :param wind_vel_x: the x component of the wind in m/s
+        :type wind_vel_x: float or np.array
+        :param heading_std: standard deviation of the heading about each bin in radians
+        :param bin_width: width of each heading bin in radians
+        """
+        import scipy.stats as ss
+
+        d_i, v_i, a_i, t_i = model.compute_primitives(altitude, velocity)
+        d_i, t_i, wind_vel_y, wind_vel_x = np.broadcast_arrays(d_i, t_i, wind_vel_y, wind_vel_x)
+        # Remove samples without a solution
+        valid = ~(np.isnan(d_i) | np.isnan(t_i))
+        d_i, t_i, wind_vel_y, wind_vel_x = d_i[valid], t_i[valid], wind_vel_y[valid], wind_vel_x[valid]
+        # Wind drift does not depend on heading
+        drift_x, drift_y = wind_vel_x * t_i, wind_vel_y * t_i
+
+        n_samples = len(d_i)
+        heading_noise = ss.norm(0, heading_std).rvs(n_samples) if heading_std > 0 else np.zeros(n_samples)
+
+        # Adjust the bin width so the bins evenly divide the circle
+        n_bins = max(int(round(2 * np.pi / bin_width)), 1)
+        self.bin_width = 2 * np.pi / n_bins
+        self.headings = np.arange(n_bins) * self.bin_width
+        # All headings and samples are transformed at once, in an array of shape (n_headings, n_samples)
+        theta = bearing_to_angle(self.headings[:, None] + heading_noise[None, :])
+        x = d_i * np.cos(theta) + drift_x
+        y = d_i * np.sin(theta) + drift_y
+
+        self.means = np.stack((x.mean(axis=1), y.mean(axis=1)), axis=1)
+        dx = x - self.means[:, 0, None]
+        dy = y - self.means[:, 1, None]
+        cov_xy = (dx * dy).mean(axis=1)
+        # Match the regularisation applied by `fit_dist_moments`
+        self.covariances = np.stack((
+            np.stack(((dx * dx).mean(axis=1) + 1e-6, cov_xy), axis=1),
+            np.stack((cov_xy, (dy * dy).mean(axis=1) + 1e-6), axis=1)
+        ), axis=1)
+
+        self.v_i = np.mean(v_i)
+        self.a_i = np.mean(a_i)
+
+    def __call__(self, heading: float) -> Tuple[np.array, np.array]:
+        """
+        Return the distribution parameters for a heading
+        :param heading: the ground track bearing of the aircraft in radians (North is 0)
+        :return: a tuple of (means, covariances) of shape (2,) and (2,2)
+        """
+        pos = (heading % (2 * np.pi)) / self.bin_width
+        lower = int(np.floor(pos)) % len(self.headings)
+        # Wrap around to the first bin past the last
+        upper = (lower + 1) % len(self.headings)
+        frac = pos - np.floor(pos)
+        means = (1 - frac) * self.means[lower] + frac * self.means[upper]
+        covariances = (1 - frac) * self.covariances[lower] + frac * self.covariances[upper]
+        return means, covariances
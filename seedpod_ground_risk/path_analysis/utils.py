@@ -50,6 +50,65 @@ def bearing_to_angle(bearing, is_rad=True):
         return (360 - (bearing - 90)) % 360
 
 
+def make_impact_kernel(dists, sigma_cutoff: float = 5, normalise: bool = False):
+    """
+    Evaluate the sum of bivariate normal impact distributions only within a window around the event location.
+
+    The window is the bounding box of all the distributions truncated at `sigma_cutoff` standard deviations along
+    each axis, so the size of the returned kernel depends on the spread of the distributions, not the raster size.
+
+    :param dists: iterable of (mean, covariance) tuples in grid cell units, relative to the event location
+    :param sigma_cutoff: number of standard deviations from the mean at which the distributions are truncated
+    :param normalise: whether to scale each distribution to a total of 1 over the kernel, so the kernel is the
+     probability mass of each cell even when distributions are only a few cells wide
+    :return: tuple of (kernel, (centre_y, centre_x)) where the centre is the index of the event location in the kernel
+    """
+    import scipy.stats as ss
+
+    dists = [(np.asarray(mean), np.asarray(cov)) for mean, cov in dists]
+    lower = [mean - sigma_cutoff * np.sqrt(np.diag(cov)) for mean, cov in dists]
+    upper = [mean + sigma_cutoff * np.sqrt(np.diag(cov)) for mean, cov in dists]
+    # Always include the event location itself, so the centre index lies within the kernel
+    min_y, min_x = np.minimum(np.floor(np.min(lower, axis=0)), 0).astype(int)
+    max_y, max_x = np.maximum(np.ceil(np.max(upper, axis=0)), 0).astype(int)
+
+    y, x = np.mgrid[min_y:max_y + 1, min_x:max_x + 1]
+    eval_grid = np.vstack((y.ravel(), x.ravel())).T
+    pdfs = [ss.multivariate_normal(mean, cov).pdf(eval_grid) for mean, cov in dists]
+    if normalise:
+        pdfs = [pdf / pdf.sum() for pdf in pdfs]
+    kernel = np.sum(pdfs, axis=0)
+
+    return kernel.reshape(y.shape), (-min_y, -min_x)
+
+
+def stamp_kernel(acc: np.array, kernel: np.array, kernel_centre: Tuple[int, int], loc: Tuple[int, int],
+                 weights: np.array = None) -> np.array:
+    """
+    Add a kernel into an accumulator grid in place, only over the window of the grid the kernel covers.
+    Any part of the kernel falling outside of the grid is clipped.
+
+    :param acc: accumulator grid, modified in place
+    :param kernel: the kernel to add
+    :param kernel_centre: (y, x) index into the kernel that is placed at `loc`
+    :param loc: (y, x) index into the accumulator grid
+    :param weights: optional grid of the same shape as `acc` to multiply the kernel by before adding
+    :return: the window of values added to the accumulator grid
+    """
+    start_y, start_x = loc[0] - kernel_centre[0], loc[1] - kernel_centre[1]
+    min_y, min_x = max(start_y, 0), max(start_x, 0)
+    max_y = min(start_y + kernel.shape[0], acc.shape[0])
+    max_x = min(start_x + kernel.shape[1], acc.shape[1])
+    if min_y >= max_y or min_x >= max_x:
+        return np.zeros((0, 0))
+
+    window = kernel[min_y - start_y:max_y - start_y, min_x - start_x:max_x - start_x]
+    if weights is not None:
+        window = window * weights[min_y:max_y, min_x:max_x]
+    acc[min_y:max_y, min_x:max_x] += window
+    return window
+
+
 def velocity_to_kinetic_energy(mass, vel):
     """
     Return the kinetic energy
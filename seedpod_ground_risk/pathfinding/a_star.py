@@ -6,7 +6,7 @@ from skimage.draw import line as skline
 
 from seedpod_ground_risk.pathfinding.algorithm import Algorithm
 from seedpod_ground_risk.pathfinding.environment import GridEnvironment, Node
-from seedpod_ground_risk.pathfinding.heuristic import Heuristic, ManhattanHeuristic
+from seedpod_ground_risk.pathfinding.heuristic import Heuristic, ManhattanHeuristic, LineReductionFieldCache
 
 
 def _reconstruct_path(end: Node, grid: np.ndarray, smooth=True) -> List[Node]:
@@ -79,11 +79,16 @@ class GridAStar(Algorithm):
 # Canonical algorithm from literature
 class RiskAStar(Algorithm):
 
+    def __init__(self):
+        # Minimum of the grid along the line from each cell to the goal, kept between searches to the same goal
+        self._line_mins = LineReductionFieldCache('min')
+
     def find_path(self, environment: GridEnvironment, start: Node, end: Node, k=0.9, smooth=True, **kwargs) -> Union[
         List[Node], None]:
         grid = environment.grid
         min_dist = 2 ** 0.5
         goal_val = grid[end.position]
+        line_mins = self._line_mins.get(grid, end.position)
 
         # Use heapq;the thread safety provided by PriorityQueue is not needed, as we only exec on a single thread
         open = [start]
@@ -103,6 +108,10 @@ class RiskAStar(Algorithm):
 
             current_cost = node.f
             node_val = grid[node.position]
+            # The heuristic only depends on the expanded node, so is shared by all of its neighbours
+            dist = ((node.position[1] - end.position[1]) ** 2 + (
+                    node.position[0] - end.position[0]) ** 2) ** 0.5
+            h = k * ((((node_val + goal_val) / 2) * min_dist) + ((dist - min_dist) * line_mins[node.position]))
             for neighbour in environment.get_neighbours(node):
                 cost = current_cost \
                        + (((grid[neighbour.position] + node_val) / 2)
@@ -111,13 +120,6 @@ class RiskAStar(Algorithm):
                 if cost < neighbour.g:
                     neighbour.g = cost
 
-                    dist = ((node.position[1] - end.position[1]) ** 2 + (
-                            node.position[0] - end.position[0]) ** 2) ** 0.5
-                    line = skline(node.position[1], node.position[0], end.position[1], end.position[0])
-                    min_val = grid[line[0], line[1]].min()
-                    node_val = grid[node.position]
-                    h = k * ((((node_val + goal_val) / 2) * min_dist) + ((dist - min_dist) * min_val))
-
                     # h = self.heuristic(neighbour.position, end.position)
                     neighbour.h = h
                     neighbour.f = cost + h
@@ -0,0 +1,218 @@
+import warnings
+from typing import List, Union
+
+import numpy as np
+from numba import njit
+
+from seedpod_ground_risk.pathfinding.a_star import GridAStar, _reconstruct_path
+from seedpod_ground_risk.pathfinding.environment import GridEnvironment, Node
+from seedpod_ground_risk.pathfinding.heuristic import Heuristic, ManhattanHeuristic, ManhattanRiskHeuristic, \
+    RiskHeuristic
+
+# Neighbour offsets as (dy, dx), the first 4 are orthogonal
+_OFFSETS = np.array([[0, -1], [0, 1], [-1, 0], [1, 0], [-1, -1], [-1, 1], [1, -1], [1, 1]], dtype=np.int64)
+
+
+@njit(cache=True, nogil=True)
+def _heap_push(keys, ids, size, key, idx):
+    # Grow the heap arrays if full. Entries are never decreased in place, so the heap can hold duplicates
+    if size == len(keys):
+        new_keys = np.empty(2 * len(keys), dtype=keys.dtype)
+        new_ids = np.empty(2 * len(ids), dtype=ids.dtype)
+        new_keys[:size] = keys
+        new_ids[:size] = ids
+        keys, ids = new_keys, new_ids
+
+    pos = size
+    keys[pos] = key
+    ids[pos] = idx
+    # Sift up
+    while pos > 0:
+        parent = (pos - 1) >> 1
+        if keys[parent] <= keys[pos]:
+            break
+        keys[parent], keys[pos] = keys[pos], keys[parent]
+        ids[parent], ids[pos] = ids[pos], ids[parent]
+        pos = parent
+    return keys, ids, size + 1
+
+
+@njit(cache=True, nogil=True)
+def _heap_pop(keys, ids, size):
+    idx = ids[0]
+    size -= 1
+    keys[0] = keys[size]
+    ids[0] = ids[size]
+    # Sift down
+    pos = 0
+    while True:
+        left = 2 * pos + 1
+        if left >= size:
+            break
+        child = left
+        if left + 1 < size and keys[left + 1] < keys[left]:
+            child = left + 1
+        if keys[pos] <= keys[child]:
+            break
+        keys[child], keys[pos] = keys[pos], keys[child]
+        ids[child], ids[pos] = ids[pos], ids[child]
+        pos = child
+    return idx, size
+
+
+@njit(cache=True, nogil=True)
+def _grid_a_star(grid, start, goal, diagonals, k):
+    """
+    A* over a cost grid, with all search state held in flat arrays indexed by cell id (y * width + x).
+    The cost of moving into a cell is the value of that cell. Cells with negative or non finite values are blocked.
+
+    :return: array of parent cell ids, or an empty array if the goal is unreachable
+    """
+    height, width = grid.shape
+    n_cells = height * width
+    n_offsets = 8 if diagonals else 4
+    goal_y, goal_x = goal // width, goal % width
+
+    g = np.full(n_cells, np.inf)
+    parent = np.full(n_cells, -1, dtype=np.int64)
+    closed = np.zeros(n_cells, dtype=np.bool_)
+
+    keys = np.empty(1024, dtype=np.float64)
+    ids = np.empty(1024, dtype=np.int64)
+    keys, ids, size = _heap_push(keys, ids, 0, 0.0, start)
+    g[start] = 0
+    parent[start] = start
+
+    while size > 0:
+        node, size = _heap_pop(keys, ids, size)
+        if closed[node]:
+            continue
+        closed[node] = True
+        if node == goal:
+            return parent
+
+        node_y, node_x = node // width, node % width
+        for o in range(n_offsets):
+            y = node_y + _OFFSETS[o, 0]
+            x = node_x + _OFFSETS[o, 1]
+            if y < 0 or y >= height or x < 0 or x >= width:
+                continue
+            val = grid[y, x]
+            if not (val >= 0 and np.isfinite(val)):
+                continue
+            neighbour = y * width + x
+            if closed[neighbour]:
+                continue
+            cost = g[node] + val
+            if cost < g[neighbour]:
+                g[neighbour] = cost
+                parent[neighbour] = node
+                dy, dx = abs(y - goal_y), abs(x - goal_x)
+                if diagonals:
+                    # Octile distance, with unit diagonal steps to match the unit cost of diagonal moves
+                    h = max(dy, dx)
+                else:
+                    h = dy + dx
+                keys, ids, size = _heap_push(keys, ids, size, cost + k * h, neighbour)
+
+    return np.empty(0, dtype=np.int64)
+
+
+@njit(cache=True, nogil=True)
+def _csr_a_star(indptr, indices, costs, width, start, goal, diagonals, k):
+    """
+    A* over a grid adjacency in compressed sparse row form, as built by `GridEnvironment.get_csr_graph`.
+
+    :return: array of parent cell ids, or an empty array if the goal is unreachable
+    """
+    n_cells = len(indptr) - 1
+    goal_y, goal_x = goal // width, goal % width
+
+    g = np.full(n_cells, np.inf)
+    parent = np.full(n_cells, -1, dtype=np.int64)
+    closed = np.zeros(n_cells, dtype=np.bool_)
+
+    keys = np.empty(1024, dtype=np.float64)
+    ids = np.empty(1024, dtype=np.int64)
+    keys, ids, size = _heap_push(keys, ids, 0, 0.0, start)
+    g[start] = 0
+    parent[start] = start
+
+    while size > 0:
+        node, size = _heap_pop(keys, ids, size)
+        if closed[node]:
+            continue
+        closed[node] = True
+        if node == goal:
+            return parent
+
+        for e in range(indptr[node], indptr[node + 1]):
+            neighbour = indices[e]
+            if closed[neighbour]:
+                continue
+            cost = g[node] + costs[e]
+            if cost < g[neighbour]:
+                g[neighbour] = cost
+                parent[neighbour] = node
+                dy, dx = abs(neighbour // width - goal_y), abs(neighbour % width - goal_x)
+                h = max(dy, dx) if diagonals else dy + dx
+                keys, ids, size = _heap_push(keys, ids, size, cost + k * h, neighbour)
+
+    return np.empty(0, dtype=np.int64)
+
+
+class ArrayRiskGridAStar(GridAStar):
+    """
+    Risk grid A* with the search state held in flat arrays and a numba compiled binary heap.
+
+    This is an alternative core to `RiskGridAStar` for large cost grids, where allocating a `Node` per expansion
+    dominates the run time. The cost of a path is the sum of the grid values it moves into, the heuristic is the
+    grid distance to the goal weighted by `k`. Unlike `RiskGridAStar`, which accumulates the weighted heuristic into
+    the cost of each node, paths are ordered by their true cost plus the heuristic of their last node only.
+
+    Only grid distance heuristics are supported, as the heuristic is evaluated within the compiled search. Risk
+    heuristics are accepted for use with the same options as `RiskGridAStar`, but the line integral of risk to the goal
+    is not evaluated, so their risk to distance ratio is ignored.
+
+    If the environment was created with ``precompute_graph=True``, its CSR adjacency is searched instead of the
+    grid, so the neighbour bounds and blocking checks are done once for every query on the same grid.
+    """
+
+    def __init__(self, heuristic: Heuristic = ManhattanHeuristic()):
+        """
+        :param heuristic: either a `ManhattanHeuristic` or a `ManhattanRiskHeuristic`, of which only the grid distance
+         is used
+        :raises ValueError: if the heuristic is of any other type
+        """
+        if not isinstance(heuristic, (ManhattanHeuristic, ManhattanRiskHeuristic)):
+            raise ValueError(f'{type(heuristic).__name__} is not supported, only grid distance heuristics are')
+        if isinstance(heuristic, RiskHeuristic) and heuristic.k:
+            warnings.warn(f'{type(self).__name__} does not evaluate the risk term of {type(heuristic).__name__}, '
+                          f'ignoring its risk to distance ratio of {heuristic.k}')
+        super().__init__(heuristic)
+
+    def find_path(self, environment: GridEnvironment, start: Node, end: Node, k=1, smooth=True, **kwargs) -> Union[
+        List[Node], None]:
+        width = environment.grid.shape[1]
+        start_id = start.position[0] * width + start.position[1]
+        end_id = end.position[0] * width + end.position[1]
+
+        if environment.precompute_graph:
+            indptr, indices, costs = environment.get_csr_graph()
+            parent = _csr_a_star(indptr, indices, costs, width, start_id, end_id, bool(environment.diagonals),
+                                 float(k))
+        else:
+            grid = np.ascontiguousarray(environment.grid, dtype=np.float64)
+            parent = _grid_a_star(grid, start_id, end_id, bool(environment.diagonals), float(k))
+        if not len(parent):
+            return None
+
+        # Rebuild the chain of nodes from the goal back to the start
+        end_node = Node(end.position)
+        node = end_node
+        node_id = end_id
+        while parent[node_id] != node_id:
+            node_id = parent[node_id]
+            node.parent = Node((int(node_id // width), int(node_id % width)))
+            node = node.parent
+        return _reconstruct_path(end_node, environment.grid, smooth=smooth)
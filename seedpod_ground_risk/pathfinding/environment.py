@@ -23,11 +23,21 @@ class Node:
 
 class GridEnvironment:
 
-    def __init__(self, grid: np.array, diagonals=False):
+    def __init__(self, grid: np.array, diagonals=False, precompute_graph=False):
+        """
+        :param grid: cost grid. Cells with negative or non finite values are blocked
+        :param diagonals: whether cells are 8-connected rather than 4-connected
+        :param precompute_graph: build the CSR adjacency of the grid up front and use it for neighbour lookups
+        """
         self.grid = grid
         self.shape = np.array(grid.shape)
         self.diagonals = diagonals
         self.graph = None
+        self.precompute_graph = precompute_graph
+        self._csr_graph = None
+        self._csr_grid = None
+        if precompute_graph:
+            self.get_csr_graph()
 
     @staticmethod
     def f_cost(node, goal):
@@ -38,8 +48,57 @@ class GridEnvironment:
         # if not self.graph:
         #     self.graph = self._generate_graph()
         # return self.graph[node]
+        if self.precompute_graph:
+            indptr, indices, _ = self.get_csr_graph()
+            width = self.grid.shape[1]
+            idx = node.position[0] * width + node.position[1]
+            return {Node((int(n // width), int(n % width))) for n in indices[indptr[idx]:indptr[idx + 1]]}
         return self._find_neighbours(node.position)
 
+    def get_csr_graph(self):
+        """
+        Return the adjacency of the grid in compressed sparse row form, building it if the grid has changed.
+
+        Cells are identified by their flat index ``y * width + x``. The neighbours of cell ``i`` are
+        ``indices[indptr[i]:indptr[i + 1]]`` with the cost of moving into each of them in the same slice of
+        ``costs``. Blocked cells have no edges in or out.
+
+        :return: tuple of (indptr, indices, costs) arrays of type int32, int32 and float64
+        """
+        if self._csr_graph is None or self._csr_grid is not self.grid:
+            self._csr_graph = self._generate_csr_graph()
+            self._csr_grid = self.grid
+        return self._csr_graph
+
+    def _generate_csr_graph(self):
+        grid = np.asarray(self.grid, dtype=np.float64)
+        height, width = grid.shape
+        passable = np.isfinite(grid) & (grid >= 0)
+        cell_ids = np.arange(height * width, dtype=np.int32).reshape(height, width)
+
+        offsets = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+        if self.diagonals:
+            offsets += [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+        srcs, dsts = [], []
+        for dy, dx in offsets:
+            # Overlapping slices of the grid for source cells and their neighbours at this offset
+            src_slice = (slice(max(-dy, 0), height - max(dy, 0)), slice(max(-dx, 0), width - max(dx, 0)))
+            dst_slice = (slice(max(dy, 0), height - max(-dy, 0)), slice(max(dx, 0), width - max(-dx, 0)))
+            valid = passable[src_slice] & passable[dst_slice]
+            srcs.append(cell_ids[src_slice][valid])
+            dsts.append(cell_ids[dst_slice][valid])
+        srcs = np.concatenate(srcs)
+        dsts = np.concatenate(dsts)
+
+        # Sort edges by source cell, then by destination within a source for a deterministic order
+        order = np.lexsort((dsts, srcs))
+        indices = dsts[order]
+        indptr = np.zeros(height * width + 1, dtype=np.int32)
+        np.cumsum(np.bincount(srcs, minlength=height * width), out=indptr[1:])
+        costs = grid.ravel()[indices]
+        return indptr, indices, costs
+
     def _generate_graph(self):
 
         graph = {}
@@ -1,11 +1,102 @@
 import abc
+from collections import OrderedDict
 from typing import Tuple
 
 import numpy as np
+from numba import njit
 
 from seedpod_ground_risk.pathfinding import bresenham
 
 
+@njit(cache=True, nogil=True)
+def _reduce_line(grid, y0, x0, y1, x1, use_min):
+    line = bresenham.make_line(x0, y0, x1, y1)
+    acc = np.inf if use_min else 0.0
+    for idx in range(line.shape[0]):
+        val = grid[line[idx, 0], line[idx, 1]]
+        if use_min:
+            acc = min(acc, val)
+        else:
+            acc += val
+        # NaN is not propagated by min
+        if np.isnan(val):
+            return val
+    return acc
+
+
+@njit(cache=True, nogil=True)
+def _reduce_lines(grid, y1, x1, use_min):
+    out = np.empty(grid.shape)
+    for y in range(grid.shape[0]):
+        for x in range(grid.shape[1]):
+            out[y, x] = _reduce_line(grid, y, x, y1, x1, use_min)
+    return out
+
+
+class LineReductionField:
+    """
+    Field of the sum or min of the cost grid along the Bresenham line from each cell to a fixed goal.
+
+    Values are computed the first time each cell is queried and then cached, so repeated queries of a cell during a
+    search are O(1) rather than O(line length).
+    """
+
+    def __init__(self, grid: np.array, goal: Tuple[int, int], reduction: str = 'sum'):
+        """
+        :param grid: the cost grid
+        :param goal: (y, x) index of the goal cell
+        :param reduction: either 'sum' or 'min'
+        """
+        if reduction not in ['sum', 'min']:
+            raise ValueError(f'Unknown line reduction {reduction}')
+        self.grid = np.ascontiguousarray(grid, dtype=np.float64)
+        self.goal = (int(goal[0]), int(goal[1]))
+        self._use_min = reduction == 'min'
+        self._values = np.empty(self.grid.shape)
+        self._evaluated = np.zeros(self.grid.shape, dtype=bool)
+
+    def __getitem__(self, node: Tuple[int, int]) -> float:
+        if not self._evaluated[node]:
+            self._values[node] = _reduce_line(self.grid, node[0], node[1], self.goal[0], self.goal[1],
+                                              self._use_min)
+            self._evaluated[node] = True
+        return self._values[node]
+
+    def evaluate_all(self) -> np.array:
+        """
+        Eagerly evaluate the field over the whole grid
+        :return: the field with the same shape as the grid
+        """
+        self._values = _reduce_lines(self.grid, self.goal[0], self.goal[1], self._use_min)
+        self._evaluated[:] = True
+        return self._values
+
+
+class LineReductionFieldCache:
+    """
+    LRU cache of `LineReductionField` per goal, invalidated when the cost grid changes.
+    """
+
+    def __init__(self, reduction: str = 'sum', max_size: int = 4):
+        self.reduction = reduction
+        self.max_size = max_size
+        self._grid = None
+        self._fields = OrderedDict()
+
+    def get(self, grid: np.array, goal: Tuple[int, int]) -> LineReductionField:
+        if grid is not self._grid:
+            self._fields.clear()
+            self._grid = grid
+        goal = (int(goal[0]), int(goal[1]))
+        if goal in self._fields:
+            self._fields.move_to_end(goal)
+        else:
+            self._fields[goal] = LineReductionField(grid, goal, self.reduction)
+            while len(self._fields) > self.max_size:
+                self._fields.popitem(last=False)
+        return self._fields[goal]
+
+
 class Heuristic(abc.ABC):
     @abc.abstractmethod
     def h(self, node: Tuple[int, int], goal: Tuple[int, int]):
@@ -20,6 +111,13 @@ class RiskHeuristic(Heuristic, abc.ABC):
         self.resolution = resolution
         self.max = environment.grid.max()
         self.k = risk_to_dist_ratio if risk_to_dist_ratio > 0 else 0
+        self._line_sums = LineReductionFieldCache('sum')
+
+    def line_integral(self, node: Tuple[int, int], goal: Tuple[int, int]) -> float:
+        """
+        Return the sum of the cost grid along the line from a node to the goal, cached per goal
+        """
+        return self._line_sums.get(self.environment.grid, goal)[node]
 
 
 class EuclideanHeuristic(Heuristic):
@@ -38,8 +136,7 @@ class EuclideanRiskHeuristic(RiskHeuristic):
             return 0
 
         dist = ((node[1] - goal[1]) ** 2 + (node[0] - goal[0]) ** 2) ** 0.5
-        line = bresenham.make_line(node[1], node[0], goal[1], goal[0])
-        integral_val = self.environment.grid[line[:, 0], line[:, 1]].sum()
+        integral_val = self.line_integral(node, goal)
 
         if integral_val > 1:
             return self.k * np.log10(integral_val) + dist
@@ -53,8 +150,7 @@ class ManhattanRiskHeuristic(RiskHeuristic):
             return 0
 
         dist = abs((node[1] - goal[1])) + abs((node[0] - goal[0]))
-        line = bresenham.make_line(node[1], node[0], goal[1], goal[0])
-        integral_val = self.environment.grid[line[:, 0], line[:, 1]].sum()
+        integral_val = self.line_integral(node, goal)
         # return self.k * integral_val * dist * self.resolution
         if integral_val > 1:
             return self.k * np.log10(integral_val) + dist
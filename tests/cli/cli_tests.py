@@ -47,6 +47,14 @@ class CLITestCase(unittest.TestCase):
         self.assertEqual(res.exit_code, 0)
         self.assertTrue(test_file_exists(os.path.join(self.tmp_path, 'strike*')))
 
+    def test_map_strike_tiled(self):
+        res = self.runner.invoke(spgr.strike, self.bounds_args + self.path_args + ' --tile-size 128 ')
+        if res.exit_code != 0:
+            print(res.exception)
+            print(res.exc_info)
+        self.assertEqual(res.exit_code, 0)
+        self.assertTrue(test_file_exists(os.path.join(self.tmp_path, 'strike*')))
+
     def test_map_fatality(self):
         res = self.runner.invoke(spgr.fatality, self.bounds_args + self.path_args)
         if res.exit_code != 0:
@@ -0,0 +1,93 @@
+import threading
+import unittest
+
+from seedpod_ground_risk.core.jobs import LatestJobExecutor, JobCancelled
+
+
+class LatestJobExecutorTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.executor = LatestJobExecutor(debounce=0)
+        self.run_tokens = []
+
+    def tearDown(self) -> None:
+        self.executor.shutdown()
+        super().tearDown()
+
+    def _job(self, token, value):
+        self.run_tokens.append(token)
+        return value
+
+    def test_run(self):
+        future = self.executor.submit(self._job, 'result')
+
+        self.assertEqual(future.result(timeout=5), 'result')
+        self.assertEqual(len(self.run_tokens), 1)
+        self.assertTrue(self.executor.is_current(self.run_tokens[0]))
+
+    def test_queued_jobs_dropped(self):
+        started, release = threading.Event(), threading.Event()
+
+        def blocking(token):
+            started.set()
+            release.wait(5)
+
+        self.executor.submit(blocking)
+        started.wait(5)
+        # Both are queued behind the blocking job, so only the newest is run
+        stale = self.executor.submit(self._job, 'stale')
+        latest = self.executor.submit(self._job, 'latest')
+        release.set()
+
+        self.assertIsNone(stale.result(timeout=5))
+        self.assertEqual(latest.result(timeout=5), 'latest')
+        self.assertEqual(len(self.run_tokens), 1)
+
+    def test_running_job_cancelled(self):
+        started, superseded = threading.Event(), threading.Event()
+        stages = []
+
+        def staged(token):
+            started.set()
+            superseded.wait(5)
+            stages.append(1)
+            self.executor.check(token)
+            stages.append(2)
+
+        future = self.executor.submit(staged)
+        started.wait(5)
+        self.executor.submit(self._job, 'latest')
+        superseded.set()
+
+        self.assertIsNone(future.result(timeout=5))
+        self.assertEqual(stages, [1])
+        self.assertEqual(len(self.run_tokens), 1)
+
+    def test_debounce(self):
+        self.executor.debounce = 0.2
+        futures = [self.executor.submit(self._job, i) for i in range(5)]
+
+        self.assertEqual([f.result(timeout=5) for f in futures], [None, None, None, None, 4])
+        self.assertEqual(len(self.run_tokens), 1)
+
+    def test_cancel(self):
+        self.executor.debounce = 0.2
+        future = self.executor.submit(self._job, 'result')
+        self.executor.cancel()
+
+        self.assertIsNone(future.result(timeout=5))
+        self.assertEqual(self.run_tokens, [])
+
+    def test_check(self):
+        future = self.executor.submit(lambda token: token)
+        token = future.result(timeout=5)
+
+        self.executor.check(token)
+        self.executor.cancel()
+        with self.assertRaises(JobCancelled):
+            self.executor.check(token)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import os
+import pickle
+import tempfile
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from seedpod_ground_risk.core.layer_pool import LayerProcessPool
+from seedpod_ground_risk.core.utils import make_bounds_polygon
+from seedpod_ground_risk.layers.data_layer import DataLayer
+
+
+def _load_static_data():
+    return np.full(1000, 2.0)
+
+
+class StaticDataLayer(DataLayer):
+    """
+    Layer generating a raster from static data, recording the process it was generated in
+    """
+
+    def __init__(self, key):
+        super().__init__(key)
+        self._data = None
+
+    def preload_data(self):
+        self._data = self._acquire_static_data(f'test_layer_pool_{self.key}', _load_static_data)
+
+    def generate(self, bounds_polygon, raster_shape, from_cache: bool = False, hour: int = 8, **kwargs):
+        raster = np.full((raster_shape[1], raster_shape[0]), self._data[0] * hour)
+        return None, raster, os.getpid()
+
+    def clear_cache(self):
+        pass
+
+
+class PreloadCountingLayer(StaticDataLayer):
+    """
+    Layer returning the number of times layers of its key have been preloaded in the process generating it
+    """
+    preload_counts = {}
+
+    def preload_data(self):
+        super().preload_data()
+        self.preload_counts[self.key] = self.preload_counts.get(self.key, 0) + 1
+
+    def generate(self, bounds_polygon, raster_shape, from_cache: bool = False, hour: int = 8, **kwargs):
+        return None, np.zeros((raster_shape[1], raster_shape[0])), self.preload_counts[self.key]
+
+
+class CrashingLayer(StaticDataLayer):
+    """
+    Layer killing the process generating it, unless a marker file exists. The marker is created before crashing if a
+    path is given, so only the first generation crashes
+    """
+
+    def __init__(self, key, marker_path=None):
+        super().__init__(key)
+        self.marker_path = marker_path
+
+    def generate(self, bounds_polygon, raster_shape, from_cache: bool = False, hour: int = 8, **kwargs):
+        if self.marker_path is None or not os.path.exists(self.marker_path):
+            if self.marker_path is not None:
+                open(self.marker_path, 'w').close()
+            os._exit(1)
+        return super().generate(bounds_polygon, raster_shape, from_cache, hour, **kwargs)
+
+
+class MisshapenLayer(StaticDataLayer):
+
+    def generate(self, bounds_polygon, raster_shape, from_cache: bool = False, hour: int = 8, **kwargs):
+        return None, np.ones((2, 2)), os.getpid()
+
+
+class LayerProcessPoolTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.pool = LayerProcessPool(max_workers=2)
+        self.layer = StaticDataLayer('static')
+        self.layer.preload_data()
+        self.bounds = make_bounds_polygon((-1.5, -1.3), (50.87, 51))
+
+    def tearDown(self) -> None:
+        self.pool.reset()
+        self.layer.release_data()
+        super().tearDown()
+
+    def test_pickled_without_static_data(self):
+        unpickled = pickle.loads(pickle.dumps(self.layer))
+
+        self.assertIsNone(unpickled._data)
+        self.assertEqual(unpickled._static_data, {})
+        self.assertIsNotNone(self.layer._data)
+        unpickled.preload_data()
+        self.assertIs(unpickled._data, self.layer._data)
+        unpickled.release_data()
+
+    def test_generate(self):
+        element, raster, pid = self.pool.generate_layer(self.layer, self.bounds, (30, 20), 3, 40)
+
+        self.assertIsNone(element)
+        self.assertNotEqual(pid, os.getpid())
+        self.assertEqual(raster.shape, (20, 30))
+        np.testing.assert_array_equal(raster, 6)
+
+    def test_unexpected_shape(self):
+        layer = MisshapenLayer('misshapen')
+        _, raster, _ = self.pool.generate_layer(layer, self.bounds, (30, 20), 3, 40)
+
+        np.testing.assert_array_equal(raster, np.ones((2, 2)))
+
+    def test_reset(self):
+        _, _, first_pid = self.pool.generate_layer(self.layer, self.bounds, (3, 2), 3, 40)
+        self.pool.reset()
+        _, raster, pid = self.pool.generate_layer(self.layer, self.bounds, (3, 2), 3, 40)
+
+        self.assertNotEqual(pid, first_pid)
+        np.testing.assert_array_equal(raster, 6)
+
+    def test_worker_crash(self):
+        with self.assertRaises(BrokenProcessPool):
+            self.pool.generate_layer(CrashingLayer('crashing'), self.bounds, (3, 2), 3, 40)
+
+        # The broken workers are replaced
+        _, raster, _ = self.pool.generate_layer(self.layer, self.bounds, (3, 2), 3, 40)
+        np.testing.assert_array_equal(raster, 6)
+
+    def test_worker_crash_retried(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            layer = CrashingLayer('crashing', marker_path=os.path.join(tmp_dir, 'crashed'))
+            layer.preload_data()
+            _, raster, _ = self.pool.generate_layer(layer, self.bounds, (3, 2), 3, 40)
+            layer.release_data()
+
+        np.testing.assert_array_equal(raster, 6)
+
+    def test_evict(self):
+        pool = LayerProcessPool(max_workers=1)
+        self.addCleanup(pool.reset)
+        layer, other = PreloadCountingLayer('counted'), PreloadCountingLayer('other')
+
+        self.assertFalse(pool.evict(layer.cache_key))
+        self.assertEqual(pool.generate_layer(layer, self.bounds, (3, 2), 3, 40)[2], 1)
+        self.assertEqual(pool.generate_layer(layer, self.bounds, (3, 2), 3, 40)[2], 1)
+        self.assertTrue(pool.evict(layer.cache_key))
+        # The worker drops the evicted layer on its next task, so preloads it again when next generated
+        pool.generate_layer(other, self.bounds, (3, 2), 3, 40)
+        self.assertEqual(pool.generate_layer(layer, self.bounds, (3, 2), 3, 40)[2], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,278 @@
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from seedpod_ground_risk.core.plot_server import PlotServer
+from seedpod_ground_risk.core.tile_cache import RasterTileCache
+from seedpod_ground_risk.core.utils import make_bounds_polygon
+from seedpod_ground_risk.layers.data_layer import DataLayer
+from seedpod_ground_risk.layers.fatality_risk_layer import FatalityRiskLayer
+
+
+class AircraftLayer(DataLayer):
+    """
+    Stand in for the fatality risk layer of an aircraft, returning the process it was generated in
+    """
+
+    def __init__(self, key, ac: str = 'Default', wind_vel: int = 0, wind_dir: int = 0):
+        super().__init__(key)
+        self.ac = ac
+        self.ac_dict = {'name': ac}
+        self.wind_vel = wind_vel
+        self.wind_dir = wind_dir
+
+    @property
+    def cache_key(self):
+        return type(self).__name__, self.ac, self.wind_vel, self.wind_dir
+
+    def preload_data(self):
+        pass
+
+    def generate(self, bounds_polygon, raster_shape, from_cache: bool = False, hour: int = 8, **kwargs):
+        return None, np.ones((raster_shape[1], raster_shape[0])), os.getpid()
+
+    def clear_cache(self):
+        pass
+
+
+class GradientAircraftLayer(AircraftLayer):
+    """
+    Stand in for the fatality risk layer of an aircraft, with a raster increasing to the north east
+    """
+
+    def generate(self, bounds_polygon, raster_shape, from_cache: bool = False, hour: int = 8, **kwargs):
+        width, height = raster_shape
+        return None, np.add.outer(np.arange(height), np.arange(width)).astype(float), None
+
+
+class PopulationBlobLayer(DataLayer):
+    """
+    Stand in for the population layers of the strike risk layer, with a smooth blob of population density in people/km^2
+    """
+    centre = (-1.4, 50.93)
+    scale = 0.01
+
+    def preload_data(self):
+        pass
+
+    def generate(self, bounds_polygon, raster_shape, from_cache: bool = False, hour: int = 8, **kwargs):
+        min_lat, min_lon, max_lat, max_lon = bounds_polygon.bounds
+        width, height = raster_shape
+        # Pixel centres, with the first row at the southern edge
+        lons = min_lon + (np.arange(width) + 0.5) * (max_lon - min_lon) / width
+        lats = min_lat + (np.arange(height) + 0.5) * (max_lat - min_lat) / height
+        lon_grid, lat_grid = np.meshgrid(lons, lats)
+        sq_dist = (lon_grid - self.centre[0]) ** 2 + (lat_grid - self.centre[1]) ** 2
+        return None, 5000 * np.exp(-sq_dist / (2 * self.scale ** 2)), None
+
+    def clear_cache(self):
+        pass
+
+
+class PlotServerProcessPoolTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.ps = PlotServer(tiles='OSM', use_process_pool=True, max_layer_processes=1, tile_size=16, tile_halo=0)
+        self.ps.data_layers = [AircraftLayer('Fatality Risk')]
+        self.ps.annotation_layers = [mock.Mock(key='path', aircraft={'name': 'Default'}, annotate=lambda *args: None)]
+        self.ps._preload_complete = True
+
+    def tearDown(self) -> None:
+        self.ps.stop()
+        self.ps.server.unlisten()
+        super().tearDown()
+
+    def _plot_worker_pid(self, hour):
+        self.ps.set_time(hour)
+        self.ps.compose_overlay_plot((-1.41, -1.4), (50.9, 50.91))
+        generated, _ = self.ps._get_generated_layers()
+        self.assertEqual(len(generated), 1)
+        return list(generated.values())[0][2]
+
+    def test_workers_kept_between_plots(self):
+        with mock.patch('seedpod_ground_risk.core.plot_server.FatalityRiskLayer', AircraftLayer):
+            first_pid = self._plot_worker_pid(0)
+            # Each plot adds and removes a duplicate layer for the annotation layer, which was never sent to workers
+            pid = self._plot_worker_pid(1)
+
+        self.assertNotEqual(first_pid, os.getpid())
+        self.assertEqual(pid, first_pid)
+        self.assertEqual(len(self.ps.data_layers), 1)
+
+
+class PlotServerLevelOfDetailTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.progress = mock.Mock()
+        self.ps = PlotServer(tiles='OSM', raster_resolution=100, max_raster_pixels=10000, max_lod_level=1,
+                             tile_size=16, tile_halo=0, progress_callback=self.progress)
+        self.ps.data_layers = [AircraftLayer('Fatality Risk')]
+        self.ps._preload_complete = True
+
+    def tearDown(self) -> None:
+        self.ps.stop()
+        self.ps.server.unlisten()
+        super().tearDown()
+
+    def test_zoomed_out_coarsened(self):
+        # ~11km square in EPSG:3857 metres, so ~110 pixels a side at 100m and ~55 at the 200m of level 1
+        bounds_poly = make_bounds_polygon((-1.45, -1.35), (50.9, 50.96))
+
+        self.assertEqual(self.ps._select_lod_level(bounds_poly), 1)
+
+    def test_too_large_not_generated(self):
+        self.ps.compose_overlay_plot((-1.41, -1.4), (50.9, 50.91))
+        generated, generated_bounds = self.ps._get_generated_layers()
+
+        with mock.patch.object(AircraftLayer, 'generate') as generate_mock:
+            plot = self.ps.compose_overlay_plot((-3, 0), (50, 52))
+            generate_mock.assert_not_called()
+        self.assertIsNone(self.ps._select_lod_level(make_bounds_polygon((-3, 0), (50, 52))))
+        self.progress.assert_called_with('Area too large to render! Zoom in to generate the map')
+        # The last generated layers are still shown
+        self.assertEqual(self.ps._get_generated_layers(), (generated, generated_bounds))
+        self.assertEqual(len(plot), 2)
+
+
+class PlotServerRiskLevelOfDetailTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        # The halo covers the spread of the impact locations at both levels
+        self.ps = PlotServer(tiles='OSM', raster_resolution=100, max_lod_level=1, tile_size=16, tile_halo=64)
+
+    def tearDown(self) -> None:
+        self.ps.stop()
+        self.ps.server.unlisten()
+        super().tearDown()
+
+    @staticmethod
+    def _make_layer():
+        layer = FatalityRiskLayer('Fatality Risk')
+        layer._strike_layer._layers = [PopulationBlobLayer('population')]
+        return layer
+
+    def test_coarse_matches_downsampled(self):
+        cache = self.ps._tile_cache
+        lon, lat = PopulationBlobLayer.centre
+        centre_bounds = self.ps._to_epsg3857_bounds(make_bounds_polygon((lon, lon), (lat, lat)))
+        bounds = cache.range_bounds(1, cache.covering_tiles(1, centre_bounds))
+
+        self.ps.generate_layer_tiles(self._make_layer(), bounds, 8, 0)
+        # Every tile of level 1 is downsampled from the level 0 tiles generated above
+        with mock.patch.object(FatalityRiskLayer, 'generate') as generate_mock:
+            _, (_, downsampled, _) = self.ps.generate_layer_tiles(self._make_layer(), bounds, 8, 1)
+            generate_mock.assert_not_called()
+        self.ps._tile_cache = RasterTileCache(base_resolution=100, tile_size=16)
+        _, (_, coarse, _) = self.ps.generate_layer_tiles(self._make_layer(), bounds, 8, 1)
+
+        self.assertEqual(coarse.shape, (16, 16))
+        self.assertEqual(downsampled.shape, coarse.shape)
+        self.assertGreater(coarse.min(), 0)
+        np.testing.assert_allclose(coarse, downsampled, rtol=0.02)
+
+class PlotServerProgressiveTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.ps = PlotServer(tiles='OSM', raster_resolution=100, max_lod_level=1, preview_levels=1, tile_size=16,
+                             tile_halo=0, progressive=True)
+        self.ps.data_layers = [GradientAircraftLayer('Fatality Risk')]
+        self.ps.annotation_layers = [mock.Mock(key='path', aircraft={'name': 'Default'}, annotate=self._annotate)]
+        self.ps._preload_complete = True
+        self.x_range, self.y_range = (-1.41, -1.4), (50.9, 50.91)
+        patcher = mock.patch('seedpod_ground_risk.core.plot_server.FatalityRiskLayer', GradientAircraftLayer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self) -> None:
+        self.ps.stop()
+        self.ps.server.unlisten()
+        super().tearDown()
+
+    def _annotate(self, raw_data, raster_data):
+        import geoviews as gv
+
+        return gv.Points([(np.mean(self.x_range), np.mean(self.y_range))]).opts(tools=['hover'])
+
+    def _generate_plot(self):
+        """
+        Generate a plot in a stand in document, returning the rendered preview figure and the scheduled updates
+        """
+        doc = mock.Mock()
+        token = self.ps._jobs._generation
+        self.ps._generate_plot(token, doc, self.x_range, self.y_range)
+        callbacks = [c.args[0] for c in doc.add_next_tick_callback.call_args_list]
+        # The first update shows the preview
+        callbacks.pop(0)()
+        fig = doc.add_root.call_args.args[0]
+        return fig, callbacks
+
+    @staticmethod
+    def _image_renderer(fig):
+        from bokeh.models import GlyphRenderer, Image
+
+        return [r for r in fig.renderers if isinstance(r, GlyphRenderer) and isinstance(r.glyph, Image)][0]
+
+    def test_preview_refined_in_place(self):
+        from bokeh.models import GlyphRenderer, HoverTool
+
+        fig, callbacks = self._generate_plot()
+        renderer = self._image_renderer(fig)
+        preview_image = renderer.data_source.data['image'][0]
+        n_renderers = len(fig.renderers)
+        n_hover_tools = len([t for t in fig.tools if isinstance(t, HoverTool)])
+        generated, generated_bounds = self.ps._get_generated_layers()
+        refined = generated[list(generated)[0]][1]
+        self.assertEqual(preview_image.shape, tuple(np.array(refined.shape) // 2))
+
+        for callback in callbacks:
+            callback()
+
+        # The image is replaced rather than the figure re-rendered
+        self.assertIs(self._image_renderer(fig), renderer)
+        data = renderer.data_source.data
+        np.testing.assert_array_equal(data['image'][0], np.flipud(refined))
+        min_x, min_y, max_x, max_y = self.ps._to_epsg3857_bounds(generated_bounds)
+        np.testing.assert_allclose([data['x'][0], data['y'][0], data['dw'][0], data['dh'][0]],
+                                   [min_x, min_y, max_x - min_x, max_y - min_y])
+        # The bounds are snapped to the pixels of the refined level
+        pixels = np.array([min_x, min_y, max_x, max_y]) / self.ps._tile_cache.resolution(0)
+        np.testing.assert_allclose(pixels, np.round(pixels))
+        self.assertEqual((round(pixels[3] - pixels[1]), round(pixels[2] - pixels[0])), refined.shape)
+        self.assertEqual((renderer.glyph.color_mapper.low, renderer.glyph.color_mapper.high),
+                         (refined.min(), refined.max()))
+
+        # The glyphs and hover tool of the annotation are moved onto the figure
+        added = fig.renderers[n_renderers:]
+        self.assertEqual(len(added), 1)
+        self.assertIsInstance(added[0], GlyphRenderer)
+        self.assertIs(added[0].document, fig.document)
+        hover_tools = [t for t in fig.tools if isinstance(t, HoverTool)]
+        self.assertEqual(len(hover_tools), n_hover_tools + 1)
+
+    def test_stale_updates_skipped(self):
+        fig, callbacks = self._generate_plot()
+        renderer = self._image_renderer(fig)
+        preview_data = dict(renderer.data_source.data)
+        n_renderers = len(fig.renderers)
+        self.assertEqual(len(callbacks), 2)
+
+        # Another plot is requested before the updates run
+        self.ps._jobs.cancel()
+        with mock.patch.object(PlotServer, '_update_figure_raster') as update_mock, \
+                mock.patch.object(PlotServer, '_add_figure_overlays') as overlay_mock:
+            for callback in callbacks:
+                callback()
+        update_mock.assert_not_called()
+        overlay_mock.assert_not_called()
+        self.assertIs(renderer.data_source.data['image'][0], preview_data['image'][0])
+        self.assertEqual(len(fig.renderers), n_renderers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+
+import numpy as np
+
+from seedpod_ground_risk.core.tile_cache import RasterTileCache
+
+
+class RasterTileCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.cache = RasterTileCache(base_resolution=10, tile_size=4, max_tiles=16)
+
+    def test_covering_tiles(self):
+        # Tiles of level 0 are 40m wide
+        self.assertEqual(self.cache.covering_tiles(0, (-10, 0, 80, 39)), (-1, 0, 1, 0))
+        # Upper bounds on a tile edge do not include the next tile
+        self.assertEqual(self.cache.covering_tiles(0, (0, 0, 40, 40)), (0, 0, 0, 0))
+        self.assertEqual(self.cache.covering_tiles(1, (0, 0, 100, 100)), (0, 0, 1, 1))
+
+    def test_range_bounds(self):
+        self.assertEqual(self.cache.range_bounds(0, (-1, 0, 1, 0)), (-40, 0, 80, 40))
+        self.assertEqual(self.cache.range_bounds(1, (0, 0, 0, 0)), (0, 0, 80, 80))
+
+    def test_mosaic_round_trip(self):
+        raster = np.arange(8 * 12, dtype=float).reshape(8, 12)
+        self.cache.put_range('key', 0, (0, 0, 2, 1), raster)
+
+        self.assertEqual(len(self.cache), 6)
+        # The first row of the raster is the northern edge
+        np.testing.assert_array_equal(self.cache.get('key', (0, 0, 1)), raster[:4, :4])
+        np.testing.assert_array_equal(self.cache.get('key', (0, 2, 0)), raster[4:, 8:])
+
+        mosaic, bounds = self.cache.mosaic('key', 0, (0, 0, 120, 80))
+        np.testing.assert_array_equal(mosaic, raster)
+        self.assertEqual(bounds, (0, 0, 120, 80))
+
+    def test_mosaic_cropped(self):
+        raster = np.arange(8 * 12, dtype=float).reshape(8, 12)
+        self.cache.put_range('key', 0, (0, 0, 2, 1), raster)
+
+        # Bounds are snapped outwards to the pixel grid
+        mosaic, bounds = self.cache.mosaic('key', 0, (15, 5, 61, 52))
+        self.assertEqual(bounds, (10, 0, 70, 60))
+        np.testing.assert_array_equal(mosaic, raster[2:8, 1:7])
+
+    def test_missing_tiles(self):
+        self.cache.put_range('key', 0, (0, 0, 0, 0), np.ones((4, 4)))
+
+        self.assertEqual(self.cache.missing_tiles('key', 0, (0, 0, 1, 0)), [(0, 1, 0)])
+        self.assertEqual(self.cache.missing_tiles('other', 0, (0, 0, 0, 0)), [(0, 0, 0)])
+        self.assertEqual(self.cache.mosaic('key', 0, (0, 0, 80, 40)), (None, None))
+
+    def test_put_subset(self):
+        self.cache.put_range('key', 0, (0, 0, 1, 0), np.ones((4, 8)), tiles=[(0, 1, 0)])
+
+        self.assertEqual(self.cache.missing_tiles('key', 0, (0, 0, 1, 0)), [(0, 0, 0)])
+
+    def test_shape_mismatch(self):
+        with self.assertRaises(ValueError):
+            self.cache.put_range('key', 0, (0, 0, 1, 0), np.ones((4, 4)))
+
+    def test_fill_from_finer(self):
+        raster = np.arange(8 * 8, dtype=float).reshape(8, 8)
+        self.cache.put_range('key', 0, (0, 0, 1, 1), raster)
+
+        self.assertTrue(self.cache.fill_from_finer('key', (1, 0, 0)))
+        expected = raster.reshape(4, 2, 4, 2).mean(axis=(1, 3))
+        np.testing.assert_array_equal(self.cache.get('key', (1, 0, 0)), expected)
+        # The coarse tile covers the same area as the fine tiles
+        np.testing.assert_array_equal(self.cache.mosaic('key', 1, (0, 0, 80, 80))[0], expected)
+
+    def test_fill_from_finer_levels(self):
+        self.cache = RasterTileCache(base_resolution=10, tile_size=4, max_tiles=32)
+        self.cache.put_range('key', 0, (0, 0, 3, 3), np.ones((16, 16)))
+
+        # Intermediate tiles are downsampled first
+        self.assertTrue(self.cache.fill_from_finer('key', (2, 0, 0)))
+        np.testing.assert_array_equal(self.cache.get('key', (2, 0, 0)), np.ones((4, 4)))
+        self.assertEqual(self.cache.missing_tiles('key', 1, (0, 0, 1, 1)), [])
+
+    def test_fill_from_finer_missing(self):
+        self.cache.put_range('key', 0, (0, 0, 1, 0), np.ones((4, 8)))
+
+        self.assertFalse(self.cache.fill_from_finer('key', (1, 0, 0)))
+        self.assertFalse(self.cache.fill_from_finer('key', (0, 0, 0)))
+        self.assertIsNone(self.cache.get('key', (1, 0, 0)))
+
+    def test_lru_eviction(self):
+        self.cache.put_range('old', 0, (0, 0, 0, 0), np.ones((4, 4)))
+        self.cache.put_range('recent', 0, (0, 0, 0, 0), np.ones((4, 4)))
+        self.cache.get('old', (0, 0, 0))
+        self.cache.put_range('new', 0, (0, 0, 3, 3), np.ones((16, 16)))
+
+        self.assertEqual(len(self.cache), 16)
+        self.assertIsNone(self.cache.get('recent', (0, 0, 0)))
+        self.assertIsNone(self.cache.get('old', (0, 0, 0)))
+        self.assertEqual(self.cache.missing_tiles('new', 0, (0, 0, 3, 3)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
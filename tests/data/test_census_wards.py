@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import fiona
+import pandas as pd
+import shapely.geometry as sg
+
+from seedpod_ground_risk.data import census_wards
+
+
+class CensusWardsCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.shp_path = os.path.join(self.tmp_dir, 'wards.shp')
+        self.density_path = os.path.join(self.tmp_dir, 'density.csv')
+        self.cache_path = os.path.join(self.tmp_dir, 'wards.feather')
+
+        # Two wards in the Ordnance Survey grid, in the same schema as the census shapefile
+        schema = {'geometry': 'Polygon',
+                  'properties': {'code': 'str', 'name': 'str', 'altname': 'str', 'oldcode': 'str'}}
+        with fiona.open(self.shp_path, 'w', driver='ESRI Shapefile', crs='EPSG:27700', schema=schema) as f:
+            for i, x in enumerate([440000, 441000]):
+                f.write({'geometry': sg.mapping(sg.box(x, 100000, x + 1000, 101000)),
+                         'properties': {'code': f'E{i + 1}', 'name': 'A', 'altname': '', 'oldcode': f'O{i + 1}'}})
+        pd.DataFrame({'code': ['E1', 'E2'], 'area': [100, 100], 'density': [20, 40]}) \
+            .to_csv(self.density_path, index=False)
+
+        patches = [
+            mock.patch.object(census_wards, 'england_wa_2011_clipped_filepath', return_value=self.shp_path),
+            mock.patch.object(census_wards, 'density_filepath', return_value=self.density_path),
+            mock.patch.object(census_wards, 'census_wards_cache_filepath', return_value=self.cache_path),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_build_and_load(self):
+        expected = census_wards._ingest_census_data()
+        wards = census_wards.load_census_wards()
+
+        self.assertTrue(os.path.exists(self.cache_path))
+        self.assertEqual(wards.crs.to_epsg(), 4326)
+        self.assertEqual(list(wards.columns), list(expected.columns))
+        self.assertTrue(all(wards.geometry.geom_equals(expected.geometry)))
+        # Densities are scaled from per hectare to per km^2
+        self.assertEqual(list(wards['density']), [2000, 4000])
+
+    def test_cache_reused(self):
+        census_wards.build_census_wards_cache()
+        with mock.patch.object(census_wards, '_ingest_census_data') as ingest:
+            census_wards.load_census_wards()
+            ingest.assert_not_called()
+
+    def test_rebuilt_on_source_change(self):
+        census_wards.build_census_wards_cache()
+        pd.DataFrame({'code': ['E1', 'E2'], 'area': [100, 100], 'density': [30, 50]}) \
+            .to_csv(self.density_path, index=False)
+        # Ensure the modification time differs on file systems with coarse timestamps
+        stat = os.stat(self.density_path)
+        os.utime(self.density_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        wards = census_wards.load_census_wards()
+        self.assertEqual(list(wards['density']), [3000, 5000])
+
+    def test_rebuilt_on_version_change(self):
+        census_wards.build_census_wards_cache()
+        with mock.patch.object(census_wards, 'CENSUS_WARDS_CACHE_VERSION', census_wards.CENSUS_WARDS_CACHE_VERSION + 1):
+            self.assertFalse(census_wards._is_cache_valid(self.cache_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from seedpod_ground_risk.data.registry import StaticDataRegistry
+
+
+class StaticDataRegistryTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.registry = StaticDataRegistry()
+        self.loads = 0
+
+    def _loader(self):
+        self.loads += 1
+        return object()
+
+    def test_shared(self):
+        first = self.registry.acquire('data', self._loader)
+        second = self.registry.acquire('data', self._loader)
+
+        self.assertIs(first, second)
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(self.registry.refcount('data'), 2)
+
+    def test_released(self):
+        first = self.registry.acquire('data', self._loader)
+        self.registry.acquire('data', self._loader)
+        self.registry.release('data')
+        self.assertIn('data', self.registry)
+
+        self.registry.release('data')
+        self.assertNotIn('data', self.registry)
+        # Reloaded once acquired again
+        self.assertIsNot(self.registry.acquire('data', self._loader), first)
+        self.assertEqual(self.loads, 2)
+
+    def test_release_unheld(self):
+        with self.assertRaises(KeyError):
+            self.registry.release('data')
+
+    def test_failed_load(self):
+        def fail():
+            raise IOError()
+
+        with self.assertRaises(IOError):
+            self.registry.acquire('data', fail)
+        self.assertNotIn('data', self.registry)
+        self.registry.acquire('data', self._loader)
+        self.assertEqual(self.loads, 1)
+
+    def test_concurrent_acquire(self):
+        def slow_loader():
+            time.sleep(0.05)
+            return self._loader()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.registry.acquire('data', slow_loader)))
+                   for _ in range(8)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(len(set(map(id, results))), 1)
+        self.assertEqual(self.registry.refcount('data'), 8)
+
+
+class SharedLayerDataTestCase(unittest.TestCase):
+
+    def test_population_layers_share_data(self):
+        import pandas as pd
+        from seedpod_ground_risk.data.registry import static_data_registry
+        from seedpod_ground_risk.layers import temporal_population_estimate_layer as tpe
+        from seedpod_ground_risk.layers.temporal_population_estimate_layer import TemporalPopulationEstimateLayer
+
+        with mock.patch.object(tpe, 'load_census_wards', side_effect=lambda: pd.DataFrame()) as load_census, \
+                mock.patch.object(tpe, '_read_nhaps_proportions', side_effect=lambda: pd.DataFrame()) as load_nhaps:
+            # As for the population layers of several aircraft
+            layers = [TemporalPopulationEstimateLayer(f'tpe_{i}') for i in range(3)]
+            [layer.preload_data() for layer in layers]
+            # Preloading is idempotent
+            layers[0].preload_data()
+
+            self.assertEqual(load_census.call_count, 1)
+            self.assertEqual(load_nhaps.call_count, 1)
+            self.assertTrue(all(layer._census_wards is layers[0]._census_wards for layer in layers))
+            self.assertEqual(static_data_registry.refcount(tpe.CENSUS_WARDS_KEY), 3)
+
+            [layer.release_data() for layer in layers]
+            self.assertNotIn(tpe.CENSUS_WARDS_KEY, static_data_registry)
+            self.assertNotIn('nhaps_proportions', static_data_registry)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from seedpod_ground_risk.data import traffic_counts
+from seedpod_ground_risk.data.traffic_counts import TYPE_OCCUPANCY, TRAFFIC_COUNT_COLUMNS
+
+
+class TrafficCountsCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.tmp_dir, 'counts.csv')
+        self.cache_path = os.path.join(self.tmp_dir, 'counts.feather')
+
+        rng = np.random.default_rng(0)
+        n = 1000
+        self.counts_df = pd.DataFrame({
+            'count_point_id': np.arange(n),
+            'year': rng.choice([2018, 2019], n),
+            'region_name': 'South East',
+            'latitude': rng.uniform(50.8, 51, n),
+            'longitude': rng.uniform(-1.5, -1.2, n),
+            'road_name': rng.choice(['A33', 'M3', 'M27'], n),
+            'all_motor_vehicles': rng.integers(0, 10000, n),
+            **{k: rng.integers(0, 5000, n) for k in TYPE_OCCUPANCY.keys()}
+        })
+        self.counts_df.to_csv(self.csv_path, index=False)
+
+        patches = [
+            mock.patch.object(traffic_counts, 'traffic_count_filepath', return_value=self.csv_path),
+            mock.patch.object(traffic_counts, 'traffic_counts_cache_filepath', return_value=self.cache_path),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_estimate_road_populations(self):
+        def calc_population(row):
+            pop = 0
+            for k, v in TYPE_OCCUPANCY.items():
+                pop += row[k] * v
+            return pop
+
+        np.testing.assert_allclose(traffic_counts.estimate_road_populations(self.counts_df),
+                                   self.counts_df.apply(calc_population, axis=1) / 24)
+
+    def test_build_and_load(self):
+        counts = traffic_counts.load_traffic_counts()
+
+        self.assertTrue(os.path.exists(self.cache_path))
+        self.assertEqual(counts.crs.to_epsg(), 4326)
+        self.assertEqual(list(counts.columns), TRAFFIC_COUNT_COLUMNS + ['population_per_hour', 'geometry'])
+        # Only the latest year is kept
+        latest = self.counts_df[self.counts_df['year'] == 2019]
+        self.assertEqual(list(counts['count_point_id']), list(latest['count_point_id']))
+        np.testing.assert_allclose(counts.geometry.x, latest['longitude'])
+
+    def test_cache_reused(self):
+        traffic_counts.build_traffic_counts_cache()
+        with mock.patch.object(traffic_counts, '_ingest_traffic_counts') as ingest:
+            traffic_counts.load_traffic_counts()
+            ingest.assert_not_called()
+
+    def test_rebuilt_on_source_change(self):
+        traffic_counts.build_traffic_counts_cache()
+        self.counts_df['year'] = 2020
+        self.counts_df.to_csv(self.csv_path, index=False)
+        # Ensure the modification time differs on file systems with coarse timestamps
+        stat = os.stat(self.csv_path)
+        os.utime(self.csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        self.assertEqual(len(traffic_counts.load_traffic_counts()), len(self.counts_df))
+
+    def test_failed_rebuild_invalidates_cache(self):
+        traffic_counts.build_traffic_counts_cache()
+        with mock.patch.object(pd.DataFrame, 'to_feather', side_effect=OSError('Disk full')):
+            with self.assertRaises(OSError):
+                traffic_counts.build_traffic_counts_cache()
+
+        # The old checksum is removed before the cache is replaced, so the cache is rebuilt on next load
+        self.assertFalse(traffic_counts._is_cache_valid(self.cache_path))
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['counts.csv', 'counts.feather'])
+        with mock.patch.object(traffic_counts, '_ingest_traffic_counts',
+                               side_effect=traffic_counts._ingest_traffic_counts) as ingest:
+            traffic_counts.load_traffic_counts()
+            ingest.assert_called_once()
+        self.assertTrue(traffic_counts._is_cache_valid(self.cache_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
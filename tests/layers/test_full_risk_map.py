@@ -51,17 +51,17 @@ class FullRiskMapTestCase(unittest.TestCase):
 
         self._setup_aircraft()
 
-        ps = PlotServer()
+        ps = PlotServer(raster_resolution=self.resolution)
         ps.set_time(self.hour)
-        self.raster_shape = ps._get_raster_dimensions(self.test_bounds, self.resolution)
         ps.data_layers = [TemporalPopulationEstimateLayer('tpe')]
 
         [layer.preload_data() for layer in chain(ps.data_layers, ps.annotation_layers)]
-        ps.generate_layers(self.test_bounds, self.raster_shape)
-        self.raster_grid = np.flipud(np.sum(
+        ps.generate_layers(self.test_bounds)
+        # Generated rasters are north up
+        self.raster_grid = np.sum(
             [remove_raster_nans(res[1]) for res in ps._generated_data_layers.values() if
              res[1] is not None],
-            axis=0))
+            axis=0)
         self.raster_shape = self.raster_grid.shape
         del ps
 
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+import geopandas as gpd
+import shapely.geometry as sg
+
+from seedpod_ground_risk.layers.osm_cache import OSMPolygonCache
+
+
+class OSMPolygonCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.fetches = []
+        # Small square polygons in (lon, lat) order on a 0.01 degree lattice
+        self.polys = [sg.box(lon, lat, lon + 0.005, lat + 0.005)
+                      for lon in [-1.5 + 0.01 * i for i in range(30)]
+                      for lat in [50.9 + 0.01 * i for i in range(30)]]
+
+    def _fetch(self, osm_tag, bounds):
+        self.fetches.append((osm_tag, bounds))
+        s, w, n, e = bounds
+        box = sg.box(w, s, e, n)
+        return gpd.GeoDataFrame([p for p in self.polys if p.intersects(box)], columns=['geometry']) \
+            .set_crs('EPSG:4326')
+
+    def _bounds_poly(self, min_lat, min_lon, max_lat, max_lon):
+        # Bounds polygons are constructed in (lat, lon) order throughout the application
+        return sg.box(min_lat, min_lon, max_lat, max_lon)
+
+    def test_repeat_query_not_fetched(self):
+        cache = OSMPolygonCache()
+        bounds = self._bounds_poly(50.92, -1.45, 51.08, -1.3)
+        first = cache.query('landuse=residential', bounds, self._fetch)
+        second = cache.query('landuse=residential', bounds, self._fetch)
+
+        self.assertEqual(len(self.fetches), 1)
+        self.assertEqual(len(first), len(second))
+
+    def test_matches_direct_query(self):
+        cache = OSMPolygonCache()
+        bounds = self._bounds_poly(50.92, -1.45, 51.08, -1.3)
+        cached = cache.query('landuse=residential', bounds, self._fetch)
+        direct = self._fetch('landuse=residential', bounds.bounds)
+
+        self.assertEqual(set(p.wkt for p in cached.geometry), set(p.wkt for p in direct.geometry))
+
+    def test_sub_area_not_fetched(self):
+        cache = OSMPolygonCache()
+        cache.query('landuse=residential', self._bounds_poly(50.92, -1.45, 51.08, -1.3), self._fetch)
+        cache.query('landuse=residential', self._bounds_poly(50.95, -1.4, 51.0, -1.35), self._fetch)
+
+        self.assertEqual(len(self.fetches), 1)
+
+    def test_tags_separate(self):
+        cache = OSMPolygonCache()
+        bounds = self._bounds_poly(50.92, -1.45, 51.08, -1.3)
+        cache.query('landuse=residential', bounds, self._fetch)
+        cache.query('landuse=retail', bounds, self._fetch)
+
+        self.assertEqual(len(self.fetches), 2)
+
+    def test_ttl(self):
+        cache = OSMPolygonCache(ttl=0)
+        bounds = self._bounds_poly(50.92, -1.45, 51.08, -1.3)
+        cache.query('landuse=residential', bounds, self._fetch)
+        cache.query('landuse=residential', bounds, self._fetch)
+
+        self.assertEqual(len(self.fetches), 2)
+
+    def test_disk_persistence(self):
+        cache_dir = tempfile.mkdtemp()
+        bounds = self._bounds_poly(50.92, -1.45, 51.08, -1.3)
+        first = OSMPolygonCache(cache_dir=cache_dir).query('landuse=residential', bounds, self._fetch)
+
+        # A new cache, as if the application was restarted
+        second = OSMPolygonCache(cache_dir=cache_dir).query('landuse=residential', bounds, self._fetch)
+        self.assertEqual(len(self.fetches), 1)
+        self.assertEqual(set(p.wkt for p in first.geometry), set(p.wkt for p in second.geometry))
+
+    def test_disk_eviction(self):
+        cache_dir = tempfile.mkdtemp()
+        cache = OSMPolygonCache(cache_dir=cache_dir, max_disk_bytes=0)
+        cache.query('landuse=residential', self._bounds_poly(50.92, -1.45, 51.08, -1.3), self._fetch)
+
+        self.assertEqual([f for f in os.listdir(cache_dir) if f.endswith('.pkl')], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import unittest
+from unittest import mock
+
+import shapely.geometry as sg
+
+from seedpod_ground_risk.core.utils import make_bounds_polygon
+from seedpod_ground_risk.layers.osm_providers import OSMExtractPolygonProvider, set_polygon_provider, \
+    get_polygon_provider
+
+# Small extract in the schema exported by ogr2ogr from an OSM PBF, standing in for the Overpass API
+EXTRACT_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data', 'osm_extract.geojson')
+
+
+class OSMExtractPolygonProviderTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.provider = OSMExtractPolygonProvider(EXTRACT_PATH)
+        self.bounds = make_bounds_polygon((-1.45, -1.35), (50.9, 51.0))
+
+    def test_column_tag(self):
+        df = self.provider.query('landuse=residential', self.bounds)
+
+        # The residential line and the residential polygon outside of the bounds are excluded
+        self.assertEqual(len(df), 2)
+        self.assertEqual(df.crs.to_epsg(), 4326)
+        self.assertTrue(all(df.geometry.geom_type == 'Polygon'))
+
+    def test_other_tags(self):
+        df = self.provider.query('amenity=hospital', self.bounds)
+        self.assertEqual(len(df), 1)
+        self.assertTrue(df.geometry[0].equals(sg.box(-1.396, 50.936, -1.395, 50.937)))
+
+    def test_key_only(self):
+        df = self.provider.query('building', self.bounds)
+        self.assertEqual(len(df), 1)
+
+    def test_unknown_tag(self):
+        df = self.provider.query('leisure=park', self.bounds)
+        self.assertTrue(df.empty)
+
+    def test_multipolygons_exploded(self):
+        df = self.provider.query('landuse=retail', self.bounds)
+        self.assertEqual(len(df), 2)
+
+    def test_extract_read_once(self):
+        self.provider.query('landuse=residential', self.bounds)
+        with mock.patch('geopandas.read_file') as read_file:
+            self.provider.query('landuse=industrial', self.bounds)
+            self.provider.query('landuse=residential', make_bounds_polygon((-1.25, -1.15), (50.75, 50.85)))
+            read_file.assert_not_called()
+
+    def test_query_osm_polygons_uses_provider(self):
+        from seedpod_ground_risk.layers.osm_tag_layer import query_osm_polygons
+
+        set_polygon_provider(self.provider)
+        try:
+            with mock.patch('seedpod_ground_risk.layers.osm_tag_layer._get_session',
+                            side_effect=AssertionError('Overpass should not be queried')), \
+                    mock.patch('seedpod_ground_risk.layers.osm_cache.OSMPolygonCache.query',
+                               side_effect=AssertionError('OSM cache should not be queried')):
+                df = query_osm_polygons('landuse=residential', self.bounds)
+        finally:
+            set_polygon_provider(None)
+        self.assertEqual(len(df), 2)
+        self.assertIsNone(get_polygon_provider())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+from seedpod_ground_risk.layers.osm_tag_layer import fetch_osm_polygons, fetch_osm_polygons_batch, \
+    make_overpass_query, race_overpass_mirrors, _assemble_rings, _parse_osm_polygons
+
+# Overpass response containing tagged ways, a multipolygon relation of untagged ways and their nodes
+RESPONSE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data', 'overpass_response.json')
+# Multipolygon relations from an OpenStreetMap extract of Helsinki, in the Overpass JSON format, and the polygons
+# they were assembled into before rings were assembled through endpoint maps
+MULTIPOLYGON_RESPONSE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data',
+                                          'overpass_multipolygon_response.json')
+MULTIPOLYGON_EXPECTED_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data',
+                                          'overpass_multipolygon_expected.geojson')
+BOUNDS = (50.9, -1.45, 51.0, -1.3)
+
+
+def _load_response():
+    with open(RESPONSE_PATH) as f:
+        return json.load(f)
+
+
+class OverpassBatchTestCase(unittest.TestCase):
+
+    def test_query_has_all_tags(self):
+        query = make_overpass_query(['landuse=residential', 'building=school'], BOUNDS)
+        for tag in ['landuse=residential', 'building=school']:
+            self.assertIn(f'way[{tag}];', query)
+            self.assertIn(f'rel[{tag}];', query)
+
+    @mock.patch('seedpod_ground_risk.layers.osm_tag_layer.race_overpass_mirrors')
+    def test_split_per_tag(self, race):
+        race.return_value = _load_response()
+        dfs = fetch_osm_polygons_batch(['landuse=residential', 'landuse=retail', 'building=school'], BOUNDS)
+
+        race.assert_called_once()
+        self.assertEqual(len(dfs['landuse=residential']), 1)
+        self.assertEqual(len(dfs['building=school']), 1)
+        # A closed way and a multipolygon relation with a hole
+        retail = dfs['landuse=retail']
+        self.assertEqual(len(retail), 2)
+        self.assertEqual(sorted(len(p.interiors) for p in retail.geometry), [0, 1])
+
+    @mock.patch('seedpod_ground_risk.layers.osm_tag_layer.race_overpass_mirrors')
+    def test_single_tag(self, race):
+        race.return_value = _load_response()
+        # Elements are not filtered by tag when only a single tag was queried, so all 3 closed ways outside of the
+        # relation and the relation itself are returned
+        df = fetch_osm_polygons('landuse=residential', BOUNDS)
+        self.assertEqual(len(df), 4)
+
+
+class RingAssemblyTestCase(unittest.TestCase):
+
+    def _split_ring(self, ring, n_ways, seed=0):
+        """
+        Split a closed ring into ways of shuffled order and direction
+        """
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        cuts = np.linspace(0, len(ring) - 1, n_ways + 1, dtype=int)
+        ways = [ring[cuts[i]:cuts[i + 1] + 1] for i in range(n_ways)]
+        ways = [w[::-1] if rng.random() > 0.5 else w for w in ways]
+        return [ways[i] for i in rng.permutation(n_ways)]
+
+    def _circle(self, n, r=1.0, cx=0.0):
+        import numpy as np
+        ring = [(cx + r * np.cos(t), r * np.sin(t)) for t in np.linspace(0, 2 * np.pi, n, endpoint=False)]
+        return ring + [ring[0]]
+
+    def test_shuffled_ways(self):
+        ring = self._circle(2001)
+        closed, unclosed = _assemble_rings([('outer', w) for w in self._split_ring(ring, 500)])
+
+        self.assertEqual(unclosed, [])
+        self.assertEqual(len(closed), 1)
+        role, locs = closed[0]
+        self.assertEqual(role, 'outer')
+        self.assertEqual(locs[0], locs[-1])
+        self.assertEqual(len(locs), len(ring))
+        self.assertEqual(set(locs), set(ring))
+
+    def test_multiple_rings(self):
+        outer = self._circle(101, r=2)
+        inner = self._circle(51, r=1)
+        other = self._circle(31, r=1, cx=10)
+        member_ways = [('outer', w) for w in self._split_ring(outer, 7)] + \
+                      [('inner', w) for w in self._split_ring(inner, 5)] + \
+                      [('outer', other)]
+        closed, unclosed = _assemble_rings(member_ways)
+
+        self.assertEqual(unclosed, [])
+        self.assertEqual(sorted((role, len(locs)) for role, locs in closed),
+                         [('inner', len(inner)), ('outer', len(other)), ('outer', len(outer))])
+
+    def test_unclosed_chain(self):
+        ring = self._circle(101)
+        # Drop one way so the ring cannot be closed
+        ways = self._split_ring(ring, 10)[1:]
+        closed, unclosed = _assemble_rings([('outer', w) for w in ways])
+
+        self.assertEqual(closed, [])
+        self.assertEqual(len(unclosed), 1)
+
+    def test_recorded_multipolygons(self):
+        """
+        Test real multipolygon relations with several outer and inner rings assemble to the same polygons as before
+        rings were assembled through endpoint maps
+        """
+        import shapely.geometry as sg
+
+        with open(MULTIPOLYGON_RESPONSE_PATH) as f:
+            elements = json.load(f)['elements']
+        with open(MULTIPOLYGON_EXPECTED_PATH) as f:
+            expected = [sg.shape(feature['geometry']) for feature in json.load(f)['features']]
+        df = _parse_osm_polygons(elements)
+
+        self.assertEqual(len(df), len(expected))
+        for geom, expected_geom in zip(df.geometry, expected):
+            self.assertTrue(geom.equals_exact(expected_geom, 0))
+
+    def test_large_response(self):
+        """
+        Test parsing a large synthetic response of many multipolygons split into shuffled ways
+        """
+        elements = []
+        node_id = 0
+        way_id = 0
+        n_relations = 2000
+        for rel_idx in range(n_relations):
+            ring = self._circle(201, r=0.001, cx=rel_idx * 0.01)[:-1]
+            ids = list(range(node_id, node_id + len(ring)))
+            elements += [{'type': 'node', 'id': i, 'lon': x, 'lat': y} for i, (x, y) in zip(ids, ring)]
+            node_id += len(ring)
+            ids.append(ids[0])
+            members = []
+            for way_nodes in self._split_ring(ids, 20, seed=rel_idx):
+                elements.append({'type': 'way', 'id': way_id, 'nodes': way_nodes})
+                members.append({'type': 'way', 'ref': way_id, 'role': 'outer'})
+                way_id += 1
+            elements.append({'type': 'relation', 'id': rel_idx, 'members': members})
+
+        df = _parse_osm_polygons(elements)
+        self.assertEqual(len(df), n_relations)
+        self.assertTrue(all(df.geometry.is_valid))
+
+
+class OverpassMirrorRaceTestCase(unittest.TestCase):
+
+    def _response(self, status_code, data=None):
+        resp = mock.Mock(status_code=status_code)
+        resp.json.return_value = data
+        return resp
+
+    @mock.patch('requests.Session.post')
+    def test_failed_mirror_skipped(self, post):
+        responses = {'https://a': self._response(504), 'https://b': self._response(429),
+                     'https://c': self._response(200, {'elements': []})}
+        post.side_effect = lambda url, **kwargs: responses[url]
+
+        data = race_overpass_mirrors('query', urls=['https://a', 'https://b', 'https://c'])
+        self.assertEqual(data, {'elements': []})
+        for call in post.call_args_list:
+            self.assertIsNotNone(call.kwargs['timeout'])
+
+    @mock.patch('requests.Session.post')
+    def test_all_mirrors_fail(self, post):
+        post.return_value = self._response(500)
+        with self.assertRaises(ConnectionError):
+            race_overpass_mirrors('query', urls=['https://a', 'https://b', 'https://c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
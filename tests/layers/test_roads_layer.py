@@ -1,6 +1,13 @@
 import unittest
+from unittest import mock
 
-from seedpod_ground_risk.layers.roads_layer import RoadsLayer
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely.geometry as sg
+
+from seedpod_ground_risk.core.utils import make_bounds_polygon
+from seedpod_ground_risk.layers.roads_layer import RoadsLayer, interpolate_along_line
 from tests.layers.test_layer_base import BaseLayerTestCase
 
 
@@ -12,5 +19,109 @@ class UnbufferedRoadsLayerTestCase(BaseLayerTestCase):
         super().setUp()
 
 
+class TrafficInterpolationTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.layer = RoadsLayer('test')
+        # An A road of three 400m segments in the Ordnance Survey grid, with counters on the first and last
+        self.layer._roads_geometries = gpd.GeoDataFrame({
+            'RoadNumber': ['A1', 'A1', 'A1', 'M1'],
+            'count_point_id': [1, 2, 3, 4],
+            'geometry': [sg.LineString([(440000, 110000), (440400, 110000)]),
+                         sg.LineString([(440400, 110000), (440800, 110000)]),
+                         sg.LineString([(440800, 110000), (441200, 110000)]),
+                         sg.LineString([(440000, 111000), (440000, 111400)])]
+        }, crs='EPSG:27700')
+        self.layer._traffic_counts = pd.DataFrame({
+            'road_name': ['A1', 'A1', 'M1'],
+            'count_point_id': [1, 3, 4],
+            'population_per_hour': [100, 400, 1000]
+        })
+        self.layer.relative_variations_flat = pd.Series(np.linspace(0, 2, 168))
+        self.bounds = make_bounds_polygon((-1.5, -1.3), (50.8, 51))
+
+    def test_interpolated_counts(self):
+        roads_gdf = self.layer._interpolate_traffic_counts(self.bounds)
+        a_road = roads_gdf[roads_gdf['road_name'] == 'A1']
+
+        # Points every ~20m along the full length of the road
+        self.assertEqual(len(a_road), 60)
+        self.assertEqual(len(roads_gdf[roads_gdf['road_name'] == 'M1']), 20)
+        # Counts ramp from zero at the start of the road to the first counter at 400m, then on to the last at 1200m
+        centroids = a_road.geometry.centroid
+        expected = np.interp(centroids.x - 440000, [0, 400, 1200], [0, 100, 400])
+        np.testing.assert_allclose(a_road['population_per_hour'], expected, atol=1e-6)
+        np.testing.assert_allclose(centroids.y, 110000)
+        # Unclipped squares of the resolution
+        np.testing.assert_allclose(a_road.geometry.area, 20 ** 2)
+
+    def test_clipped_to_road_width(self):
+        roads_gdf = self.layer._interpolate_traffic_counts(self.bounds, resolution=40)
+        bounds = roads_gdf.geometry.bounds
+        widths = np.where(roads_gdf['road_name'] == 'A1', bounds['maxy'] - bounds['miny'],
+                          bounds['maxx'] - bounds['minx'])
+
+        np.testing.assert_allclose(widths[roads_gdf['road_name'] == 'A1'], 2 * 14.6)
+        np.testing.assert_allclose(widths[roads_gdf['road_name'] == 'M1'], 40)
+
+    def test_no_roads(self):
+        roads_gdf = self.layer._interpolate_traffic_counts(make_bounds_polygon((-3.5, -3.4), (52.8, 52.9)))
+        self.assertTrue(roads_gdf.empty)
+
+    def test_hour_sweep_interpolated_once(self):
+        interpolate = self.layer._interpolate_traffic_counts
+        with mock.patch.object(self.layer, '_interpolate_traffic_counts', side_effect=interpolate) as interp_mock:
+            hourly_roads = [self.layer._get_hourly_roads(self.bounds, hour) for hour in range(168)]
+            self.assertEqual(interp_mock.call_count, 1)
+
+            weekly_roads = interpolate(self.bounds)
+            for hour in [0, 50, 167]:
+                np.testing.assert_allclose(hourly_roads[hour]['population_per_hour'],
+                                           weekly_roads['population_per_hour'] * self.layer.relative_variations_flat[hour])
+            self.assertEqual(hourly_roads[0].crs.to_epsg(), 4326)
+            # Densities are of the area in the Ordnance Survey grid
+            np.testing.assert_allclose(hourly_roads[100]['density'],
+                                       hourly_roads[100]['population'] / (weekly_roads.geometry.area * 1e-6))
+            # Zero population hours have zero log density
+            self.assertTrue((hourly_roads[0]['ln_density'] == 0).all())
+
+            self.layer.clear_cache()
+            self.layer._get_hourly_roads(self.bounds, 0)
+            self.assertEqual(interp_mock.call_count, 2)
+
+    def test_hour_sweep_rasterised_once(self):
+        import geoviews as gv
+        import datashader as ds
+        from holoviews.operation.datashader import rasterize
+
+        raster_shape = (80, 60)
+        weekly_raster = self.layer._get_weekly_raster(self.bounds, raster_shape)
+        with mock.patch('holoviews.operation.datashader.rasterize') as rasterize_mock:
+            rasters = {hour: self.layer.generate(self.bounds, raster_shape, hour=hour)[1] for hour in [0, 50, 167]}
+            rasterize_mock.assert_not_called()
+
+        for hour, raster in rasters.items():
+            roads_gdf = self.layer._get_hourly_roads(self.bounds, hour)
+            polys = gv.Polygons(roads_gdf, kdims=['Longitude', 'Latitude'], vdims=['density'])
+            expected = rasterize(polys, aggregator=ds.mean('density'), width=raster_shape[0],
+                                 height=raster_shape[1], x_range=(-1.5, -1.3), y_range=(50.8, 51), dynamic=False)
+            np.testing.assert_allclose(raster, list(expected.data.data_vars.items())[0][1].data)
+        # Rasters are not shared with the cache
+        self.assertIsNot(rasters[50], weekly_raster)
+        self.assertGreater(np.nanmax(weekly_raster), 0)
+
+    def test_interpolate_along_line(self):
+        line = sg.LineString([(0, 0), (10, 0), (10, 5), (0, 5)])
+        multi_line = sg.MultiLineString([[(0, 0), (10, 0)], [(20, 0), (20, 10)]])
+        distances = np.linspace(0, 25, 37)
+
+        for geom in [line, multi_line]:
+            xs, ys = interpolate_along_line(geom, distances)
+            expected = [geom.interpolate(d) for d in distances]
+            np.testing.assert_allclose(xs, [p.x for p in expected])
+            np.testing.assert_allclose(ys, [p.y for p in expected])
+
+
 if __name__ == '__main__':
     unittest.main()
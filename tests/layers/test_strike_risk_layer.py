@@ -0,0 +1,103 @@
+import unittest
+
+import numpy as np
+import scipy.stats as ss
+
+from seedpod_ground_risk.layers.strike_risk_layer import wrap_all_pipeline, wrap_pipeline_fft, convolve_strike_pdf
+from seedpod_ground_risk.path_analysis.utils import make_impact_kernel
+
+
+class StrikeRiskConvolutionTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        np.random.seed(1)
+
+    def _make_inputs(self, shape):
+        premult = np.random.random(shape) * 1e-4
+        x, y = np.mgrid[0:shape[0], 0:shape[1]]
+        eval_grid = np.vstack((x.ravel(), y.ravel())).T
+        offset_y, offset_x = shape[0] // 2, shape[1] // 2
+        pdf = ss.multivariate_normal(np.array([offset_y + 2.5, offset_x - 1.5]),
+                                     np.array([[4, 1], [1, 3]])).pdf(eval_grid).reshape(shape)
+        return premult, pdf, (offset_y, offset_x)
+
+    def _numba_reference(self, premult, pdf, centre):
+        shape = premult.shape
+        padded_pdf = np.zeros(((shape[0] * 3) + 1, (shape[1] * 3) + 1))
+        padded_pdf[shape[0]:shape[0] * 2, shape[1]:shape[1] * 2] = pdf
+        return wrap_all_pipeline(shape, padded_pdf, shape[0] + centre[0], shape[1] + centre[1], premult)
+
+    def test_fft_parity_square(self):
+        premult, pdf, centre = self._make_inputs((30, 30))
+
+        expected = self._numba_reference(premult, pdf, centre)
+        out = wrap_pipeline_fft(pdf, centre, premult)
+
+        self.assertEqual(out.shape, expected.shape)
+        np.testing.assert_allclose(out, expected, rtol=1e-6, atol=1e-12)
+
+    def test_fft_parity_non_square(self):
+        premult, pdf, centre = self._make_inputs((23, 41))
+
+        expected = self._numba_reference(premult, pdf, centre)
+        out = wrap_pipeline_fft(pdf, centre, premult)
+
+        self.assertEqual(out.shape, expected.shape)
+        np.testing.assert_allclose(out, expected, rtol=1e-6, atol=1e-12)
+
+    def test_fft_non_negative(self):
+        premult, pdf, centre = self._make_inputs((40, 25))
+        premult[premult < 0.5e-4] = 0
+
+        out = wrap_pipeline_fft(pdf, centre, premult)
+
+        self.assertGreaterEqual(out.min(), 0)
+
+    def test_compact_kernel_parity(self):
+        premult, pdf, centre = self._make_inputs((120, 90))
+        expected = self._numba_reference(premult, pdf, centre)
+
+        kernel, kernel_centre = make_impact_kernel([(np.array([2.5, -1.5]), np.array([[4, 1], [1, 3]]))],
+                                                   sigma_cutoff=6)
+        self.assertLess(kernel.size, pdf.size / 10)
+
+        for backend in ['fft', 'numba']:
+            out = convolve_strike_pdf(kernel, kernel_centre, premult, backend=backend)
+            self.assertEqual(out.shape, expected.shape)
+            np.testing.assert_allclose(out, expected, rtol=1e-5, atol=1e-12)
+
+
+class ImpactKernelTestCase(unittest.TestCase):
+
+    def test_kernel_window(self):
+        mean = np.array([10, -4])
+        cov = np.array([[4, 0], [0, 1]])
+        kernel, (cy, cx) = make_impact_kernel([(mean, cov)], sigma_cutoff=3)
+
+        # Bounds are mean +- 3 sigma, extended to include the event location at the origin
+        self.assertEqual(kernel.shape, (17, 8))
+        self.assertEqual((cy, cx), (0, 7))
+        peak_y, peak_x = np.unravel_index(kernel.argmax(), kernel.shape)
+        self.assertEqual((peak_y - cy, peak_x - cx), (10, -4))
+
+    def test_kernel_mass(self):
+        dists = [(np.array([3, 5]), np.array([[6, 2], [2, 5]])),
+                 (np.array([-20, 8]), np.array([[9, -1], [-1, 7]]))]
+        kernel, _ = make_impact_kernel(dists, sigma_cutoff=5)
+
+        self.assertAlmostEqual(kernel.sum(), len(dists), delta=1e-3)
+
+    def test_kernel_mass_normalised(self):
+        # Narrower than a cell, so the pdf evaluated at cell centres does not sum to the probability mass
+        dists = [(np.array([0.4, -0.3]), np.array([[0.1, 0], [0, 0.1]])),
+                 (np.array([-20, 8]), np.array([[9, -1], [-1, 7]]))]
+        kernel, _ = make_impact_kernel(dists, sigma_cutoff=5)
+        self.assertGreater(abs(kernel.sum() - len(dists)), 0.1)
+
+        kernel, _ = make_impact_kernel(dists, sigma_cutoff=5, normalise=True)
+        self.assertAlmostEqual(kernel.sum(), len(dists))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,14 @@
 import unittest
+from unittest import mock
 
-from seedpod_ground_risk.layers.temporal_population_estimate_layer import TemporalPopulationEstimateLayer
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely.geometry as sg
+
+from seedpod_ground_risk.core.utils import make_bounds_polygon
+from seedpod_ground_risk.layers.temporal_population_estimate_layer import TemporalPopulationEstimateLayer, \
+    nhaps_group_tags
 from tests.layers.test_layer_base import BaseLayerTestCase
 
 
@@ -21,5 +29,56 @@ class BufferedTemporalPopulationEstimateLayerTestCase(BaseLayerTestCase):
         super().setUp()
 
 
+class HourlyPopulationTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.layer = TemporalPopulationEstimateLayer('test')
+        # A single dense census ward covering a residential area, with one polygon of each other landuse
+        self.layer._census_wards = gpd.GeoDataFrame({'density': [20000.0]},
+                                                    geometry=[sg.box(-1.5, 50.87, -1.4, 50.95)], crs='EPSG:4326')
+        self.layer.nhaps_df = pd.DataFrame(np.random.default_rng(0).random((10, 24)))
+        self.tag_dfs = {'landuse=residential': gpd.GeoDataFrame(geometry=[sg.box(-1.48, 50.88, -1.42, 50.94)],
+                                                                crs='EPSG:4326')}
+        for i, tags in enumerate(nhaps_group_tags[1:]):
+            for j, tag in enumerate(tags):
+                x = -1.4 + 0.02 * i
+                y = 50.88 + 0.01 * j
+                # Overlap the groups, so the maximum density must be taken where they meet
+                self.tag_dfs[tag] = gpd.GeoDataFrame(geometry=[sg.box(x, y, x + 0.03, y + 0.015)], crs='EPSG:4326')
+        self.bounds = make_bounds_polygon((-1.5, -1.3), (50.87, 51))
+        self.raster_shape = (80, 60)
+
+    def test_hour_sweep_overlaid_once(self):
+        import geoviews as gv
+        import datashader as ds
+        from holoviews.operation.datashader import rasterize
+
+        with mock.patch('seedpod_ground_risk.layers.temporal_population_estimate_layer.query_osm_polygons_batch',
+                        return_value=self.tag_dfs) as query_mock, \
+                mock.patch('geopandas.overlay', side_effect=gpd.overlay) as overlay_mock:
+            for hour in [0, 8, 13, 31]:
+                _, raster, df = self.layer.generate(self.bounds, self.raster_shape, hour=hour)
+
+                # The raster of the hour is the maximum density of the polygons returned
+                polys = gv.Polygons(df[['geometry', 'density']], kdims=['Longitude', 'Latitude'], vdims=['density'])
+                expected = rasterize(polys, aggregator=ds.max('density'), width=self.raster_shape[0],
+                                     height=self.raster_shape[1], x_range=(-1.5, -1.3), y_range=(50.87, 51),
+                                     dynamic=False)
+                np.testing.assert_allclose(raster, list(expected.data.data_vars.items())[0][1].data)
+                np.testing.assert_allclose(df['ln_density'], np.log(df['density']))
+            self.assertEqual(query_mock.call_count, 1)
+            self.assertEqual(overlay_mock.call_count, 1)
+
+            # Rasters are not shared with the cache
+            raster[:] = 0
+            _, raster, _ = self.layer.generate(self.bounds, self.raster_shape, hour=31)
+            self.assertGreater(np.nanmax(raster), 0)
+
+            self.layer.clear_cache()
+            self.layer.generate(self.bounds, self.raster_shape, hour=8)
+            self.assertEqual(overlay_mock.call_count, 2)
+
+
 if __name__ == '__main__':
     unittest.main()
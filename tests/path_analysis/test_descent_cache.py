@@ -0,0 +1,86 @@
+import tempfile
+import unittest
+
+import casex
+import numpy as np
+
+from seedpod_ground_risk.path_analysis.descent_models.descent_cache import DescentCache, aircraft_key, \
+    make_impact_dists
+
+
+class DescentCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.calls = 0
+
+    def _compute(self):
+        self.calls += 1
+        return (np.array([1.0, 2.0]), np.eye(2)), 10.0, 0.5
+
+    def test_memoises(self):
+        cache = DescentCache()
+        first = cache.get(('a', 1), self._compute)
+        second = cache.get(('a', 1), self._compute)
+
+        self.assertEqual(self.calls, 1)
+        self.assertIs(first, second)
+
+    def test_lru_eviction(self):
+        cache = DescentCache(max_size=2)
+        cache.get('a', self._compute)
+        cache.get('b', self._compute)
+        # Touch 'a' so 'b' is the least recently used
+        cache.get('a', self._compute)
+        cache.get('c', self._compute)
+        self.assertEqual(self.calls, 3)
+
+        cache.get('a', self._compute)
+        self.assertEqual(self.calls, 3)
+        cache.get('b', self._compute)
+        self.assertEqual(self.calls, 4)
+
+    def test_disk_persistence(self):
+        cache_dir = tempfile.mkdtemp()
+        DescentCache(cache_dir=cache_dir).get('a', self._compute)
+
+        # A new cache, as if the application was restarted
+        (mean, cov), v_i, a_i = DescentCache(cache_dir=cache_dir).get('a', self._compute)
+        self.assertEqual(self.calls, 1)
+        np.testing.assert_array_equal(mean, np.array([1.0, 2.0]))
+        self.assertEqual(v_i, 10.0)
+
+
+class ImpactDistsCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.ac = casex.AircraftSpecs(casex.enums.AircraftType.FIXED_WING, 2, 1.8, 7)
+        self.ac.set_ballistic_frontal_area(2)
+        self.ac.set_glide_speed_ratio(15, 12)
+        self.ac.set_glide_drag_coefficient(0.3)
+        self.ac.set_ballistic_drag_coefficient(1.1)
+
+    def test_aircraft_key(self):
+        other_ac = casex.AircraftSpecs(casex.enums.AircraftType.FIXED_WING, 2, 1.8, 7)
+        other_ac.set_ballistic_frontal_area(2)
+        other_ac.set_glide_speed_ratio(15, 12)
+        other_ac.set_glide_drag_coefficient(0.3)
+        other_ac.set_ballistic_drag_coefficient(1.1)
+        self.assertEqual(aircraft_key(self.ac), aircraft_key(other_ac))
+
+        other_ac.set_ballistic_drag_coefficient(0.9)
+        self.assertNotEqual(aircraft_key(self.ac), aircraft_key(other_ac))
+
+    def test_impact_dists_cached(self):
+        cache = DescentCache()
+        first = make_impact_dists(self.ac, 50, 18, 5, 0.5, cache=cache)
+        second = make_impact_dists(self.ac, 50, 18, 5, 0.5, cache=cache)
+        self.assertIs(first, second)
+
+        different = make_impact_dists(self.ac, 60, 18, 5, 0.5, cache=cache)
+        self.assertIsNot(first, different)
+
+
+if __name__ == '__main__':
+    unittest.main()
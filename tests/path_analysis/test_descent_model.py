@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+import scipy.stats as ss
+
+from seedpod_ground_risk.path_analysis.descent_models.descent_model import paef_to_ned_with_wind, fit_dist_moments
+from seedpod_ground_risk.path_analysis.utils import rotate_2d, bearing_to_angle
+
+
+class DescentModelTransformTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        samples = 1000
+        self.d_i = ss.norm(30, 3).rvs(samples)
+        self.t_i = ss.norm(6, 0.5).rvs(samples)
+        self.theta = bearing_to_angle(ss.uniform(0, 2 * np.pi).rvs(samples))
+        self.wind_vel_x = ss.norm(3, 1).rvs(samples)
+        self.wind_vel_y = ss.norm(-2, 1).rvs(samples)
+
+    def test_matches_per_sample_rotation(self):
+        """
+        Test the vectorised transform against rotating each sample individually
+        """
+        out = paef_to_ned_with_wind(self.d_i, self.t_i, self.theta, self.wind_vel_x, self.wind_vel_y)
+
+        expected = np.array([
+            rotate_2d(np.array([0, d]), theta) + np.array([wx, wy]) * t
+            for d, t, theta, wx, wy in zip(self.d_i, self.t_i, self.theta, self.wind_vel_x, self.wind_vel_y)
+        ]).T
+        np.testing.assert_array_almost_equal(out, expected, 10)
+
+    def test_scalar_broadcast(self):
+        out = paef_to_ned_with_wind(self.d_i, self.t_i, 0, 0, 0)
+
+        self.assertEqual(out.shape, (2, len(self.d_i)))
+        np.testing.assert_array_almost_equal(out[0], self.d_i, 10)
+        np.testing.assert_array_almost_equal(out[1], 0, 10)
+
+    def test_moments_match_gaussian_mixture(self):
+        from sklearn.mixture import GaussianMixture
+
+        samples = paef_to_ned_with_wind(self.d_i, self.t_i, self.theta, self.wind_vel_x, self.wind_vel_y)
+        means, covariances = fit_dist_moments(samples)
+
+        gm = GaussianMixture()
+        gm.fit(samples.T)
+        np.testing.assert_array_almost_equal(means, gm.means_[0], 6)
+        np.testing.assert_array_almost_equal(covariances, gm.covariances_[0], 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
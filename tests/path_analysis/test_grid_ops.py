@@ -3,6 +3,7 @@ import unittest
 import numpy as np
 
 from seedpod_ground_risk.layers.path_analysis_layer import snap_coords_to_grid
+from seedpod_ground_risk.path_analysis.utils import stamp_kernel
 
 
 class GridSnappingTestCase(unittest.TestCase):
@@ -44,5 +45,42 @@ class GridSnappingTestCase(unittest.TestCase):
         self.assertEqual(lat_idx, 0)
 
 
+class KernelStampingTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.kernel = np.arange(1, 16, dtype=float).reshape(3, 5)
+        self.kernel_centre = (1, 2)
+
+    def test_interior(self):
+        acc = np.zeros((10, 10))
+        window = stamp_kernel(acc, self.kernel, self.kernel_centre, (4, 6))
+
+        np.testing.assert_array_equal(window, self.kernel)
+        np.testing.assert_array_equal(acc[3:6, 4:9], self.kernel)
+        self.assertEqual(acc.sum(), self.kernel.sum())
+
+    def test_clipped_at_edges(self):
+        acc = np.zeros((10, 10))
+        stamp_kernel(acc, self.kernel, self.kernel_centre, (0, 9))
+
+        np.testing.assert_array_equal(acc[0:2, 7:10], self.kernel[1:3, 0:3])
+        self.assertEqual(acc.sum(), self.kernel[1:3, 0:3].sum())
+
+    def test_outside(self):
+        acc = np.zeros((10, 10))
+        window = stamp_kernel(acc, self.kernel, self.kernel_centre, (20, 20))
+
+        self.assertEqual(window.size, 0)
+        self.assertEqual(acc.sum(), 0)
+
+    def test_weighted_accumulation(self):
+        acc = np.zeros((10, 10))
+        weights = np.full((10, 10), 2.0)
+        stamp_kernel(acc, self.kernel, self.kernel_centre, (4, 6), weights=weights)
+        stamp_kernel(acc, self.kernel, self.kernel_centre, (4, 6), weights=weights)
+
+        np.testing.assert_array_equal(acc[3:6, 4:9], 4 * self.kernel)
+
+
 if __name__ == '__main__':
     unittest.main()
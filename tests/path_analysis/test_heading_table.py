@@ -0,0 +1,58 @@
+import unittest
+
+import numpy as np
+import scipy.stats as ss
+from casex import *
+
+from seedpod_ground_risk.path_analysis.descent_models.glide_model import GlideDescentModel
+from seedpod_ground_risk.path_analysis.descent_models.heading_table import HeadingDistributionTable
+
+
+class HeadingDistributionTableTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.ac = AircraftSpecs(enums.AircraftType.FIXED_WING, 2, 1.8, 7)
+        self.ac.set_glide_speed_ratio(15, 12)
+        self.gm = GlideDescentModel(self.ac)
+
+        samples = 1000
+        self.alt = ss.norm(50, 5).rvs(samples)
+        self.vel = ss.norm(18, 2.5).rvs(samples)
+        self.wind_vel_y = ss.norm(2, 1).rvs(samples)
+        self.wind_vel_x = ss.norm(-3, 1).rvs(samples)
+
+    def test_matches_transform_at_bins(self):
+        """
+        Test table entries against a full transform when there is no heading uncertainty
+        """
+        table = HeadingDistributionTable(self.gm, self.alt, self.vel, self.wind_vel_y, self.wind_vel_x,
+                                         heading_std=0)
+
+        for hdg in np.deg2rad([0, 45, 137, 270, 359]):
+            (mean, cov), v_i, a_i = self.gm.transform(self.alt, self.vel, hdg, self.wind_vel_y, self.wind_vel_x, 0, 0)
+            table_mean, table_cov = table(hdg)
+            np.testing.assert_array_almost_equal(table_mean, mean, 8)
+            np.testing.assert_array_almost_equal(table_cov, cov, 8)
+            self.assertAlmostEqual(table.v_i, v_i)
+            self.assertAlmostEqual(table.a_i, a_i)
+
+    def test_interpolation(self):
+        table = HeadingDistributionTable(self.gm, self.alt, self.vel, self.wind_vel_y, self.wind_vel_x,
+                                         heading_std=0, bin_width=np.deg2rad(10))
+
+        mean_lower, _ = table(np.deg2rad(20))
+        mean_upper, _ = table(np.deg2rad(30))
+        mean_mid, _ = table(np.deg2rad(25))
+        np.testing.assert_array_almost_equal(mean_mid, (mean_lower + mean_upper) / 2, 8)
+
+    def test_wraparound(self):
+        table = HeadingDistributionTable(self.gm, self.alt, self.vel, self.wind_vel_y, self.wind_vel_x)
+
+        np.testing.assert_array_almost_equal(table(0)[0], table(2 * np.pi)[0], 8)
+        # Just short of a full circle should be very close to North
+        np.testing.assert_allclose(table(np.deg2rad(359.99))[0], table(0)[0], rtol=1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
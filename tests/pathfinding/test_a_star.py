@@ -1,6 +1,8 @@
 import unittest
+import warnings
 
 from seedpod_ground_risk.pathfinding.a_star import *
+from seedpod_ground_risk.pathfinding.array_a_star import ArrayRiskGridAStar
 from seedpod_ground_risk.pathfinding.heuristic import *
 from seedpod_ground_risk.pathfinding.rjps_a_star import *
 from tests.pathfinding.test_data import SMALL_TEST_GRID, LARGE_TEST_GRID, SMALL_DEADEND_TEST_GRID
@@ -148,5 +150,86 @@ class RiskGridAStarTestCase(BaseAStarTestCase):
         self.assertTrue(all(equal_paths), 'Paths are not generated repeatably')
 
 
+class ArrayRiskGridAStarTestCase(BaseAStarTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.algo = ArrayRiskGridAStar()
+
+    def test_direct_with_diagonals(self):
+        """
+        Test simplest case of direct path on small grid with diagonals ignoring node values
+        """
+        path = self.algo.find_path(self.small_diag_environment, self.start, self.end, smooth=False)
+
+        self.assertEqual(path[0], self.start, "Start node not included in path")
+        self.assertEqual(path[-1], self.end, 'Goal node not included in path')
+        for n0, n1 in zip(path[:-1], path[1:]):
+            self.assertLessEqual(abs(n0.position[0] - n1.position[0]), 1, 'Path is not contiguous')
+            self.assertLessEqual(abs(n0.position[1] - n1.position[1]), 1, 'Path is not contiguous')
+
+    def test_matches_dijkstra_cost(self):
+        """
+        Test the path found with no heuristic weighting has the minimum cost
+        """
+        import numpy as np
+        from scipy.sparse import lil_matrix
+        from scipy.sparse.csgraph import dijkstra
+
+        grid = np.random.default_rng(1).random((60, 60)) * 10
+        grid[20:40, 10:50] = -1
+        env = GridEnvironment(grid, diagonals=True)
+        path = self.algo.find_path(env, Node((5, 5)), Node((55, 50)), k=0, smooth=False)
+        # The goal is repeated at the end of reconstructed paths
+        path_cost = sum(grid[n.position] for n in path[1:-1])
+
+        height, width = grid.shape
+        adj = lil_matrix((height * width, height * width))
+        for (y, x), val in np.ndenumerate(grid):
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    ny, nx = y + dy, x + dx
+                    if (dy or dx) and 0 <= ny < height and 0 <= nx < width and grid[ny, nx] >= 0:
+                        # Avoid explicit zeros, which are dropped as missing edges
+                        adj[y * width + x, ny * width + nx] = grid[ny, nx] + 1e-12
+        dists = dijkstra(adj.tocsr(), indices=5 * width + 5)
+        self.assertAlmostEqual(path_cost, dists[55 * width + 50], places=6)
+
+        # Searching the precomputed graph gives the same path
+        graph_env = GridEnvironment(grid, diagonals=True, precompute_graph=True)
+        graph_path = self.algo.find_path(graph_env, Node((5, 5)), Node((55, 50)), k=0, smooth=False)
+        self.assertEqual(graph_path, path)
+
+    def test_heuristic_weighting(self):
+        """
+        Test the grid distance heuristic is weighted by k alone, the ratio of risk heuristics is ignored with a warning
+        and other heuristics are rejected
+        """
+        import numpy as np
+
+        grid = np.random.default_rng(2).random((40, 40)) * 10
+        env = GridEnvironment(grid, diagonals=True)
+        start, end = Node((2, 3)), Node((35, 30))
+
+        default_path = self.algo.find_path(env, start, end, smooth=False)
+        self.assertEqual(default_path, self.algo.find_path(env, start, end, k=1, smooth=False))
+        self.assertNotEqual(self.algo.find_path(env, start, end, k=50, smooth=False), default_path)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            unweighted = ArrayRiskGridAStar(heuristic=ManhattanRiskHeuristic(env, risk_to_dist_ratio=0))
+        self.assertEqual(unweighted.find_path(env, start, end, smooth=False), default_path)
+        with self.assertWarns(UserWarning):
+            weighted = ArrayRiskGridAStar(heuristic=ManhattanRiskHeuristic(env, risk_to_dist_ratio=50))
+        self.assertEqual(weighted.find_path(env, start, end, smooth=False), default_path)
+
+        with self.assertRaises(ValueError):
+            ArrayRiskGridAStar(heuristic=EuclideanRiskHeuristic(env))
+
+    def test_large_env_with_diagonals(self):
+        path = self.algo.find_path(self.large_diag_environment, Node((10, 10)), Node((490, 490)), smooth=False)
+        self.assertIsNotNone(path, 'Failed to find possible path')
+
+
 if __name__ == '__main__':
     unittest.main()
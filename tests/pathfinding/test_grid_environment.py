@@ -1,6 +1,8 @@
 import unittest
 
-from seedpod_ground_risk.pathfinding.environment import GridEnvironment
+import numpy as np
+
+from seedpod_ground_risk.pathfinding.environment import GridEnvironment, Node
 from tests.pathfinding.test_data import SMALL_TEST_GRID, LARGE_TEST_GRID
 
 
@@ -31,5 +33,56 @@ class GridEnvironmentWithDiagonalsTestCase(unittest.TestCase):
         pass
 
 
+class GridEnvironmentCSRGraphTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.grid = np.array([
+            [1, 2, 3],
+            [4, -1, 6],
+            [7, 8, np.inf]
+        ], dtype=float)
+
+    def _neighbours(self, graph, idx):
+        indptr, indices, costs = graph
+        return dict(zip(indices[indptr[idx]:indptr[idx + 1]].tolist(), costs[indptr[idx]:indptr[idx + 1]].tolist()))
+
+    def test_no_diagonals(self):
+        graph = GridEnvironment(self.grid, diagonals=False).get_csr_graph()
+
+        self.assertEqual(graph[0].dtype, np.int32)
+        self.assertEqual(graph[1].dtype, np.int32)
+        self.assertEqual(self._neighbours(graph, 0), {1: 2, 3: 4})
+        self.assertEqual(self._neighbours(graph, 7), {6: 7})
+
+    def test_with_diagonals(self):
+        graph = GridEnvironment(self.grid, diagonals=True).get_csr_graph()
+
+        self.assertEqual(self._neighbours(graph, 1), {0: 1, 2: 3, 3: 4, 5: 6})
+        self.assertEqual(self._neighbours(graph, 7), {3: 4, 5: 6, 6: 7})
+
+    def test_blocked_cells_pruned(self):
+        graph = GridEnvironment(self.grid, diagonals=True).get_csr_graph()
+        indptr, indices, _ = graph
+
+        # Neither the -1 or inf cells have edges in or out
+        self.assertEqual(self._neighbours(graph, 4), {})
+        self.assertEqual(self._neighbours(graph, 8), {})
+        self.assertNotIn(4, indices)
+        self.assertNotIn(8, indices)
+
+    def test_rebuilt_on_grid_change(self):
+        env = GridEnvironment(self.grid, diagonals=False, precompute_graph=True)
+        graph = env.get_csr_graph()
+        self.assertIs(env.get_csr_graph(), graph)
+
+        env.grid = np.ones((3, 3))
+        self.assertEqual(self._neighbours(env.get_csr_graph(), 4), {1: 1, 3: 1, 5: 1, 7: 1})
+
+    def test_get_neighbours(self):
+        env = GridEnvironment(self.grid, diagonals=True, precompute_graph=True)
+        self.assertEqual(env.get_neighbours(Node((2, 1))), {Node((1, 0)), Node((1, 2)), Node((2, 0))})
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,9 @@
 import unittest
 
 from seedpod_ground_risk.pathfinding.environment import GridEnvironment
-from seedpod_ground_risk.pathfinding.heuristic import EuclideanHeuristic, ManhattanHeuristic, EuclideanRiskHeuristic
+from seedpod_ground_risk.pathfinding import bresenham
+from seedpod_ground_risk.pathfinding.heuristic import EuclideanHeuristic, ManhattanHeuristic, EuclideanRiskHeuristic, \
+    LineReductionField, LineReductionFieldCache
 from tests.pathfinding.test_data import SMALL_TEST_GRID
 
 
@@ -95,5 +97,54 @@ class EuclideanRiskHeuristicTestCase(unittest.TestCase):
         self.assertEqual(cost, 1 * np.log10(5) + 2 ** 0.5, 'Wrong cost')
 
 
+class LineReductionFieldTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        import numpy as np
+        self.grid = np.random.default_rng(0).random((12, 9))
+        self.goal = (7, 2)
+
+    def test_matches_line(self):
+        """
+        Test lazily evaluated values against a direct line reduction
+        """
+        sum_field = LineReductionField(self.grid, self.goal, 'sum')
+        min_field = LineReductionField(self.grid, self.goal, 'min')
+        for y in range(self.grid.shape[0]):
+            for x in range(self.grid.shape[1]):
+                line = bresenham.make_line(x, y, self.goal[1], self.goal[0])
+                line_vals = self.grid[line[:, 0], line[:, 1]]
+                self.assertAlmostEqual(sum_field[y, x], line_vals.sum())
+                self.assertEqual(min_field[y, x], line_vals.min())
+
+    def test_evaluate_all(self):
+        import numpy as np
+        lazy_field = LineReductionField(self.grid, self.goal, 'sum')
+        full = LineReductionField(self.grid, self.goal, 'sum').evaluate_all()
+        self.assertEqual(full.shape, self.grid.shape)
+        np.testing.assert_array_almost_equal(full, [[lazy_field[y, x] for x in range(self.grid.shape[1])]
+                                                    for y in range(self.grid.shape[0])])
+
+    def test_cache(self):
+        import numpy as np
+        cache = LineReductionFieldCache('sum', max_size=2)
+        field = cache.get(self.grid, self.goal)
+        self.assertIs(cache.get(self.grid, self.goal), field)
+        self.assertIsNot(cache.get(self.grid, (0, 0)), field)
+
+        # A different grid invalidates all fields
+        self.assertIsNot(cache.get(np.copy(self.grid), self.goal), field)
+
+    def test_risk_heuristic_uses_field(self):
+        heuristic = EuclideanRiskHeuristic(GridEnvironment(self.grid * 10), risk_to_dist_ratio=1)
+        line = bresenham.make_line(8, 0, self.goal[1], self.goal[0])
+        integral = (self.grid * 10)[line[:, 0], line[:, 1]].sum()
+        dist = ((8 - self.goal[1]) ** 2 + (0 - self.goal[0]) ** 2) ** 0.5
+
+        import numpy as np
+        self.assertAlmostEqual(heuristic.h((0, 8), self.goal), np.log10(integral) + dist)
+
+
 if __name__ == '__main__':
     unittest.main()